@@ -0,0 +1,84 @@
+import argparse
+import os
+import subprocess
+import sys
+
+# run in a fresh interpreter so nothing is imported already. The baseline is
+# the modules a bare interpreter has loaded before the import. With a source
+# directory, the package is loaded from it (like an installed zparse), so a
+# checkout can be checked without installing it.
+probe = '''
+import sys, time
+source = sys.argv[1]
+if source:
+    import importlib.util, os
+    spec = importlib.util.spec_from_file_location(
+        'zparse',
+        os.path.join(source, '__init__.py'),
+        submodule_search_locations=[source],
+    )
+    module = importlib.util.module_from_spec(spec)
+before = set(sys.modules)
+start = time.perf_counter()
+if source:
+    sys.modules['zparse'] = module
+    spec.loader.exec_module(module)
+else:
+    import zparse
+elapsed = time.perf_counter() - start
+print(elapsed, len(set(sys.modules) - before))
+'''
+
+def measure(source: str) -> tuple[float, int]:
+    out = subprocess.run(
+        [sys.executable, '-c', probe, source],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.split()
+    return float(out[0]), int(out[1])
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description='check that importing zparse stays within a budget',
+    )
+    arg_parser.add_argument(
+        '--max-time',
+        type=float,
+        default=0.05,
+        help='time budget in seconds (default: 0.05)',
+    )
+    arg_parser.add_argument(
+        '--max-modules',
+        type=int,
+        default=60,
+        help='budget for newly imported modules (default: 60)',
+    )
+    arg_parser.add_argument(
+        '--source',
+        default='',
+        help='load zparse from this directory instead of importing it',
+    )
+    arg_parser.add_argument(
+        '--runs',
+        type=int,
+        default=5,
+        help='number of fresh interpreters to time (default: 5)',
+    )
+    args = arg_parser.parse_args()
+    # the fastest run is the one least disturbed by the rest of the system
+    results = [
+        measure(os.path.abspath(args.source) if args.source else '')
+        for _ in range(args.runs)
+    ]
+    elapsed = min(result[0] for result in results)
+    modules = max(result[1] for result in results)
+    print(f'{"":>8} {"measured":>10} {"budget":>10}')
+    print(f'{"time (s)":>8} {elapsed:>10.4f} {args.max_time:>10.4f}')
+    print(f'{"modules":>8} {modules:>10} {args.max_modules:>10}')
+    if elapsed > args.max_time or modules > args.max_modules:
+        print('import zparse is over budget')
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import zparse
+from zparse.parsers import BaseParser
+from tokenize_json import grammar, make_document
+
+# the examples/json grammar with actions that build the Python values
+rules = r'''
+json: value=value { value }
+
+value
+  : s=STRING { self.string(s.text) }
+  | n=NUMBER { self.number(n.text) }
+  | o=object { o }
+  | a=array { a }
+  | 'true' { True }
+  | 'false' { False }
+  | 'null' { None }
+
+object: '{' pairs=pairs? '}' { dict(pairs or ()) }
+pairs: pair (',' pair)* { children[::2] }
+pair: key=STRING ':' value=value { (self.string(key.text), value) }
+
+array: '[' values=values? ']' { values or [] }
+values: value (',' value)* { children[::2] }
+'''
+
+action_grammar = rules + grammar[grammar.index('STRING:'):]
+
+def to_number(text):
+    return int(text) if text.lstrip('-').isdigit() else float(text)
+
+class ValueParser(BaseParser):
+    def string(self, text):
+        return json.loads(text)
+    def number(self, text):
+        return to_number(text)
+
+def to_value(node):
+    # the separate pass over a Node tree that actions replace
+    if isinstance(node, zparse.parsers.Node):
+        kind = node.kind
+        children = node.children
+        if kind in ('json', 'value'):
+            return to_value(children[0])
+        if kind == 'object':
+            return dict(to_value(children[1])) if len(children) == 3 else {}
+        if kind == 'array':
+            return to_value(children[1]) if len(children) == 3 else []
+        if kind in ('pairs', 'values'):
+            return [to_value(child) for child in children[::2]]
+        if kind == 'pair':
+            return json.loads(children[0].text), to_value(children[2])
+    kind = node.kind.name
+    if kind == 'STRING':
+        return json.loads(node.text)
+    if kind == 'NUMBER':
+        return to_number(node.text)
+    return {'true': True, 'false': False, 'null': None}[node.text]
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description='build Python values from examples/json inputs',
+    )
+    arg_parser.add_argument(
+        '--size',
+        type=int,
+        default=10**6,
+        help='input size in bytes (default: 1 MB)',
+    )
+    args = arg_parser.parse_args()
+    TreeParser = zparse.make_parser(grammar, allow_big_implicits=True)
+    ActionParser = zparse.make_parser(
+        action_grammar,
+        base=ValueParser,
+        allow_big_implicits=True,
+    )
+    code = make_document(args.size)
+    expected = json.loads(code)
+    # tokenizing is the same for both, so only parsing is timed
+    print(f'{"method":>14} {"seconds":>10}')
+    for label, ParserClass, build in [
+        ('tree + walk', TreeParser, to_value),
+        ('actions', ActionParser, lambda value: value),
+    ]:
+        buffer = ParserClass.Tokenizer(code).token_buffer()
+        start = time.perf_counter()
+        value = build(ParserClass().parse_tokens(buffer))
+        elapsed = time.perf_counter() - start
+        assert value == expected
+        print(f'{label:>14} {elapsed:>10.3f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+import argparse
+import time
+
+import zparse
+from zparse.metalang import Parser
+
+sizes = [100, 500, 2000, 10000]
+
+block = r'''
+stmt{i}
+  : 'let{i}' ~ NAME '=' expr{i} ';' @node
+  | 'print{i}' expr{i}? ';' @node
+expr{i}: expr{i} ('+' | '-') term{i} | term{i}
+term{i}: NAME | NUM{i} | '(' ~ expr{i} ')' | call{i}
+call{i}: callee=NAME '(' (expr{i} (',' expr{i})*)? ')' {{ callee }}
+# numbers and names of block {i}
+NUM{i}: _DIGIT{i}+ ('.' _DIGIT{i}+)?
+_DIGIT{i}: '0'-'9'
+'''
+
+def make_grammar(lines: int) -> str:
+    count = max(1, lines // (block.count('\n') + 1))
+    return (
+        'start: statement*\n'
+        + 'statement\n  : ' + '\n  | '.join(f'stmt{i}' for i in range(count))
+        + ''.join(block.format(i=i) for i in range(count))
+        + "NAME: ('a'-'z')+\nWS: (' ' | '\\n')+ @ignore\n"
+    )
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description='load generated grammars of increasing size',
+    )
+    arg_parser.add_argument(
+        '--max-lines',
+        type=int,
+        default=10000,
+        help='largest grammar in lines (default: 10000)',
+    )
+    args = arg_parser.parse_args()
+    print(f'{"lines":>8} {"metalang (s)":>13} {"make_parser (s)":>16}')
+    for lines in sizes:
+        if lines > args.max_lines:
+            break
+        code = make_grammar(lines)
+        start = time.perf_counter()
+        Parser(code).parse()
+        metalang = time.perf_counter() - start
+        # bypass the in-process cache
+        zparse.make_parser.cache_clear()
+        start = time.perf_counter()
+        zparse.make_parser(code, allow_big_implicits=True)
+        elapsed = time.perf_counter() - start
+        print(f'{code.count(chr(10)):>8} {metalang:>13.3f} {elapsed:>16.3f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+import argparse
+import asyncio
+import os
+import sys
+import time
+import typing
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import zparse
+from tokenize_json import grammar, make_document
+
+async def ticker(gaps: list[float], done: asyncio.Event) -> None:
+    # how long the loop goes without running this task
+    last = time.perf_counter()
+    while not done.is_set():
+        await asyncio.sleep(0.001)
+        now = time.perf_counter()
+        gaps.append(now - last)
+        last = now
+
+async def measure(
+    parse: typing.Callable,
+    data: bytes,
+    requests: int,
+) -> tuple[float, float]:
+    gaps = []
+    done = asyncio.Event()
+    tick = asyncio.create_task(ticker(gaps, done))
+    start = time.perf_counter()
+    await asyncio.gather(*(parse(data) for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await tick
+    return elapsed, max(gaps)
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description='parse concurrent requests on one event loop',
+    )
+    arg_parser.add_argument(
+        '--size',
+        type=int,
+        default=10**6,
+        help='request body size in bytes (default: 1 MB)',
+    )
+    arg_parser.add_argument(
+        '--requests',
+        type=int,
+        default=8,
+        help='number of concurrent requests (default: 8)',
+    )
+    args = arg_parser.parse_args()
+    ParserClass = zparse.make_parser(grammar, allow_big_implicits=True)
+    data = make_document(args.size).encode()
+    async def parse_blocking(data):
+        return ParserClass(data.decode()).parse()
+    async def parse_async(data):
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return await ParserClass().parse_async(reader)
+    print(f'{args.requests} requests of {len(data)} bytes')
+    print(f'{"":>9} {"seconds":>10} {"max stall (ms)":>15}')
+    for label, parse in [('parse', parse_blocking), ('async', parse_async)]:
+        elapsed, stall = asyncio.run(measure(parse, data, args.requests))
+        print(f'{label:>9} {elapsed:>10.3f} {stall * 1e3:>15.1f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import zparse
+from tokenize_json import grammar, make_document
+
+def count(events) -> int:
+    return sum(1 for _ in events)
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description='compare parse() and parse_events() on the json grammar',
+    )
+    arg_parser.add_argument(
+        '--size',
+        type=int,
+        default=10**6,
+        help='input size in bytes (default: 1 MB)',
+    )
+    args = arg_parser.parse_args()
+    code = make_document(args.size)
+    TreeParser = zparse.make_parser(grammar, allow_big_implicits=True)
+    EventParser = zparse.make_parser(
+        grammar,
+        allow_big_implicits=True,
+        events=True,
+    )
+    # the events are counted and dropped, so the peak is what the parser
+    # keeps alive (the input itself is allocated before tracing starts)
+    print(f'{"api":>12} {"time (s)":>9} {"peak (MB)":>10}')
+    runs = [
+        ('parse', lambda: TreeParser(code).parse()),
+        ('parse_events', lambda: count(EventParser(code).parse_events())),
+    ]
+    for label, run in runs:
+        tracemalloc.start()
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f'{label:>12} {elapsed:>9.3f} {peak / 1e6:>10.1f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import zparse
+from tokenize_json import grammar, make_document
+
+sizes = [
+    ('1 KB', 10**3),
+    ('10 KB', 10**4),
+    ('100 KB', 10**5),
+    ('1 MB', 10**6),
+    ('10 MB', 10**7),
+]
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description='parse examples/json inputs of increasing size',
+    )
+    arg_parser.add_argument(
+        '--max-size',
+        type=int,
+        default=10**7,
+        help='largest input size in bytes (default: 10 MB)',
+    )
+    arg_parser.add_argument(
+        '--engine',
+        default='regex',
+        help='tokenizer engine to use (default: regex)',
+    )
+    arg_parser.add_argument(
+        '--memo',
+        default='dense',
+        help='memo table layout (default: dense)',
+    )
+    arg_parser.add_argument(
+        '--memory',
+        action='store_true',
+        help='also report peak memory allocated while parsing (slow)',
+    )
+    args = arg_parser.parse_args()
+    ParserClass = zparse.make_parser(
+        grammar,
+        allow_big_implicits=True,
+        engine=args.engine,
+        memo=args.memo,
+    )
+    # time per token should stay flat as the input grows
+    print(
+        f'{"size":>8} {"tokens":>12} {"seconds":>10} {"us/token":>9}'
+        + (f' {"peak MB":>9}' if args.memory else '')
+    )
+    for label, size in sizes:
+        if size > args.max_size:
+            break
+        code = make_document(size)
+        parser = ParserClass(code)
+        buffer = parser.Tokenizer(code).token_buffer()
+        start = time.perf_counter()
+        parser.parse_tokens(buffer)
+        elapsed = time.perf_counter() - start
+        line = (
+            f'{label:>8} {len(buffer):>12} {elapsed:>10.3f} '
+            f'{elapsed / len(buffer) * 1e6:>9.3f}'
+        )
+        if args.memory:
+            tracemalloc.start()
+            parser.parse_tokens(buffer)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            line += f' {peak / 1e6:>9.1f}'
+        print(line)
+
+if __name__ == '__main__':
+    main()
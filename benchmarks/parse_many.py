@@ -0,0 +1,89 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import zparse
+from tokenize_json import grammar
+
+def make_documents(count: int) -> list[str]:
+    # small config files
+    return [
+        json.dumps({
+            'name': f'service-{i}',
+            'port': 8000 + i % 1000,
+            'replicas': i % 7,
+            'tags': ['alpha', 'beta'],
+            'env': {'DEBUG': i % 3 == 0, 'REGION': None},
+        }, indent=2)
+        for i in range(count)
+    ]
+
+def count_nodes(tree: zparse.parsers.Node) -> int:
+    return 1 + sum(
+        count_nodes(child) for child in tree.children
+        if isinstance(child, zparse.parsers.Node)
+    )
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description='parse many small documents with parse_many',
+    )
+    arg_parser.add_argument(
+        '--documents',
+        type=int,
+        default=20000,
+        help='number of documents (default: 20000)',
+    )
+    arg_parser.add_argument(
+        '--workers',
+        type=int,
+        nargs='+',
+        default=[1, 2, 4, 8],
+        help='worker counts to time (default: 1 2 4 8)',
+    )
+    arg_parser.add_argument(
+        '--chunksize',
+        type=int,
+        default=64,
+        help='documents sent to a worker at a time (default: 64)',
+    )
+    args = arg_parser.parse_args()
+    documents = make_documents(args.documents)
+    ParserClass = zparse.make_parser(grammar, allow_big_implicits=True)
+    start = time.perf_counter()
+    for document in documents:
+        count_nodes(ParserClass(document).parse())
+    serial = time.perf_counter() - start
+    print(f'{os.cpu_count()} cpus, {len(documents)} documents')
+    print(f'{"workers":>8} {"trees (s)":>10} {"reduced (s)":>12}')
+    print(f'{"serial":>8} {"":>10} {serial:>12.3f}')
+    for workers in args.workers:
+        start = time.perf_counter()
+        for _ in zparse.parse_many(
+            grammar,
+            documents,
+            workers=workers,
+            chunksize=args.chunksize,
+            allow_big_implicits=True,
+        ):
+            pass
+        trees = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in zparse.parse_many(
+            grammar,
+            documents,
+            workers=workers,
+            chunksize=args.chunksize,
+            reduce=count_nodes,
+            allow_big_implicits=True,
+        ):
+            pass
+        reduced = time.perf_counter() - start
+        print(f'{workers:>8} {trees:>10.3f} {reduced:>12.3f}')
+
+if __name__ == '__main__':
+    main()
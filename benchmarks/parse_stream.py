@@ -0,0 +1,86 @@
+import argparse
+import resource
+import time
+
+import zparse
+
+# a stream of top-level statements. Each statement commits with a cut, and
+# the @stmt tag drops the statement's node, so parsing should run in
+# constant memory however long the stream is.
+grammar = r'''
+start: stmt*
+stmt
+  : 'let' ~ NAME '=' expr ';' @stmt
+  | 'print' ~ expr ';' @stmt
+expr: expr ('+' | '-') atom | atom
+atom: NUM | NAME | '(' ~ expr ')'
+NAME: ('a'-'z')+
+NUM: ('0'-'9')+
+WS: (' ' | '\n')+ @ignore
+'''
+
+sizes = [
+    ('1 MB', 10**6),
+    ('10 MB', 10**7),
+    ('100 MB', 10**8),
+    ('1 GB', 10**9),
+    ('10 GB', 10**10),
+]
+
+statement = 'let total = (total + 12) - count;\nprint total + 1;\n'
+
+class Statements:
+    # a file object that makes its text up as it is read
+    def __init__(self, size: int):
+        self.left = size
+        self.pending = ''
+    def read(self, n: int) -> str:
+        while len(self.pending) < n and self.left > 0:
+            count = min(1024, self.left // len(statement) + 1)
+            self.pending += statement * count
+            self.left -= len(statement) * count
+        out, self.pending = self.pending[:n], self.pending[n:]
+        return out
+
+class Base(zparse.parsers.BaseParser):
+    count = 0
+    def stmt(self, node):
+        Base.count += 1
+        return None
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description='parse a stream of statements in constant memory',
+    )
+    arg_parser.add_argument(
+        '--max-size',
+        type=int,
+        default=10**8,
+        help='largest stream size in bytes (default: 100 MB)',
+    )
+    arg_parser.add_argument(
+        '--memo',
+        default='dense',
+        help='memo table layout (default: dense)',
+    )
+    args = arg_parser.parse_args()
+    ParserClass = zparse.make_parser(
+        grammar,
+        base=Base,
+        allow_big_implicits=True,
+        memo=args.memo,
+    )
+    # the max RSS of the process should stay flat as the streams get longer
+    print(f'{"size":>8} {"statements":>12} {"seconds":>10} {"max RSS MB":>11}')
+    for label, size in sizes:
+        if size > args.max_size:
+            break
+        Base.count = 0
+        start = time.perf_counter()
+        ParserClass().parse_stream(Statements(size))
+        elapsed = time.perf_counter() - start
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(f'{label:>8} {Base.count:>12} {elapsed:>10.3f} {rss:>11.1f}')
+
+if __name__ == '__main__':
+    main()
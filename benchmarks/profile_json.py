@@ -0,0 +1,62 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import zparse
+from tokenize_json import grammar, make_document
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description='profile the rules of the examples/json parser',
+    )
+    arg_parser.add_argument(
+        '--size',
+        type=int,
+        default=10**6,
+        help='input size in bytes (default: 1 MB)',
+    )
+    arg_parser.add_argument(
+        '--collapsed',
+        help='also write the collapsed stacks to this file',
+    )
+    args = arg_parser.parse_args()
+    code = make_document(args.size)
+    times = {}
+    for profile in [False, True]:
+        ParserClass = zparse.make_parser(
+            grammar,
+            allow_big_implicits=True,
+            profile=profile,
+        )
+        buffer = ParserClass.Tokenizer(code).token_buffer()
+        parser = ParserClass()
+        start = time.perf_counter()
+        parser.parse_tokens(buffer)
+        times[profile] = time.perf_counter() - start
+    print(
+        f'parse {times[False]:.3f} s, profiled {times[True]:.3f} s '
+        f'({times[True] / times[False]:.1f}x)'
+    )
+    print(
+        f'{"rule":>10} {"calls":>9} {"hits":>9} {"failed alts":>12} '
+        f'{"cum (s)":>8} {"self (s)":>9}'
+    )
+    report = parser.profile.to_dict()
+    for name, stats in sorted(
+        report.items(),
+        key=lambda item: -item[1]['self_time'],
+    ):
+        print(
+            f'{name:>10} {stats["calls"]:>9} {stats["memo_hits"]:>9} '
+            f'{sum(stats["failed_alternatives"]):>12} '
+            f'{stats["cumulative_time"]:>8.3f} {stats["self_time"]:>9.3f}'
+        )
+    if args.collapsed:
+        with open(args.collapsed, 'w') as fp:
+            fp.write(parser.profile.collapsed())
+
+if __name__ == '__main__':
+    main()
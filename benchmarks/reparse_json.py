@@ -0,0 +1,72 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import zparse
+from tokenize_json import grammar, make_document
+
+sizes = [
+    ('10 KB', 10**4),
+    ('100 KB', 10**5),
+    ('1 MB', 10**6),
+    ('10 MB', 10**7),
+]
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description='reparse examples/json inputs after one character edits',
+    )
+    arg_parser.add_argument(
+        '--max-size',
+        type=int,
+        default=10**7,
+        help='largest input size in bytes (default: 10 MB)',
+    )
+    arg_parser.add_argument(
+        '--edits',
+        type=int,
+        default=20,
+        help='number of edits to time per input (default: 20)',
+    )
+    args = arg_parser.parse_args()
+    ParserClass = zparse.make_parser(
+        grammar,
+        base=zparse.IncrementalParser,
+        allow_big_implicits=True,
+        memo='incremental',
+    )
+    # the reparse time should grow with the number of values in the
+    # top level array, not with the number of tokens
+    print(
+        f'{"size":>8} {"lines":>8} {"full (s)":>9} {"edit (ms)":>10} '
+        f'{"reparse (ms)":>13}'
+    )
+    for label, size in sizes:
+        if size > args.max_size:
+            break
+        code = make_document(size)
+        parser = ParserClass(code)
+        start = time.perf_counter()
+        parser.parse()
+        full = time.perf_counter() - start
+        edit = reparse = 0
+        # change a digit of a number in the middle of the document
+        pos = code.index('12345', len(code) // 2) + 2
+        for i in range(args.edits):
+            start = time.perf_counter()
+            parser.edit(pos, pos + 1, str(i % 10))
+            edit += time.perf_counter() - start
+            start = time.perf_counter()
+            parser.parse()
+            reparse += time.perf_counter() - start
+        print(
+            f'{label:>8} {code.count(chr(10)) + 1:>8} {full:>9.3f} '
+            f'{edit / args.edits * 1e3:>10.3f} '
+            f'{reparse / args.edits * 1e3:>13.3f}'
+        )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+import argparse
+import json
+import os
+import runpy
+import time
+
+import zparse
+
+here = os.path.dirname(os.path.abspath(__file__))
+grammar = runpy.run_path(
+    os.path.join(here, '..', 'examples', 'json', 'json.py')
+)['grammar']
+
+sizes = [
+    ('1 KB', 10**3),
+    ('10 KB', 10**4),
+    ('100 KB', 10**5),
+    ('1 MB', 10**6),
+    ('10 MB', 10**7),
+    ('100 MB', 10**8),
+]
+
+def make_document(size: int) -> str:
+    record = json.dumps({
+        'id': 12345,
+        'name': 'zparse é\\"benchmark\\"',
+        'tags': ['alpha', 'beta', 'gamma'],
+        'score': -0.125e3,
+        'active': True,
+        'parent': None,
+    }, indent=2)
+    count = max(1, size // (len(record) + 2))
+    return '[\n' + ',\n'.join([record] * count) + '\n]'
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description='tokenize examples/json inputs of increasing size',
+    )
+    arg_parser.add_argument(
+        '--max-size',
+        type=int,
+        default=10**8,
+        help='largest input size in bytes (default: 100 MB)',
+    )
+    arg_parser.add_argument(
+        '--engine',
+        default='regex',
+        help='tokenizer engine to benchmark (default: regex)',
+    )
+    args = arg_parser.parse_args()
+    TokenizerClass = zparse.make_tokenizer(
+        grammar,
+        allow_big_implicits=True,
+        engine=args.engine,
+    )
+    print(f'{"size":>8} {"tokens":>12} {"seconds":>10} {"MB/s":>8} {"us/token":>9}')
+    for label, size in sizes:
+        if size > args.max_size:
+            break
+        code = make_document(size)
+        start = time.perf_counter()
+        count = 0
+        for _ in TokenizerClass(code).tokens():
+            count += 1
+        elapsed = time.perf_counter() - start
+        print(
+            f'{label:>8} {count:>12} {elapsed:>10.3f} '
+            f'{len(code) / elapsed / 1e6:>8.2f} '
+            f'{elapsed / count * 1e6:>9.3f}'
+        )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import zparse
+from zparse import batch
+from tokenize_json import grammar, make_document
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description='tokenize one large examples/json input in parallel',
+    )
+    arg_parser.add_argument(
+        '--size',
+        type=int,
+        default=10**7,
+        help='input size in bytes (default: 10 MB)',
+    )
+    arg_parser.add_argument(
+        '--workers',
+        type=int,
+        nargs='+',
+        default=[1, 2, 4, 8],
+        help='worker counts to time (default: 1 2 4 8)',
+    )
+    arg_parser.add_argument(
+        '--minify',
+        action='store_true',
+        help='remove the whitespace between values',
+    )
+    args = arg_parser.parse_args()
+    code = make_document(args.size)
+    if args.minify:
+        code = json.dumps(
+            json.loads(code),
+            ensure_ascii=False,
+            separators=(',', ':'),
+        )
+    # counts the chunks that the parent lexes again, by wrapping the relex
+    # that stitch calls
+    fallbacks = []
+    relex = batch.relex
+    def counting_relex(*args):
+        fallbacks.append(args[3])
+        return relex(*args)
+    batch.relex = counting_relex
+    TokenizerClass = zparse.make_tokenizer(grammar, allow_big_implicits=True)
+    start = time.perf_counter()
+    expected = TokenizerClass(code).token_buffer()
+    serial = time.perf_counter() - start
+    print(f'{os.cpu_count()} cpus, {len(expected)} tokens')
+    print(f'{"workers":>8} {"seconds":>10} {"speedup":>8} {"relexed":>8}')
+    print(f'{"serial":>8} {serial:>10.3f} {1:>8.2f}')
+    for workers in args.workers:
+        fallbacks.clear()
+        start = time.perf_counter()
+        buffer = zparse.tokenize_parallel(
+            grammar,
+            code,
+            workers=workers,
+            allow_big_implicits=True,
+        )
+        elapsed = time.perf_counter() - start
+        if buffer.starts != expected.starts:
+            print(f'{workers} workers gave different tokens')
+            sys.exit(1)
+        relexed = f'{len(fallbacks)}/{workers}'
+        print(
+            f'{workers:>8} {elapsed:>10.3f} {serial / elapsed:>8.2f} '
+            f'{relexed:>8}'
+        )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import zparse
+from tokenize_json import grammar, make_document
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description='count and time the token definitions of examples/json',
+    )
+    arg_parser.add_argument(
+        '--size',
+        type=int,
+        default=10**6,
+        help='input size in bytes (default: 1 MB)',
+    )
+    args = arg_parser.parse_args()
+    code = make_document(args.size)
+    times = {}
+    for instrument in [False, True]:
+        TokenizerClass = zparse.make_tokenizer(
+            grammar,
+            allow_big_implicits=True,
+            instrument=instrument,
+        )
+        start = time.perf_counter()
+        TokenizerClass(code).token_buffer()
+        times[instrument] = time.perf_counter() - start
+    print(
+        f'tokenize {times[False]:.3f} s, instrumented {times[True]:.3f} s '
+        f'({times[True] / times[False]:.1f}x)'
+    )
+    # definitions that are tried often but rarely win are the ones to move
+    # down or merge
+    print(
+        f'{"token":>16} {"tried":>9} {"matched":>9} {"won":>9} '
+        f'{"regex (s)":>10} {"us/won":>8}'
+    )
+    for name, stats in TokenizerClass.stats.to_dict().items():
+        per_token = '-'
+        if stats['won']:
+            per_token = f'{stats["regex_time"] / stats["won"] * 1e6:.2f}'
+        print(
+            f'{name:>16} {stats["tried"]:>9} {stats["matched"]:>9} '
+            f'{stats["won"]:>9} {stats["regex_time"]:>10.3f} '
+            f'{per_token:>8}'
+        )
+
+if __name__ == '__main__':
+    main()
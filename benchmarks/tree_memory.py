@@ -0,0 +1,47 @@
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import zparse
+from tokenize_json import grammar, make_document
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description='compare Node trees and arena trees for examples/json',
+    )
+    arg_parser.add_argument(
+        '--size',
+        type=int,
+        default=10**7,
+        help='input size in bytes (default: 10 MB)',
+    )
+    args = arg_parser.parse_args()
+    ParserClass = zparse.make_parser(grammar, allow_big_implicits=True)
+    code = make_document(args.size)
+    buffer = ParserClass.Tokenizer(code).token_buffer()
+    print(f'{len(buffer)} tokens')
+    print(f'{"tree":>6} {"parse (s)":>10} {"gc (s)":>8} {"tree (MB)":>10}')
+    for tree in ['nodes', 'arena']:
+        start = time.perf_counter()
+        result = ParserClass().parse_tokens(buffer, tree)
+        parse = time.perf_counter() - start
+        # a full collection has to visit every object in the tree
+        start = time.perf_counter()
+        gc.collect()
+        collect = time.perf_counter() - start
+        del result
+        # the memory the tree keeps alive, without the token buffer
+        tracemalloc.start()
+        result = ParserClass().parse_tokens(buffer, tree)
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del result
+        print(f'{tree:>6} {parse:>10.3f} {collect:>8.3f} {size / 1e6:>10.1f}')
+
+if __name__ == '__main__':
+    main()
@@ -11,12 +11,12 @@ value
   | 'false'
   | 'null'
 
-object: '{' pairs? '}'
-pairs: pair (',' pair)*
+object: '{' ~ pairs? '}'
+pairs: pair (',' ~ pair)*
 pair: STRING ':' value
 
-array: '[' values? ']'
-values: value (',' value)*
+array: '[' ~ values? ']'
+values: value (',' ~ value)*
 
 STRING: '"' (_ESCAPE | _SAFECODEPOINT)* '"'
 _SAFECODEPOINT: ' '-'!' | '#'-'[' | ']'-'\U0010FFFF'
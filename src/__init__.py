@@ -1,2 +1,5 @@
 from zparse.tokenizers import make_tokenizer
-from zparse.parsers import make_parser
\ No newline at end of file
+from zparse.parsers import make_parser
+from zparse.compiler import compile_grammar
+from zparse.incremental import IncrementalParser
+from zparse.batch import parse_many, tokenize_parallel
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import argparse
+import importlib
+import sys
+
+from zparse.errors import GrammarError
+from zparse.tokenizers import BaseTokenizer, engines, modes
+from zparse.parsers import BaseParser, memos
+from zparse.compiler import compile_grammar
+
+def load_class(path: str) -> type:
+    # classes are given as module:qualname
+    module, _, qualname = path.partition(':')
+    if not module or not qualname:
+        raise ValueError(f'{path!r} is not of the form module:Class')
+    obj = importlib.import_module(module)
+    for attr in qualname.split('.'):
+        try:
+            obj = getattr(obj, attr)
+        except AttributeError:
+            raise ImportError(f'cannot import {qualname!r} from {module!r}')
+    return obj
+
+def compile_command(args: argparse.Namespace) -> None:
+    with open(args.grammar) as fp:
+        code = fp.read()
+    source = compile_grammar(
+        code,
+        load_class(args.base) if args.base else BaseParser,
+        args.name,
+        load_class(args.tok_base) if args.tok_base else BaseTokenizer,
+        args.tok_name,
+        args.allow_big_implicits,
+        args.engine,
+        args.mode,
+        args.memo,
+        args.events,
+        args.profile,
+        args.instrument,
+    )
+    if args.output is None:
+        sys.stdout.write(source)
+    else:
+        with open(args.output, 'w') as fp:
+            fp.write(source)
+
+def main(argv: list[str] | None=None) -> int:
+    arg_parser = argparse.ArgumentParser(prog='zparse')
+    commands = arg_parser.add_subparsers(dest='command', required=True)
+    compile_args = commands.add_parser(
+        'compile',
+        help='compile a grammar into a python module',
+    )
+    compile_args.add_argument('grammar', help='the grammar file')
+    compile_args.add_argument('-o', '--output', help='defaults to stdout')
+    compile_args.add_argument('--name', default='Parser')
+    compile_args.add_argument('--tok-name', default='Tokenizer')
+    compile_args.add_argument('--base', help='module:Class')
+    compile_args.add_argument('--tok-base', help='module:Class')
+    compile_args.add_argument('--engine', choices=list(engines), default='regex')
+    compile_args.add_argument('--mode', choices=modes, default='text')
+    compile_args.add_argument('--memo', choices=memos, default='dense')
+    compile_args.add_argument('--allow-big-implicits', action='store_true')
+    compile_args.add_argument('--events', action='store_true')
+    compile_args.add_argument('--profile', action='store_true')
+    compile_args.add_argument('--instrument', action='store_true')
+    args = arg_parser.parse_args(argv)
+    # errors are reported in one line with the exit status of argparse's
+    # usage errors
+    try:
+        compile_command(args)
+    except GrammarError as e:
+        print(f'zparse: {e.msg}', file=sys.stderr)
+        return 2
+    except OSError as e:
+        if e.filename is None:
+            print(f'zparse: {e}', file=sys.stderr)
+        else:
+            print(f'zparse: {e.filename}: {e.strerror}', file=sys.stderr)
+        return 2
+    except (ImportError, ValueError) as e:
+        print(f'zparse: {e}', file=sys.stderr)
+        return 2
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,381 @@
+from zparse.errors import GrammarError
+from zparse.metalang import (
+    Grammar,
+    GrammarExpr,
+    Identifier,
+    StringLiteral,
+    Cut,
+    Alias,
+    Union,
+    Concatenation,
+    Optional,
+    NongreedyOptional,
+    Plus,
+    NongreedyPlus,
+    Star,
+    NongreedyStar,
+)
+from zparse.tokenizers import get_name
+
+class GrammarInfo:
+    def __init__(self, grammar: Grammar):
+        self.grammar = grammar
+        self.rules = {
+            rule_def.name.name: rule_def
+            for rule_def in grammar.rule_definitions
+        }
+        self.nullable = compute_nullable(self)
+        self.left_calls = {
+            name: set().union(*(
+                left_calls(alt.value, self.nullable)
+                for alt in rule_def.alternatives
+            ))
+            for name, rule_def in self.rules.items()
+        }
+        self.tagged = {
+            name for name, rule_def in self.rules.items()
+            if any(alt.tag is not None for alt in rule_def.alternatives)
+        }
+        self.tags = sorted({
+            alt.tag.name.name
+            for rule_def in self.rules.values()
+            for alt in rule_def.alternatives
+            if alt.tag is not None
+        })
+        self.has_actions = any(
+            alt.code is not None
+            for rule_def in self.rules.values()
+            for alt in rule_def.alternatives
+        )
+        self.has_cuts = any(
+            contains_cut(alt.value)
+            for rule_def in self.rules.values()
+            for alt in rule_def.alternatives
+        )
+        self.cutting = compute_cutting(self)
+        self.first = compute_first(self)
+        self.alternative_first = {
+            name: [
+                first_of(alt.value, self.first, self.nullable)
+                for alt in rule_def.alternatives
+            ]
+            for name, rule_def in self.rules.items()
+        }
+        self.alternative_nullable = {
+            name: [
+                is_nullable(alt.value, self.nullable)
+                for alt in rule_def.alternatives
+            ]
+            for name, rule_def in self.rules.items()
+        }
+        self.follow = compute_follow(self)
+        self.left_recursive = set()
+        self.leaders = set()
+        # for the leaders of components that need more than one, the other
+        # leaders of their component
+        self.involved = {}
+        for scc in strongly_connected_components(self.left_calls):
+            if len(scc) == 1:
+                name = next(iter(scc))
+                if name in self.left_calls[name]:
+                    self.left_recursive.add(name)
+                    self.leaders.add(name)
+            else:
+                self.left_recursive |= scc
+                leaders = find_leaders(scc, self.left_calls, list(self.rules))
+                self.leaders |= leaders
+                if len(leaders) > 1:
+                    for name in leaders:
+                        self.involved[name] = [
+                            other for other in self.rules
+                            if other in leaders and other != name
+                        ]
+    def __repr__(self):
+        return f'GrammarInfo({list(self.rules)})'
+
+def compute_nullable(info: GrammarInfo) -> dict[str, bool]:
+    nullable = {name: False for name in info.rules}
+    changed = True
+    while changed:
+        changed = False
+        for name, rule_def in info.rules.items():
+            if nullable[name]:
+                continue
+            if any(
+                is_nullable(alt.value, nullable)
+                for alt in rule_def.alternatives
+            ):
+                nullable[name] = True
+                changed = True
+    return nullable
+
+def is_nullable(expr: GrammarExpr, nullable: dict[str, bool]) -> bool:
+    if isinstance(expr, Identifier):
+        return nullable.get(expr.name, False)
+    elif isinstance(expr, StringLiteral):
+        return expr.value == ''
+    elif isinstance(expr, Cut):
+        return True
+    elif isinstance(expr, Alias):
+        return is_nullable(expr.name, nullable)
+    elif isinstance(expr, Union):
+        return any(is_nullable(value, nullable) for value in expr.values)
+    elif isinstance(expr, Concatenation):
+        return all(is_nullable(value, nullable) for value in expr.values)
+    elif isinstance(expr, (Optional, Star)):
+        return True
+    elif isinstance(expr, Plus):
+        return is_nullable(expr.value, nullable)
+    elif isinstance(expr, NongreedyOptional):
+        raise GrammarError(
+            'rule definitions cannot contain nongreedy operators',
+            (expr.qmark2,),
+        )
+    elif isinstance(expr, (NongreedyPlus, NongreedyStar)):
+        raise GrammarError(
+            'rule definitions cannot contain nongreedy operators',
+            (expr.qmark,),
+        )
+    raise GrammarError(
+        f'unexpected expression {expr!r} in rule definition',
+    )
+
+def compute_first(info: GrammarInfo) -> dict[str, set[str]]:
+    # the FIRST set of a rule is the tokens its alternatives start with plus
+    # the FIRST sets of the rules they can start with. Tarjan's algorithm
+    # emits each component after the components it calls, so one pass over
+    # the components in that order finishes every set.
+    empty = {name: set() for name in info.rules}
+    first = {}
+    for scc in strongly_connected_components(info.left_calls):
+        out = set()
+        for name in scc:
+            for alt in info.rules[name].alternatives:
+                out |= first_of(alt.value, empty, info.nullable)
+            for callee in info.left_calls[name]:
+                if callee not in scc:
+                    out |= first.get(callee, set())
+        for name in scc:
+            first[name] = out
+    return {name: set(first[name]) for name in info.rules}
+
+def first_of(
+    expr: GrammarExpr,
+    first: dict[str, set[str]],
+    nullable: dict[str, bool],
+) -> set[str]:
+    # the names of the token kinds that expr can start with
+    if isinstance(expr, Identifier):
+        if expr.is_rule():
+            return set(first.get(expr.name, ()))
+        return {expr.name}
+    elif isinstance(expr, StringLiteral):
+        return {get_name(expr.value)} if expr.value else set()
+    elif isinstance(expr, Alias):
+        return first_of(expr.name, first, nullable)
+    elif isinstance(expr, Union):
+        return set().union(*(
+            first_of(value, first, nullable) for value in expr.values
+        ))
+    elif isinstance(expr, Concatenation):
+        out = set()
+        for value in expr.values:
+            out |= first_of(value, first, nullable)
+            if not is_nullable(value, nullable):
+                break
+        return out
+    elif isinstance(expr, (Optional, Star, Plus)):
+        return first_of(expr.value, first, nullable)
+    return set()
+
+def compute_follow(info: GrammarInfo) -> dict[str, set[str]]:
+    # the token kinds that can come right after each rule. The start rule
+    # is followed by EOF.
+    follow = {name: set() for name in info.rules}
+    follow[next(iter(info.rules))].add('EOF')
+    def add(name, kinds):
+        if name in follow and not kinds <= follow[name]:
+            follow[name] |= kinds
+            if name not in queued:
+                queued.add(name)
+                pending.append(name)
+    def walk(expr, after):
+        if isinstance(expr, Identifier):
+            if expr.is_rule():
+                add(expr.name, after)
+        elif isinstance(expr, Alias):
+            walk(expr.name, after)
+        elif isinstance(expr, Union):
+            for value in expr.values:
+                walk(value, after)
+        elif isinstance(expr, Concatenation):
+            for value in reversed(expr.values):
+                walk(value, after)
+                first = first_of(value, info.first, info.nullable)
+                if is_nullable(value, info.nullable):
+                    after = after | first
+                else:
+                    after = first
+        elif isinstance(expr, Optional):
+            walk(expr.value, after)
+        elif isinstance(expr, (Star, Plus)):
+            walk(
+                expr.value,
+                after | first_of(expr.value, info.first, info.nullable),
+            )
+    # a rule is walked again whenever its FOLLOW set grows
+    pending = list(reversed(info.rules))
+    queued = set(pending)
+    while pending:
+        name = pending.pop()
+        queued.discard(name)
+        for alt in info.rules[name].alternatives:
+            walk(alt.value, set(follow[name]))
+    return follow
+
+def left_calls(expr: GrammarExpr, nullable: dict[str, bool]) -> set[str]:
+    # the rules that can be called at the position where expr starts
+    if isinstance(expr, Identifier):
+        return {expr.name} if expr.is_rule() else set()
+    elif isinstance(expr, StringLiteral):
+        return set()
+    elif isinstance(expr, Alias):
+        return left_calls(expr.name, nullable)
+    elif isinstance(expr, Union):
+        return set().union(*(left_calls(v, nullable) for v in expr.values))
+    elif isinstance(expr, Concatenation):
+        out = set()
+        for value in expr.values:
+            out |= left_calls(value, nullable)
+            if not is_nullable(value, nullable):
+                break
+        return out
+    elif isinstance(expr, (Optional, Star, Plus)):
+        return left_calls(expr.value, nullable)
+    return set()
+
+def contains_cut(expr: GrammarExpr) -> bool:
+    if isinstance(expr, Cut):
+        return True
+    elif isinstance(expr, (Union, Concatenation)):
+        return any(contains_cut(value) for value in expr.values)
+    elif isinstance(expr, (Optional, Plus, Star)):
+        return contains_cut(expr.value)
+    return False
+
+def compute_cutting(info: GrammarInfo) -> set[str]:
+    # the rules that can run a cut, themselves or in a rule they call
+    cutting = set()
+    changed = True
+    while changed:
+        changed = False
+        for name, rule_def in info.rules.items():
+            if name not in cutting and any(
+                can_cut(alt.value, cutting)
+                for alt in rule_def.alternatives
+            ):
+                cutting.add(name)
+                changed = True
+    return cutting
+
+def can_cut(expr: GrammarExpr, cutting: set[str]) -> bool:
+    if isinstance(expr, Cut):
+        return True
+    elif isinstance(expr, Identifier):
+        return expr.name in cutting
+    elif isinstance(expr, Alias):
+        return can_cut(expr.name, cutting)
+    elif isinstance(expr, (Union, Concatenation)):
+        return any(can_cut(value, cutting) for value in expr.values)
+    elif isinstance(expr, (Optional, Plus, Star)):
+        return can_cut(expr.value, cutting)
+    return False
+
+def strongly_connected_components(
+    graph: dict[str, set[str]],
+) -> list[set[str]]:
+    # Tarjan's algorithm with an explicit stack, since chains of rules can
+    # be longer than the recursion limit. Components come out after every
+    # component they can reach.
+    index = {}
+    lowlink = {}
+    stack = []
+    on_stack = set()
+    out = []
+    for root in graph:
+        if root in index:
+            continue
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(graph[root]))]
+        while work:
+            node, succs = work[-1]
+            for succ in succs:
+                if succ not in graph:
+                    continue
+                if succ not in index:
+                    index[succ] = lowlink[succ] = len(index)
+                    stack.append(succ)
+                    on_stack.add(succ)
+                    work.append((succ, iter(graph[succ])))
+                    break
+                elif succ in on_stack:
+                    lowlink[node] = min(lowlink[node], index[succ])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    scc = set()
+                    while True:
+                        succ = stack.pop()
+                        on_stack.remove(succ)
+                        scc.add(succ)
+                        if succ == node:
+                            break
+                    out.append(scc)
+    return out
+
+def find_leaders(
+    scc: set[str],
+    graph: dict[str, set[str]],
+    order: list[str],
+) -> set[str]:
+    # a set of rules that breaks every left recursive cycle in the
+    # component. Only these rules grow seeds; the other rules in the
+    # component are evaluated without memoization. A depth-first search from
+    # the first rule in grammar order makes the rules that back edges lead
+    # to the leaders: every cycle has a back edge, so without them no cycle
+    # is left. This is not always the smallest such set, but it takes linear
+    # time where finding the smallest one does not.
+    position = {name: i for i, name in enumerate(order)}
+    names = sorted(scc, key=position.__getitem__)
+    successors = {
+        name: sorted(graph[name] & scc, key=position.__getitem__)
+        for name in names
+    }
+    leaders = set()
+    visited = set()
+    on_path = set()
+    for root in names:
+        if root in visited:
+            continue
+        visited.add(root)
+        on_path.add(root)
+        work = [(root, iter(successors[root]))]
+        while work:
+            node, succs = work[-1]
+            for succ in succs:
+                if succ in on_path:
+                    leaders.add(succ)
+                elif succ not in visited:
+                    visited.add(succ)
+                    on_path.add(succ)
+                    work.append((succ, iter(successors[succ])))
+                    break
+            else:
+                work.pop()
+                on_path.remove(node)
+    return leaders
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import array
+
+from zparse.tokenizers import TokenBuffer, BufferToken
+from zparse.parsers import Node
+
+# An arena stores a parse tree as columns of integers instead of one object
+# per node and token. Node i is an instance of rule rule_names[kinds[i]], and
+# its children are children[firsts[i]:firsts[i + 1]], where a child of at
+# least 0 is another node and a negative child is the token at position
+# ~child. Each column uses the smallest typecode that holds its values
+# (children are 32 bit, so an arena holds up to 2**31 nodes and tokens), and
+# node spans are not stored but found from the tokens under the node.
+#
+# Nodes are added bottom up as rules succeed, so a node the parser built and
+# then backtracked over stays in the arena, but cannot be reached from the
+# root.
+
+class Arena:
+    def __init__(self, buffer: TokenBuffer, rule_names: list[str]):
+        self.buffer = buffer
+        self.rule_names = rule_names
+        self.rule_ids = {name: i for i, name in enumerate(rule_names)}
+        if len(rule_names) <= 0xff:
+            self.kinds = array.array('B')
+        elif len(rule_names) <= 0xffff:
+            self.kinds = array.array('H')
+        else:
+            self.kinds = array.array('i')
+        self.firsts = array.array('I', [0])
+        self.children = array.array('i')
+    def __repr__(self):
+        return f'Arena({len(self.kinds)} nodes)'
+    def __len__(self) -> int:
+        return len(self.kinds)
+    def add(self, kind: str, children: list[int]) -> int:
+        self.kinds.append(self.rule_ids[kind])
+        self.children.extend(children)
+        self.firsts.append(len(self.children))
+        return len(self.kinds) - 1
+    def start(self, index: int) -> int:
+        # the position of the first token under node index, or -1
+        firsts = self.firsts
+        stack = [index]
+        while stack:
+            child = stack.pop()
+            if child < 0:
+                return ~child
+            stack.extend(
+                reversed(self.children[firsts[child]:firsts[child + 1]])
+            )
+        return -1
+    def end(self, index: int) -> int:
+        # one past the position of the last token under node index, or -1
+        firsts = self.firsts
+        stack = [index]
+        while stack:
+            child = stack.pop()
+            if child < 0:
+                return ~child + 1
+            stack.extend(self.children[firsts[child]:firsts[child + 1]])
+        return -1
+    def node(self, index: int) -> ArenaNode:
+        return ArenaNode(self, index)
+    def child(self, child: int) -> ArenaNode | BufferToken:
+        if child >= 0:
+            return ArenaNode(self, child)
+        return BufferToken(self.buffer, ~child)
+
+class ArenaNode(Node):
+    # a view of a node in an arena. Its children are made when they are read.
+    __slots__ = ('arena', 'index')
+    def __init__(self, arena: Arena, index: int):
+        self.arena = arena
+        self.index = index
+    @property
+    def kind(self) -> str:
+        return self.arena.rule_names[self.arena.kinds[self.index]]
+    @property
+    def children(self) -> list[ArenaNode | BufferToken]:
+        arena = self.arena
+        firsts = arena.firsts
+        return [
+            arena.child(child) for child in
+            arena.children[firsts[self.index]:firsts[self.index + 1]]
+        ]
+    @property
+    def start(self) -> int:
+        return self.arena.start(self.index)
+    @property
+    def end(self) -> int:
+        return self.arena.end(self.index)
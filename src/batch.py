@@ -0,0 +1,275 @@
+from __future__ import annotations
+
+import typing
+import array
+import bisect
+import os
+
+from zparse.errors import ParseError, TokenError
+from zparse.metalang import Parser
+from zparse.lines import LineIndex
+from zparse.tokenizers import (
+    Token,
+    BufferToken,
+    TokenBuffer,
+    BaseTokenizer,
+    make_tokenizer,
+)
+from zparse.parsers import Node, make_parser
+
+# Parser and tokenizer classes are created at runtime, so they cannot be
+# pickled and sent to other processes. Instead every worker makes its class
+# from the grammar in the pool's initializer, and only the inputs and the
+# results cross process boundaries. Trees are sent back as nested tuples,
+# unless the caller passes a function that reduces them in the worker.
+
+error_modes = ['raise', 'return']
+
+# the parser class, the reduce function and the tokenizer class of a worker
+# process
+worker_parser = None
+worker_reduce = None
+worker_tokenizer = None
+
+def parse_many(
+    grammar: str,
+    documents: typing.Iterable[str],
+    workers: int | None=None,
+    chunksize: int=64,
+    reduce: typing.Callable | None=None,
+    errors: str='raise',
+    **options: typing.Any,
+) -> typing.Iterator:
+    if errors not in error_modes:
+        raise ValueError(f'errors must be one of {", ".join(error_modes)}')
+    # the grammar is processed here first, so that grammar errors are raised
+    # by this call and not in every worker
+    make_parser(grammar, **options)
+    return results(
+        documents,
+        workers,
+        chunksize,
+        errors,
+        (grammar, options, reduce),
+    )
+
+def results(
+    documents: typing.Iterable[str],
+    workers: int | None,
+    chunksize: int,
+    errors: str,
+    initargs: tuple,
+) -> typing.Iterator:
+    # imported here to keep multiprocessing (and the modules it imports)
+    # off the import path of zparse
+    import multiprocessing
+    with multiprocessing.Pool(workers, init_worker, initargs) as pool:
+        for ok, value in pool.imap(parse_document, documents, chunksize):
+            if not ok and errors == 'raise':
+                raise value
+            yield value
+
+def init_worker(
+    grammar: str,
+    options: dict,
+    reduce: typing.Callable | None,
+) -> None:
+    global worker_parser, worker_reduce
+    worker_parser = make_parser(grammar, **options)
+    worker_reduce = reduce
+
+def parse_document(code: str) -> tuple[bool, typing.Any]:
+    # errors are sent back with plain tuples in place of their tokens, since
+    # tokens refer to the worker's token kinds
+    try:
+        tree = worker_parser(code).parse()
+    except ParseError as e:
+        return False, ParseError(e.msg, tuple(map(to_tuples, e.tokens)))
+    except TokenError as e:
+        return False, TokenError(e.msg, e.pos)
+    if worker_reduce is not None:
+        return True, worker_reduce(tree)
+    return True, to_tuples(tree)
+
+def to_tuples(value: typing.Any) -> typing.Any:
+    # nodes become (kind, children) and tokens become
+    # (kind name, text, start, end). Anything else (like the values tags
+    # return) is left as it is.
+    if isinstance(value, Node):
+        return value.kind, [to_tuples(child) for child in value.children]
+    elif isinstance(value, (Token, BufferToken)):
+        return value.kind.name, value.text, value.start, value.end
+    return value
+
+# tokenize_parallel splits the code into one chunk per worker. Every chunk
+# but the first is lexed from overlap characters before its boundary, where
+# the tokenizer may start in the middle of a token (or a string, or a
+# comment), so its first tokens can be wrong. Once two streams have a token
+# that starts at the same offset, the tokenizer was at the same position in
+# both and the rest of the tokens agree, so a chunk is joined to the tokens
+# before it at the first offset where both start a token. When a chunk fails
+# to lex (usually because it started inside a string), the worker starts
+# over one character after the failure and only keeps the tokens from
+# there. A chunk that does not line up is lexed again from the last token
+# before it until a token does, so the parent only covers the gap. This only
+# works when tokens depend on nothing but the text, so tokenizers with
+# predicates or with tags other than @ignore are lexed in one pass.
+#
+# Chunks are also cut overlap characters past their end, and only the tokens
+# that start before half of that are lexed, so a token that is longer than
+# overlap // 2 can be cut short.
+
+def tokenize_parallel(
+    grammar: str,
+    code: str | bytes,
+    workers: int | None=None,
+    overlap: int=4096,
+    **options: typing.Any,
+) -> TokenBuffer:
+    if overlap < 2:
+        raise ValueError('overlap must be at least 2')
+    if workers is None:
+        workers = os.cpu_count() or 1
+    Tokenizer = make_tokenizer(grammar, **options)
+    if (
+        workers < 2 or len(code) < 2 * overlap * workers
+        or not is_stateless(grammar, Tokenizer)
+    ):
+        return Tokenizer(code).token_buffer()
+    length = len(code)
+    bounds = [length * i // workers for i in range(workers + 1)]
+    tasks = []
+    for i in range(workers):
+        lo = max(bounds[i] - overlap, 0)
+        hi = min(bounds[i + 1] + overlap, length)
+        stop = length + 1 if hi == length else bounds[i + 1] + overlap // 2
+        tasks.append((code[lo:hi], lo, stop))
+    # imported here to keep multiprocessing (and the modules it imports)
+    # off the import path of zparse
+    import multiprocessing
+    with multiprocessing.Pool(
+        workers,
+        init_tokenizer,
+        (grammar, options),
+    ) as pool:
+        return stitch(
+            Tokenizer(code),
+            pool.imap(lex_chunk, tasks),
+            [task[2] for task in tasks],
+        )
+
+def is_stateless(grammar: str, Tokenizer: type) -> bool:
+    for tok_def in Parser(grammar).parse().token_definitions:
+        if tok_def.predicate is not None:
+            return False
+        if (
+            tok_def.tag is not None
+            and getattr(Tokenizer, tok_def.tag.name.name)
+            is not BaseTokenizer.ignore
+        ):
+            return False
+    return True
+
+def init_tokenizer(grammar: str, options: dict) -> None:
+    global worker_tokenizer
+    worker_tokenizer = make_tokenizer(grammar, **options)
+
+def lex_chunk(task: tuple) -> tuple[array.array, ...] | None:
+    # returns the kinds, starts and ends of the tokens that start before
+    # stop, with offsets into the whole code, or None if the first chunk
+    # does not lex (its tokens are used without lining them up)
+    text, offset, stop = task
+    tokenizer = worker_tokenizer(text)
+    pos = 0
+    while True:
+        try:
+            buffer = tokenizer.token_buffer(pos, stop - offset)
+            break
+        except TokenError as e:
+            if offset == 0:
+                return None
+            pos = e.pos + 1
+    count = bisect.bisect_left(buffer.starts, stop - offset)
+    return (
+        buffer.kinds[:count],
+        array.array('q', [start + offset for start in buffer.starts[:count]]),
+        array.array('q', [end + offset for end in buffer.ends[:count]]),
+    )
+
+def stitch(
+    tokenizer: BaseTokenizer,
+    chunks: typing.Iterable[tuple[array.array, ...] | None],
+    stops: list[int],
+) -> TokenBuffer:
+    buffer = TokenBuffer(LineIndex(tokenizer.code), tokenizer.TokenKind)
+    for i, (chunk, stop) in enumerate(zip(chunks, stops)):
+        if chunk is not None:
+            # the first chunk starts at the start of the code, so all of
+            # its tokens are right
+            join = (0, 0) if i == 0 else find_join(buffer.starts, chunk[1])
+            if join is not None:
+                extend(buffer, chunk, *join)
+                continue
+        if relex(tokenizer, buffer, chunk, stop):
+            break
+    return buffer
+
+def find_join(
+    starts: array.array,
+    chunk_starts: array.array,
+) -> tuple[int, int] | None:
+    # the first offset where both the tokens so far and the chunk start a
+    # token, as an index into each
+    if not starts or not chunk_starts:
+        return None
+    index = {
+        start: i for i, start in enumerate(
+            chunk_starts[:bisect.bisect_right(chunk_starts, starts[-1])]
+        )
+    }
+    for cut in range(bisect.bisect_left(starts, chunk_starts[0]), len(starts)):
+        if starts[cut] in index:
+            return cut, index[starts[cut]]
+    return None
+
+def extend(
+    buffer: TokenBuffer,
+    chunk: tuple[array.array, ...],
+    cut: int,
+    index: int,
+) -> None:
+    # replaces the tokens from cut on with the chunk's tokens from index on
+    kinds, starts, ends = chunk
+    del buffer.kinds[cut:], buffer.starts[cut:], buffer.ends[cut:]
+    buffer.kinds.extend(kinds[index:])
+    buffer.starts.extend(starts[index:])
+    buffer.ends.extend(ends[index:])
+
+def relex(
+    tokenizer: BaseTokenizer,
+    buffer: TokenBuffer,
+    chunk: tuple[array.array, ...] | None,
+    stop: int,
+) -> bool:
+    # lexes from the start of the last token so far (the chunk that gave
+    # it may have cut it short) until a token lines up with the chunk or
+    # starts at stop. Returns whether it reached EOF.
+    pos = 0
+    if buffer.starts:
+        pos = buffer.starts.pop()
+        buffer.kinds.pop()
+        buffer.ends.pop()
+    index = {}
+    if chunk is not None:
+        index = {start: i for i, start in enumerate(chunk[1])}
+    EOF = tokenizer.TokenKind.EOF
+    for token in tokenizer.tokens(pos):
+        if token.start in index:
+            extend(buffer, chunk, len(buffer.kinds), index[token.start])
+            return False
+        if token.start >= stop:
+            return False
+        buffer.append(token.kind._value_, token.start, token.end)
+        if token.kind is EOF:
+            return True
+    return True
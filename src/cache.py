@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import hashlib
+import importlib.util
+import marshal
+import os
+import tempfile
+import types
+
+from zparse.metalang import Parser
+from zparse.compiler import generate_module, check_class_names
+
+# The on-disk cache stores the module compile_grammar would write for a
+# grammar as a marshalled code object, so a cold process only has to unmarshal
+# and exec it. The base classes are passed in when the module is run, so one
+# entry serves every base. Entries are keyed by a hash of the grammar text and
+# the options, and start with a header holding cache_version and the
+# interpreter's bytecode magic number. Entries with another header are
+# rebuilt. cache_version must be bumped whenever the generated code changes.
+
+cache_version = 7
+
+header = b'zparse' + cache_version.to_bytes(2, 'little') + importlib.util.MAGIC_NUMBER
+
+def cache_key(*parts: object) -> str:
+    data = repr((cache_version, importlib.util.MAGIC_NUMBER, *parts))
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+def load_classes(
+    cache_dir: str,
+    code: str,
+    base: type | None,
+    name: str,
+    tok_base: type,
+    tok_name: str,
+    allow_big_implicits: bool,
+    engine: str,
+    mode: str,
+    memo: str,
+    events: bool,
+    profile: bool,
+    instrument: bool,
+    with_parser: bool,
+) -> dict:
+    check_class_names(*((name, tok_name) if with_parser else (tok_name,)))
+    options = (
+        name,
+        tok_name,
+        allow_big_implicits,
+        engine,
+        mode,
+        memo,
+        events,
+        profile,
+        instrument,
+    )
+    key = cache_key(code, with_parser, *options)
+    path = os.path.join(cache_dir, f'{key}.zpc')
+    module = read_entry(path)
+    if module is None:
+        lines = generate_module(
+            Parser(code).parse(),
+            ('ParserBase', 'TokenizerBase'),
+            [],
+            *options,
+            with_parser,
+        )
+        module = compile('\n'.join(lines) + '\n', f'<{name}>', 'exec')
+        write_entry(path, module)
+    namespace = {
+        '__name__': __name__,
+        'ParserBase': base,
+        'TokenizerBase': tok_base,
+    }
+    exec(module, namespace)
+    return namespace
+
+def read_entry(path: str) -> types.CodeType | None:
+    try:
+        with open(path, 'rb') as fp:
+            data = fp.read()
+    except OSError:
+        return None
+    if not data.startswith(header):
+        return None
+    try:
+        module = marshal.loads(data[len(header):])
+    except (EOFError, ValueError, TypeError):
+        return None
+    return module if isinstance(module, types.CodeType) else None
+
+def write_entry(path: str, module: types.CodeType) -> None:
+    # the entry is written to a temporary file and renamed, so processes
+    # sharing the directory never read a partial entry. The cache is only an
+    # optimization, so failing to write it is not an error.
+    directory = os.path.dirname(path)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                fp.write(header + marshal.dumps(module))
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+    except OSError:
+        pass
@@ -0,0 +1,707 @@
+from zparse.errors import GrammarError
+from zparse.analysis import GrammarInfo, is_nullable, first_of, can_cut
+from zparse.metalang import (
+    Grammar,
+    GrammarExpr,
+    Identifier,
+    StringLiteral,
+    Cut,
+    Alias,
+    Alternative,
+    Union,
+    Concatenation,
+    Optional,
+    NongreedyOptional,
+    Plus,
+    NongreedyPlus,
+    Star,
+    NongreedyStar,
+    RuleDefinition,
+    InlineCode,
+)
+from zparse.tokenizers import get_name
+
+# Every rule is compiled into a Python function `rule_<name>(self, pos)`
+# that returns `(end, node)` on success and `None` on failure. Positions are
+# indexes into the token buffer and token kinds are compared as ints, so a
+# token test is one array lookup. Groups, repetitions and options inside a
+# rule are compiled into helper functions that return `(end, children)`,
+# where `children` is flattened into the children of the enclosing node.
+#
+# Rules are numbered in definition order. With the dense memo layout the memo
+# is a list with one row per rule, and each row is a list with one slot per
+# token position holding the rule's result there (or MISS). With the dict
+# layout the memo is one dict keyed by (rule number, position).
+#
+# Nodes are built with `self._node` and tokens are fetched with `self._tok`.
+# For Node trees these are the Node class and a function that makes token
+# views. For arena trees they add the node to the arena and return its index,
+# and turn a token position into a negative int.
+#
+# Parsers made for events collect the children of every function in a Frame
+# as they match (and clear it when an alternative fails), and keep the frames
+# of the running functions on `self._frames`. A cut commits every function on
+# that stack, so it can emit the children they have matched so far and drop
+# them.
+#
+# An alternative that ends with a code snippet (`pair: key=STRING ':' value
+# { (key.text, value) }`) is an action. Each action is compiled into a
+# function `action_<rule>_<n>(self, children, *aliases)` that evaluates the
+# snippet, and its result is used in place of the node. The aliases at the
+# top level of the alternative are bound to the token or the rule result
+# they name.
+#
+# Parsers made with profile=True count calls, memo hits, seed growing rounds
+# and failed alternatives in lists on `self._profiler`, and time every
+# evaluation of a body with its enter and exit methods. Without profile none
+# of this code is generated.
+#
+# The incremental layout uses the same rows, but an entry is a tuple
+# `(lookahead, length, node)` with `length` set to None for a failure. Both
+# numbers are relative to the entry's position, so entries after an edit stay
+# valid when the tokens before them are replaced. `lookahead` is how far past
+# the position the rule read the token kinds, which is tracked with the
+# `farthest` attribute of the kinds object: a rule sets it to its position
+# before running its body and puts back the larger of the two values after.
+
+class ParserGenerator:
+    def __init__(
+        self,
+        grammar: Grammar,
+        TokenKind: type,
+        memo: str='dense',
+        events: bool=False,
+        profile: bool=False,
+    ):
+        self.grammar = grammar
+        self.TokenKind = TokenKind
+        self.memo = memo
+        self.events = events
+        self.profile = profile
+        self.info = GrammarInfo(grammar)
+        self.rule_ids = {name: i for i, name in enumerate(self.info.rules)}
+        # rules in a left recursive cycle that are not leaders are evaluated
+        # without memoization
+        self.memoized = [
+            name not in self.info.left_recursive or name in self.info.leaders
+            for name in self.info.rules
+        ]
+        self.functions = []
+        self.helper_count = 0
+        self.action_count = 0
+        self.var_count = 0
+        self.rule = None
+        self.choice = False
+        self.dispatch = False
+    def generate(self) -> str:
+        for rule_def in self.grammar.rule_definitions:
+            self.rule = rule_def
+            self.helper_count = 0
+            self.action_count = 0
+            self.generate_rule(rule_def)
+        return '\n\n'.join(self.functions) + '\n'
+    def generate_rule(self, rule_def: RuleDefinition) -> None:
+        name = rule_def.name.name
+        rule_id = self.rule_ids[name]
+        if self.memo == 'incremental' and self.memoized[rule_id]:
+            leader = name in self.info.leaders
+            self.functions.append(
+                '\n'.join(self.incremental_rule(name, rule_id, leader))
+            )
+            self.generate_body(rule_def, ', floor' if leader else '')
+        elif name in self.info.leaders:
+            self.functions.append('\n'.join([
+                f'def rule_{name}(self, pos):',
+                *self.count('calls', rule_id),
+                *self.memo_lookup(rule_id),
+                f'    if result is not MISS:',
+                *self.count('hits', rule_id, 2),
+                f'        return result',
+                f'    # grow the seed until it stops getting longer',
+                f'    {self.memo_slot} = result = None',
+                f'    floor = -1',
+                *self.growing('+='),
+                *self.heads(name, rule_id, 'add'),
+                f'    while True:',
+                *self.count('grows', rule_id, 2),
+                *self.forget_involved(name),
+                f'        grown = body_{name}(self, pos, floor)',
+                f'        if grown is None or grown[0] <= floor:',
+                *['        ' + line for line in self.growing('-=')],
+                *['        ' + line
+                  for line in self.heads(name, rule_id, 'discard')],
+                f'            return result',
+                f'        {self.memo_slot} = result = grown',
+                f'        floor = grown[0]',
+            ]))
+            self.generate_body(rule_def, ', floor')
+        elif name in self.info.left_recursive:
+            self.generate_body(rule_def, '', f'rule_{name}')
+        else:
+            self.functions.append('\n'.join([
+                f'def rule_{name}(self, pos):',
+                *self.count('calls', rule_id),
+                *self.memo_lookup(rule_id),
+                f'    if result is MISS:',
+                f'        result = {self.memo_slot} = body_{name}(self, pos)',
+                *(['    else:', *self.count('hits', rule_id, 2)]
+                  if self.profile else []),
+                f'    return result',
+            ]))
+            self.generate_body(rule_def, '')
+    def incremental_rule(
+        self,
+        name: str,
+        rule_id: int,
+        leader: bool,
+    ) -> list[str]:
+        lines = [
+            f'def rule_{name}(self, pos):',
+            *self.count('calls', rule_id),
+            f'    memo = self._memo[{rule_id}]',
+            f'    entry = memo[pos]',
+            f'    kinds = self._kinds',
+            f'    if entry is not MISS:',
+            *self.count('hits', rule_id, 2),
+            f'        if pos + entry[0] > kinds.farthest:',
+            f'            kinds.farthest = pos + entry[0]',
+            f'        if entry[1] is None:',
+            f'            return None',
+            f'        return pos + entry[1], entry[2]',
+            f'    outer = kinds.farthest',
+            f'    kinds.farthest = pos',
+        ]
+        if not leader:
+            return lines + [
+                f'    result = body_{name}(self, pos)',
+                f'    self.remember({rule_id}, pos, result, outer)',
+                f'    return result',
+            ]
+        # the seeds are stored without a lookahead, and the lookahead of
+        # every round is recorded once the rule stops growing
+        return lines + [
+            f'    memo[pos] = (0, None, None)',
+            f'    result = None',
+            f'    floor = -1',
+            *self.growing('+='),
+            *self.heads(name, rule_id, 'add'),
+            f'    while True:',
+            *self.count('grows', rule_id, 2),
+            *self.forget_involved(name),
+            f'        grown = body_{name}(self, pos, floor)',
+            f'        if grown is None or grown[0] <= floor:',
+            *['        ' + line for line in self.growing('-=')],
+            *['        ' + line
+              for line in self.heads(name, rule_id, 'discard')],
+            f'            self.remember({rule_id}, pos, result, outer)',
+            f'            return result',
+            f'        memo[pos] = (0, grown[0] - pos, grown[1])',
+            f'        result = grown',
+            f'        floor = grown[0]',
+        ]
+    def forget_involved(self, name: str) -> list[str]:
+        # the results of the other leaders of the component at pos were
+        # computed with the previous seed of this rule, so they are evaluated
+        # again in every round, unless they are growing further up the stack
+        lines = []
+        for other in self.info.involved.get(name, ()):
+            other_id = self.rule_ids[other]
+            lines.append(
+                f'        if ({other_id}, pos) not in self._heads:'
+            )
+            if self.memo == 'dict':
+                lines.append(
+                    f'            self._memo.pop(({other_id}, pos), None)'
+                )
+            else:
+                lines.append(f'            self._memo[{other_id}][pos] = MISS')
+        return lines
+    def heads(self, name: str, rule_id: int, op: str) -> list[str]:
+        if name not in self.info.involved:
+            return []
+        return [f'    self._heads.{op}(({rule_id}, pos))']
+    def growing(self, op: str) -> list[str]:
+        # cuts do not commit while a left recursive rule is growing, because
+        # the next round reparses from the start of the rule
+        if not self.info.has_cuts:
+            return []
+        return [f'    self._growing {op} 1']
+    def memo_lookup(self, rule_id: int) -> list[str]:
+        if self.memo == 'dict':
+            return [
+                f'    memo = self._memo',
+                f'    key = ({rule_id}, pos)',
+                f'    result = memo.get(key, MISS)',
+            ]
+        return [
+            f'    memo = self._memo[{rule_id}]',
+            f'    result = memo[pos]',
+        ]
+    @property
+    def memo_slot(self) -> str:
+        return 'memo[key]' if self.memo == 'dict' else 'memo[pos]'
+    def generate_body(
+        self,
+        rule_def: RuleDefinition,
+        extra_params: str,
+        func_name: str=None,
+    ) -> None:
+        name = rule_def.name.name
+        rule_id = self.rule_ids[name]
+        # bodies that are called directly count their own calls
+        lines = self.count('calls', rule_id) if func_name else []
+        func_name = func_name or f'body_{name}'
+        header = [
+            f'def {func_name}(self, pos{extra_params}):',
+            f'    kinds = self._kinds',
+            f'    tok = self._tok',
+            f'    node = self._node',
+        ]
+        # the alternatives are dispatched on the kind of the first token.
+        # Cuts can mask tokens in the middle of a rule, so then every test
+        # reads the kinds again.
+        self.choice = len(rule_def.alternatives) > 1
+        self.dispatch = self.choice and not self.info.has_cuts
+        if self.dispatch:
+            lines.append('    kind = kinds[pos]')
+        for i, alt in enumerate(rule_def.alternatives):
+            if self.events and i > 0:
+                lines.append('    frame.clear()')
+            lines.extend(self.alternative(name, alt, bool(extra_params)))
+            lines.extend(self.count(f'failed[{rule_id}]', i))
+        lines.append('    return None')
+        self.choice = self.dispatch = False
+        lines = self.timed(lines, rule_id)
+        self.functions.append('\n'.join(self.framed(header, lines, name)))
+    def count(self, counter: str, index: int, indent: int=1) -> list[str]:
+        if not self.profile:
+            return []
+        return ['    ' * indent + f'self._profiler.{counter}[{index}] += 1']
+    def timed(self, lines: list[str], rule_id: int) -> list[str]:
+        if not self.profile:
+            return lines
+        return [
+            f'    profiler = self._profiler',
+            f'    profiler.enter({rule_id})',
+            f'    try:',
+            *['    ' + line for line in lines],
+            f'    finally:',
+            f'        profiler.exit({rule_id})',
+        ]
+    def framed(
+        self,
+        header: list[str],
+        lines: list[str],
+        name: str | None,
+    ) -> list[str]:
+        # in events mode the function's frame is on the stack while it runs
+        if not self.events:
+            return header + lines
+        return [
+            *header,
+            f'    frames = self._frames',
+            f'    frame = Frame({name!r})',
+            f'    frames.append(frame)',
+            f'    try:',
+            *['    ' + line for line in lines],
+            f'    finally:',
+            f'        frames.pop()',
+        ]
+    def alternative(
+        self,
+        name: str,
+        alt: Alternative,
+        grows: bool,
+    ) -> list[str]:
+        lines = []
+        indent = 1
+        exprs = items(alt.value)
+        self.check_aliases(alt, exprs)
+        if (
+            self.choice
+            and is_nullable(exprs[0], self.info.nullable)
+            and not is_nullable(alt.value, self.info.nullable)
+        ):
+            # the first call can match nothing, so check the alternative's
+            # FIRST set up front
+            test = self.first_test(alt.value, 'pos')
+            lines.append('    ' * indent + f'if {test}:')
+            indent += 1
+        if alt.predicate is not None:
+            source = code_source(alt.predicate.code, 'predicate')
+            lines.append('    ' * indent + f'if ({source}):')
+            indent += 1
+        action = None
+        aliases = {}
+        if alt.code is not None:
+            if self.events:
+                raise GrammarError(
+                    'parsers made for events cannot have actions',
+                    (alt.code.token,),
+                )
+            action = self.action(name, alt.code, exprs)
+        def finish(end, children, indent):
+            if self.events:
+                node = f'node({name!r}, frame)'
+            elif action is not None:
+                values = [
+                    children[value] if isinstance(value, int) else value
+                    for value in aliases.values()
+                ]
+                node = (
+                    f'{action}(self, [{", ".join(children)}]'
+                    + ''.join(f', {value}' for value in values) + ')'
+                )
+            else:
+                node = f'node({name!r}, [{", ".join(children)}])'
+            if alt.tag is not None:
+                if self.events:
+                    raise GrammarError(
+                        'parsers made for events cannot have rule tags',
+                        (alt.tag.name,),
+                    )
+                node = f'self.{alt.tag.name.name}({node})'
+            out = []
+            if grows:
+                out.append('    ' * indent + f'if {end} > floor:')
+                indent += 1
+            out.append('    ' * indent + f'return {end}, {node}')
+            return out
+        lines.extend(self.sequence(exprs, 'pos', indent, finish, aliases))
+        return lines
+    def check_aliases(
+        self,
+        alt: Alternative,
+        exprs: list[GrammarExpr],
+    ) -> None:
+        # aliases are only bound as the parameters of actions, so anywhere
+        # else they would be silently ignored
+        for expr in exprs:
+            if alt.code is not None and alias_of(expr) is not None:
+                continue
+            alias = find_alias(expr)
+            if alias is None:
+                continue
+            if alt.code is None:
+                raise GrammarError(
+                    'aliases can only be used in alternatives with actions',
+                    (alias.alias.token,),
+                )
+            raise GrammarError(
+                'aliases must be at the top level of an alternative',
+                (alias.alias.token,),
+            )
+    def action(
+        self,
+        name: str,
+        code: InlineCode,
+        exprs: list[GrammarExpr],
+    ) -> str:
+        params = ['self', 'children']
+        for expr in exprs:
+            alias = alias_of(expr)
+            if alias is not None:
+                if alias.name in params[:2]:
+                    raise GrammarError(
+                        f'{alias.name!r} cannot be used as an alias in '
+                        'an action',
+                        (alias.token,),
+                    )
+                if alias.name in params:
+                    raise GrammarError(
+                        f'alias {alias.name!r} is used twice',
+                        (alias.token,),
+                    )
+                params.append(alias.name)
+        source = code_source(code, 'action')
+        self.action_count += 1
+        func_name = f'action_{name}_{self.action_count}'
+        self.functions.append('\n'.join([
+            f'def {func_name}({", ".join(params)}):',
+            f'    return ({source})',
+        ]))
+        return func_name
+    def sequence(
+        self,
+        exprs: list[GrammarExpr],
+        pos: str,
+        indent: int,
+        finish: callable,
+        aliases: dict[str, int | str] | None=None,
+    ) -> list[str]:
+        # aliases is filled with the index in children of each aliased
+        # token, or the value of each aliased rule or optional item
+        lines = []
+        base, offset = pos, 0
+        children = []
+        cut_indent = None
+        for expr in exprs:
+            alias = alias_of(expr)
+            expr = self.check(expr)
+            cur = position(base, offset)
+            if isinstance(expr, Cut):
+                self.fetch_tokens(lines, indent, children)
+                lines.append('    ' * indent + f'self.cut({cur})')
+                if cut_indent is None:
+                    cut_indent, cut_pos = indent, cur
+                continue
+            if is_token(expr):
+                lines.append(
+                    '    ' * indent
+                    + f'if {self.kind_at(cur)} == {self.kind_id(expr)}:'
+                )
+                children.append(f'tok({cur})')
+                self.collect(lines, indent, f'frame.append(tok({cur}))')
+                if alias is not None and aliases is not None:
+                    aliases[alias.name] = len(children) - 1
+                offset += 1
+            elif is_rule(expr):
+                if expr.name in self.info.cutting:
+                    self.fetch_tokens(lines, indent, children)
+                var = self.new_var()
+                lines.append(
+                    '    ' * indent
+                    + f'if {self.guard(expr, cur)}'
+                    + f'({var} := rule_{expr.name}(self, {cur})) '
+                    + 'is not None:'
+                )
+                if expr.name in self.info.tagged:
+                    # tags can return None to leave the node out
+                    children.append(
+                        f'*(() if {var}[1] is None else ({var}[1],))'
+                    )
+                else:
+                    children.append(f'{var}[1]')
+                self.collect(lines, indent, f'frame.append({var}[1])')
+                if alias is not None and aliases is not None:
+                    aliases[alias.name] = f'{var}[1]'
+                base, offset = f'{var}[0]', 0
+            else:
+                if can_cut(expr, self.info.cutting):
+                    self.fetch_tokens(lines, indent, children)
+                var = self.new_var()
+                helper = self.helper(expr)
+                lines.append(
+                    '    ' * indent
+                    + f'if {self.guard(expr, cur)}'
+                    + f'({var} := {helper}(self, {cur})) is not None:'
+                )
+                children.append(f'*{var}[1]')
+                self.collect(lines, indent, f'frame.extend({var}[1])')
+                if alias is not None and aliases is not None:
+                    aliases[alias.name] = (
+                        f'({var}[1][0] if {var}[1] else None)'
+                    )
+                base, offset = f'{var}[0]', 0
+            indent += 1
+        lines.extend(finish(position(base, offset), children, indent))
+        if cut_indent is not None:
+            # the alternative cannot fail once it is past a cut
+            lines.append(
+                '    ' * cut_indent
+                + f'self.fail_after_cut({cut_pos})'
+            )
+        return lines
+    def fetch_tokens(
+        self,
+        lines: list[str],
+        indent: int,
+        children: list[str],
+    ) -> None:
+        # a cut, here or in a rule that is called next, can drop the tokens
+        # before it, so they are fetched first (frames already hold them)
+        if self.events:
+            return
+        for i, child in enumerate(children):
+            if child.startswith('tok('):
+                var = self.new_var()
+                lines.append('    ' * indent + f'{var} = {child}')
+                children[i] = var
+    def collect(self, lines: list[str], indent: int, line: str) -> None:
+        if self.events:
+            lines.append('    ' * (indent + 1) + line)
+    def helper(self, expr: GrammarExpr) -> str:
+        saved = self.choice, self.dispatch
+        self.choice = isinstance(expr, (Union, Optional))
+        self.dispatch = False
+        self.helper_count += 1
+        name = f'sub_{self.rule.name.name}_{self.helper_count}'
+        header = [
+            f'def {name}(self, pos):',
+            f'    kinds = self._kinds',
+            f'    tok = self._tok',
+        ]
+        lines = []
+        def finish(end, children, indent):
+            if self.events:
+                return ['    ' * indent + f'return {end}, frame']
+            return ['    ' * indent + f'return {end}, [{", ".join(children)}]']
+        if isinstance(expr, Union):
+            for i, value in enumerate(expr.values):
+                if self.events and i > 0:
+                    lines.append('    frame.clear()')
+                lines.extend(self.sequence(items(value), 'pos', 1, finish))
+            lines.append('    return None')
+        elif isinstance(expr, Concatenation):
+            lines.extend(self.sequence(expr.values, 'pos', 1, finish))
+            lines.append('    return None')
+        elif isinstance(expr, Optional):
+            lines.extend(self.sequence(items(expr.value), 'pos', 1, finish))
+            if self.events:
+                lines.extend(['    frame.clear()', '    return pos, frame'])
+            else:
+                lines.append('    return pos, []')
+        elif isinstance(expr, (Star, Plus)):
+            inner = self.check(expr.value)
+            if is_token(inner):
+                step = [
+                    f'    while kinds[pos] == {self.kind_id(inner)}:',
+                    f'        children.append(tok(pos))',
+                    f'        pos += 1',
+                ]
+            else:
+                if is_rule(inner) and inner.name in self.info.tagged:
+                    call = f'rule_{inner.name}'
+                    add = [
+                        'if r[1] is not None:',
+                        '    children.append(r[1])',
+                    ]
+                elif is_rule(inner):
+                    call, add = f'rule_{inner.name}', ['children.append(r[1])']
+                else:
+                    call, add = self.helper(inner), ['children.extend(r[1])']
+                self.choice = True
+                step = [
+                    f'    while {self.guard(inner, "pos")}'
+                    + f'(r := {call}(self, pos)) is not None:',
+                    *['        ' + line for line in add],
+                    f'        if r[0] == pos:',
+                    f'            break',
+                    f'        pos = r[0]',
+                ]
+            if self.events:
+                lines.append('    children = frame')
+            else:
+                lines.append('    children = []')
+            lines.extend(step)
+            if isinstance(expr, Plus):
+                # a cut empties the frame, but only after a match
+                if self.events:
+                    lines.append('    if not children and not frame.entered:')
+                else:
+                    lines.append('    if not children:')
+                lines.append('        return None')
+            lines.append('    return pos, children')
+        else:
+            lines.extend(self.sequence([expr], 'pos', 1, finish))
+            lines.append('    return None')
+        self.functions.append('\n'.join(self.framed(header, lines, None)))
+        self.choice, self.dispatch = saved
+        return name
+    def guard(self, expr: GrammarExpr, pos: str) -> str:
+        # at choice points, calls that cannot match the current token are
+        # skipped with a FIRST set test instead of going through the memo.
+        # Anywhere else the call is expected to succeed.
+        if pos != 'pos' or not self.choice:
+            return ''
+        if is_nullable(expr, self.info.nullable):
+            return ''
+        return self.first_test(expr, pos) + ' and '
+    def first_test(self, expr: GrammarExpr, pos: str) -> str:
+        members = self.TokenKind.__members__
+        ids = sorted(
+            members[name].value
+            for name in first_of(expr, self.info.first, self.info.nullable)
+            if name in members
+        )
+        if not ids:
+            return 'False'
+        if len(ids) == 1:
+            return f'{self.kind_at(pos)} == {ids[0]}'
+        return f'{self.kind_at(pos)} in {{{", ".join(map(str, ids))}}}'
+    def kind_at(self, pos: str) -> str:
+        return 'kind' if self.dispatch and pos == 'pos' else f'kinds[{pos}]'
+    def check(self, expr: GrammarExpr) -> GrammarExpr:
+        if isinstance(expr, Alias):
+            # the alias is bound by the alternative's action
+            return self.check(expr.name)
+        if isinstance(expr, NongreedyOptional):
+            raise GrammarError(
+                'rule definitions cannot contain nongreedy operators',
+                (expr.qmark2,),
+            )
+        if isinstance(expr, (NongreedyPlus, NongreedyStar)):
+            raise GrammarError(
+                'rule definitions cannot contain nongreedy operators',
+                (expr.qmark,),
+            )
+        if is_rule(expr) and expr.name not in self.info.rules:
+            raise GrammarError(
+                f'rule {expr.name!r} is not defined',
+                (expr.token,),
+            )
+        members = self.TokenKind.__members__
+        if is_token(expr) and self.token_name(expr) not in members:
+            raise GrammarError(
+                f'token {expr.token.text} is not defined',
+                (expr.token,),
+            )
+        return expr
+    def kind_id(self, expr: GrammarExpr) -> int:
+        return self.TokenKind[self.token_name(expr)].value
+    def token_name(self, expr: GrammarExpr) -> str:
+        if isinstance(expr, StringLiteral):
+            return get_name(expr.value)
+        return expr.name
+    def new_var(self) -> str:
+        self.var_count += 1
+        return f'r{self.var_count}'
+
+def code_source(code: InlineCode, what: str) -> str:
+    # snippets are checked here, so that a bad one raises a GrammarError
+    # when the class is made instead of a SyntaxError in the generated code
+    source = code.token.text[1:-1].strip()
+    try:
+        compile(f'({source})', f'<{what}>', 'eval')
+    except SyntaxError:
+        raise GrammarError(f'invalid {what} {source!r}', (code.token,))
+    return source
+
+def alias_of(expr: GrammarExpr) -> Identifier | None:
+    # the alias of an aliased token or rule, which can be optional
+    if isinstance(expr, Optional):
+        expr = expr.value
+    if isinstance(expr, Alias):
+        return expr.alias
+    return None
+
+def find_alias(expr: GrammarExpr) -> Alias | None:
+    if isinstance(expr, Alias):
+        return expr
+    elif isinstance(expr, (Union, Concatenation)):
+        for value in expr.values:
+            alias = find_alias(value)
+            if alias is not None:
+                return alias
+    elif isinstance(expr, (Optional, Plus, Star)):
+        return find_alias(expr.value)
+    return None
+
+def items(expr: GrammarExpr) -> list[GrammarExpr]:
+    if isinstance(expr, Concatenation):
+        return expr.values
+    return [expr]
+
+def is_token(expr: GrammarExpr) -> bool:
+    return (
+        isinstance(expr, StringLiteral)
+        or isinstance(expr, Identifier) and expr.is_token()
+    )
+
+def is_rule(expr: GrammarExpr) -> bool:
+    return isinstance(expr, Identifier) and expr.is_rule()
+
+def position(base: str, offset: int) -> str:
+    if offset == 0:
+        return base
+    return f'{base} + {offset}'
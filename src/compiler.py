@@ -0,0 +1,285 @@
+from __future__ import annotations
+
+import enum
+
+from zparse.errors import GrammarError
+from zparse.metalang import Parser, Grammar
+from zparse.codegen import ParserGenerator
+from zparse.dfa import make_dfa
+from zparse.tokenizers import (
+    BaseTokenizer,
+    make_TokenKind,
+    make_regex,
+    make_token_exprs,
+    check_for_illegal_token_names,
+    check_for_illegal_tag_names,
+    engines,
+    modes,
+)
+from zparse.parsers import (
+    BaseParser,
+    parser_tables,
+    check_for_illegal_rule_tags,
+    memos,
+)
+
+# Ahead-of-time compilation writes everything make_tokenizer and make_parser
+# build from a grammar into the source of a standalone module: a static
+# TokenKind enum, the token regexes (and the DFA tables), the generated rule
+# functions and the parser's class attributes as literals. Importing the
+# module only compiles the regexes and creates the classes.
+
+# names the generated module defines besides the two classes
+module_names = [
+    'enum',
+    're',
+    'zparse',
+    'Node',
+    'MISS',
+    'Frame',
+    'TokenKind',
+    'token_info',
+    'token_table',
+    'dfa',
+    'scanner',
+    'stats',
+    'ParserBase',
+    'TokenizerBase',
+]
+
+def compile_grammar(
+    code: str,
+    base: type=BaseParser,
+    name: str='Parser',
+    tok_base: type=BaseTokenizer,
+    tok_name: str='Tokenizer',
+    allow_big_implicits: bool=False,
+    engine: str='regex',
+    mode: str='text',
+    memo: str='dense',
+    events: bool=False,
+    profile: bool=False,
+    instrument: bool=False,
+) -> str:
+    if not issubclass(base, BaseParser):
+        raise ValueError('base must subclass parsers.BaseParser')
+    check_options(
+        tok_base,
+        name,
+        tok_name,
+        engine,
+        mode,
+        memo,
+        events,
+        instrument,
+    )
+    grammar = Parser(code).parse()
+    lines = generate_module(
+        grammar,
+        (class_path(base), class_path(tok_base)),
+        import_lines(base, tok_base),
+        name,
+        tok_name,
+        allow_big_implicits,
+        engine,
+        mode,
+        memo,
+        events,
+        profile,
+        instrument,
+        bool(grammar.rule_definitions),
+    )
+    return '\n'.join(lines) + '\n'
+
+def check_options(
+    tok_base: type,
+    name: str,
+    tok_name: str,
+    engine: str,
+    mode: str,
+    memo: str,
+    events: bool=False,
+    instrument: bool=False,
+) -> None:
+    if not issubclass(tok_base, BaseTokenizer):
+        raise ValueError('tok_base must subclass tokenizers.BaseTokenizer')
+    if engine not in engines:
+        raise ValueError(f'engine must be one of {", ".join(engines)}')
+    if mode not in modes:
+        raise ValueError(f'mode must be one of {", ".join(modes)}')
+    if memo not in memos:
+        raise ValueError(f'memo must be one of {", ".join(memos)}')
+    if events and memo == 'incremental':
+        raise ValueError('events cannot be used with the incremental memo')
+    if instrument and engine != 'regex':
+        raise ValueError('instrument can only be used with the regex engine')
+    check_class_names(name, tok_name)
+
+def check_class_names(*names: str) -> None:
+    for class_name in names:
+        if not class_name.isidentifier() or class_name in module_names:
+            raise ValueError(f'{class_name!r} cannot be used as a class name')
+    if len(set(names)) != len(names):
+        raise ValueError('name and tok_name must be different')
+
+def generate_module(
+    grammar: Grammar,
+    bases: tuple[str, str],
+    imports: list[str],
+    name: str,
+    tok_name: str,
+    allow_big_implicits: bool,
+    engine: str,
+    mode: str,
+    memo: str,
+    events: bool,
+    profile: bool,
+    instrument: bool,
+    with_parser: bool,
+) -> list[str]:
+    # bases are the expressions the module uses for the parser and tokenizer
+    # base classes, and imports are the lines that make them available
+    check_for_illegal_token_names(grammar)
+    check_for_illegal_tag_names(grammar, BaseTokenizer)
+    if with_parser:
+        if not grammar.rule_definitions:
+            raise GrammarError('grammar does not define any rules')
+        check_for_illegal_rule_tags(grammar)
+    binary = mode == 'bytes'
+    TokenKind = make_TokenKind(grammar, allow_big_implicits)
+    lines = [
+        '# generated by zparse, do not edit',
+        'import enum',
+        'import re',
+        '',
+        'import zparse.dfa',
+        'import zparse.tokenizers',
+        'import zparse.parsers',
+        'from zparse.parsers import Node, MISS, Frame',
+        *imports,
+        '',
+        'class TokenKind(enum.Enum):',
+        *(f'    {kind.name} = {kind.value!r}' for kind in TokenKind),
+        '',
+        *tokenizer_lines(grammar, bases[1], tok_name, allow_big_implicits,
+                         engine, binary, instrument),
+    ]
+    if with_parser:
+        lines.extend(['', *parser_lines(grammar, bases[0], name, tok_name,
+                                         TokenKind, memo, events, profile)])
+    return lines
+
+def import_lines(*bases: type) -> list[str]:
+    modules = {'zparse.dfa', 'zparse.tokenizers', 'zparse.parsers'}
+    out = []
+    for base in bases:
+        if base.__module__ not in modules:
+            modules.add(base.__module__)
+            out.append(f'import {base.__module__}')
+    return out
+
+def class_path(cls: type) -> str:
+    if '<locals>' in cls.__qualname__ or cls.__module__ == '__main__':
+        raise ValueError(
+            f'{cls.__qualname__} must be importable to compile a grammar',
+        )
+    return f'{cls.__module__}.{cls.__qualname__}'
+
+def tokenizer_lines(
+    grammar: Grammar,
+    tok_base: str,
+    tok_name: str,
+    allow_big_implicits: bool,
+    engine: str,
+    binary: bool,
+    instrument: bool=False,
+) -> list[str]:
+    token_info = make_regex(grammar, allow_big_implicits, binary)
+    lines = ['token_info = [']
+    for kind, regex, tag, predicate in token_info:
+        lines.append(
+            f'    ({kind!r}, re.compile({regex.pattern!r}), {tag!r}, '
+            f'{predicate!r}),'
+        )
+    lines.extend([
+        ']',
+        'token_table = zparse.tokenizers.make_token_table(token_info, '
+        'TokenKind)',
+    ])
+    stats = ''
+    if instrument:
+        lines.append(
+            'scanner, stats = zparse.tokenizers.instrumented_scanner('
+            'token_table)',
+        )
+        stats = ', stats'
+    elif engine == 'dfa':
+        dfa = make_dfa(
+            make_token_exprs(grammar, token_info, allow_big_implicits),
+            {
+                frag.name.name: frag.value
+                for frag in grammar.fragment_definitions
+            },
+            binary,
+        )
+        lines.extend([
+            'dfa = zparse.dfa.DFA(',
+            f'    {dfa.table!r},',
+            f'    {dfa.accepts!r},',
+            f'    {dfa.start!r},',
+            f'    {dfa.class_count!r},',
+            f'    {dfa.boundaries!r},',
+            f'    {dfa.interval_classes!r},',
+            ')',
+            'scanner = zparse.tokenizers.dfa_scanner(token_table, dfa)',
+        ])
+    else:
+        lines.append(
+            'scanner = zparse.tokenizers.regex_scanner(token_table)',
+        )
+    lines.append(
+        f'{tok_name} = zparse.tokenizers.build_class({tok_name!r}, '
+        f'{tok_base}, TokenKind, scanner, {binary!r}{stats})',
+    )
+    return lines
+
+def parser_lines(
+    grammar: Grammar,
+    base: str,
+    name: str,
+    tok_name: str,
+    TokenKind: type,
+    memo: str,
+    events: bool,
+    profile: bool,
+) -> list[str]:
+    generator = ParserGenerator(grammar, TokenKind, memo, events, profile)
+    source = generator.generate()
+    start = grammar.rule_definitions[0].name.name
+    lines = [source, f'class {name}({base}):']
+    lines.append(f'    Tokenizer = {tok_name}')
+    lines.append(f'    start_rule = rule_{start}')
+    lines.append('    source = None')
+    lines.append('    info = None')
+    for attr, value in parser_tables(generator, TokenKind).items():
+        lines.append(f'    {attr} = {literal(value)}')
+    return lines
+
+def literal(value: object) -> str:
+    # repr, except that token kinds are written as TokenKind members and
+    # sets of them are sorted so the output does not depend on hashing
+    if isinstance(value, enum.Enum):
+        return f'TokenKind.{value.name}'
+    elif isinstance(value, frozenset):
+        if not value:
+            return 'frozenset()'
+        kinds = sorted(value, key=lambda kind: kind.value)
+        return f'frozenset({{{", ".join(map(literal, kinds))}}})'
+    elif isinstance(value, dict):
+        items = (f'{key!r}: {literal(v)}' for key, v in value.items())
+        return f'{{{", ".join(items)}}}'
+    elif isinstance(value, list):
+        return f'[{", ".join(map(literal, value))}]'
+    elif isinstance(value, (str, int, bool, type(None))):
+        return repr(value)
+    assert False, f'unexpected value {value!r}'
@@ -0,0 +1,363 @@
+import bisect
+
+from zparse.errors import GrammarError
+from zparse.metalang import (
+    GrammarExpr,
+    Identifier,
+    StringLiteral,
+    Range,
+    Any,
+    Union,
+    Concatenation,
+    Optional,
+    NongreedyOptional,
+    Plus,
+    NongreedyPlus,
+    Star,
+    NongreedyStar,
+    max_char,
+    utf8_sequences,
+)
+
+# The DFA engine compiles every token definition and implicit literal into
+# one automaton. Characters are first split into the elementary intervals
+# induced by all the ranges in the grammar, the subset construction runs
+# over those intervals, and after minimization intervals with identical
+# transition columns are merged into character classes. Transitions live in
+# a flat list indexed by `state + class` where `state` is premultiplied by
+# the number of classes, and state 0 is the dead state. In binary mode the
+# automaton runs over the UTF-8 encoded bytes instead of code points.
+
+class NFA:
+    def __init__(self, binary: bool=False):
+        self.binary = binary
+        self.epsilons = []
+        self.edges = []
+        self.accepts = {}
+    def add_state(self) -> int:
+        self.epsilons.append([])
+        self.edges.append([])
+        return len(self.edges) - 1
+    def add_edge(self, src: int, low: int, high: int, dst: int) -> None:
+        self.edges[src].append((low, high, dst))
+    def add_epsilon(self, src: int, dst: int) -> None:
+        self.epsilons[src].append(dst)
+    def add_string(self, value: str) -> tuple[int, int]:
+        start = cur = self.add_state()
+        for c in value.encode('utf-8') if self.binary else map(ord, value):
+            nxt = self.add_state()
+            self.add_edge(cur, c, c, nxt)
+            cur = nxt
+        return start, cur
+    def add_range(self, low: int, high: int) -> tuple[int, int]:
+        start, end = self.add_state(), self.add_state()
+        if not self.binary:
+            self.add_edge(start, low, high, end)
+            return start, end
+        for sequence in utf8_sequences(low, high):
+            cur = start
+            for i, (lo, hi) in enumerate(sequence):
+                nxt = end if i == len(sequence) - 1 else self.add_state()
+                self.add_edge(cur, lo, hi, nxt)
+                cur = nxt
+        return start, end
+    def add_expr(
+        self,
+        expr: GrammarExpr,
+        fragments: dict[str, GrammarExpr],
+    ) -> tuple[int, int]:
+        if isinstance(expr, StringLiteral):
+            return self.add_string(expr.value)
+        elif isinstance(expr, Identifier):
+            if expr.name not in fragments:
+                raise GrammarError(
+                    f'fragment {expr.name!r} is not defined',
+                    (expr,),
+                )
+            return self.add_expr(fragments[expr.name], fragments)
+        elif isinstance(expr, Range):
+            low, high = ord(expr.low.value), ord(expr.high.value)
+            if high < low:
+                low, high = high, low
+            return self.add_range(low, high)
+        elif isinstance(expr, Any):
+            start, end = self.add_state(), self.add_state()
+            for low, high in [(0, ord('\n') - 1), (ord('\n') + 1, max_char)]:
+                s, e = self.add_range(low, high)
+                self.add_epsilon(start, s)
+                self.add_epsilon(e, end)
+            return start, end
+        elif isinstance(expr, Union):
+            start, end = self.add_state(), self.add_state()
+            for value in expr.values:
+                s, e = self.add_expr(value, fragments)
+                self.add_epsilon(start, s)
+                self.add_epsilon(e, end)
+            return start, end
+        elif isinstance(expr, Concatenation):
+            start = cur = self.add_state()
+            for value in expr.values:
+                s, e = self.add_expr(value, fragments)
+                self.add_epsilon(cur, s)
+                cur = e
+            return start, cur
+        elif isinstance(expr, Optional):
+            start, end = self.add_expr(expr.value, fragments)
+            self.add_epsilon(start, end)
+            return start, end
+        elif isinstance(expr, Plus):
+            start, end = self.add_expr(expr.value, fragments)
+            self.add_epsilon(end, start)
+            return start, end
+        elif isinstance(expr, Star):
+            s, e = self.add_expr(expr.value, fragments)
+            start = self.add_state()
+            self.add_epsilon(start, s)
+            self.add_epsilon(e, start)
+            return start, start
+        elif isinstance(expr, NongreedyOptional):
+            raise GrammarError(
+                'the dfa engine does not support nongreedy operators',
+                (expr.qmark2,),
+            )
+        elif isinstance(expr, (NongreedyPlus, NongreedyStar)):
+            raise GrammarError(
+                'the dfa engine does not support nongreedy operators',
+                (expr.qmark,),
+            )
+        assert False, f'unexpected expression {expr!r}'
+    def closure(self, states: set[int]) -> frozenset[int]:
+        out = set(states)
+        stack = list(states)
+        while stack:
+            for dst in self.epsilons[stack.pop()]:
+                if dst not in out:
+                    out.add(dst)
+                    stack.append(dst)
+        return frozenset(out)
+
+class DFA:
+    def __init__(
+        self,
+        table: list[int],
+        accepts: list[tuple[int, ...]],
+        start: int,
+        class_count: int,
+        boundaries: list[int],
+        interval_classes: list[int],
+    ):
+        self.table = table
+        self.accepts = accepts
+        self.start = start
+        self.class_count = class_count
+        self.boundaries = boundaries
+        self.interval_classes = interval_classes
+        self.classes = {}
+    def __repr__(self):
+        return (
+            f'DFA({len(self.table) // self.class_count} states, '
+            f'{self.class_count} classes)'
+        )
+    def char_class(self, c: str | int) -> int:
+        # binary inputs are indexed as ints, text inputs as one char strings
+        cls = self.classes.get(c)
+        if cls is None:
+            point = c if isinstance(c, int) else ord(c)
+            i = bisect.bisect_right(self.boundaries, point) - 1
+            cls = self.classes[c] = self.interval_classes[i]
+        return cls
+    def longest_match(
+        self,
+        code: str,
+        pos: int,
+        endpos: int,
+    ) -> tuple[int, tuple[int, ...], int]:
+        # the returned state is 0 unless the scan reached endpos while the
+        # match could still be extended
+        table = self.table
+        accepts = self.accepts
+        classes = self.classes
+        char_class = self.char_class
+        state = self.start
+        last_end = pos
+        last_accept = None
+        i = pos
+        while i < endpos:
+            c = code[i]
+            cls = classes.get(c)
+            if cls is None:
+                cls = char_class(c)
+            state = table[state + cls]
+            if not state:
+                break
+            i += 1
+            accept = accepts[state]
+            if accept is not None:
+                last_end = i
+                last_accept = accept
+        return last_end, last_accept, state
+    def matches(
+        self,
+        code: str,
+        pos: int,
+        endpos: int,
+    ) -> tuple[list[tuple[int, tuple[int, ...]]], int]:
+        table = self.table
+        accepts = self.accepts
+        char_class = self.char_class
+        state = self.start
+        out = []
+        i = pos
+        while i < endpos:
+            state = table[state + char_class(code[i])]
+            if not state:
+                break
+            i += 1
+            if accepts[state] is not None:
+                out.append((i, accepts[state]))
+        return out, state
+
+def make_dfa(
+    token_exprs: list[GrammarExpr | str],
+    fragments: dict[str, GrammarExpr],
+    binary: bool=False,
+) -> DFA:
+    nfa = NFA(binary)
+    nfa_start = nfa.add_state()
+    for index, expr in enumerate(token_exprs):
+        if isinstance(expr, str):
+            start, end = nfa.add_string(expr)
+        else:
+            start, end = nfa.add_expr(expr, fragments)
+        nfa.add_epsilon(nfa_start, start)
+        nfa.accepts.setdefault(end, []).append(index)
+    boundaries = get_boundaries(nfa, 0xFF if binary else max_char)
+    transitions, accepts = subset_construction(nfa, nfa_start, boundaries)
+    transitions, accepts, start = minimize(transitions, accepts)
+    return compress(transitions, accepts, start, boundaries)
+
+def get_boundaries(nfa: NFA, top: int) -> list[int]:
+    points = {0, top + 1}
+    for edges in nfa.edges:
+        for low, high, _ in edges:
+            points.add(low)
+            points.add(high + 1)
+    return sorted(points)
+
+def subset_construction(
+    nfa: NFA,
+    nfa_start: int,
+    boundaries: list[int],
+) -> tuple[list[list[int]], list[tuple[int, ...]]]:
+    interval_count = len(boundaries) - 1
+    edge_intervals = [
+        [
+            (
+                bisect.bisect_left(boundaries, low),
+                bisect.bisect_left(boundaries, high + 1),
+                dst,
+            )
+            for low, high, dst in edges
+        ]
+        for edges in nfa.edges
+    ]
+    dead = frozenset()
+    ids = {dead: 0, nfa.closure({nfa_start}): 1}
+    sets = list(ids)
+    transitions = [[0] * interval_count]
+    accepts = [None]
+    i = 1
+    while i < len(sets):
+        states = sets[i]
+        moves = [set() for _ in range(interval_count)]
+        for state in states:
+            for low, high, dst in edge_intervals[state]:
+                for k in range(low, high):
+                    moves[k].add(dst)
+        cache = {}
+        row = []
+        for move in moves:
+            key = frozenset(move)
+            if key not in cache:
+                target = nfa.closure(move) if move else dead
+                if target not in ids:
+                    ids[target] = len(sets)
+                    sets.append(target)
+                cache[key] = ids[target]
+            row.append(cache[key])
+        transitions.append(row)
+        accept = sorted(
+            index
+            for state in states
+            for index in nfa.accepts.get(state, ())
+        )
+        accepts.append(tuple(accept) if accept else None)
+        i += 1
+    return transitions, accepts
+
+def minimize(
+    transitions: list[list[int]],
+    accepts: list[tuple[int, ...]],
+) -> tuple[list[list[int]], list[tuple[int, ...]], int]:
+    labels = {}
+    blocks = [labels.setdefault(accept, len(labels)) for accept in accepts]
+    count = len(labels)
+    while True:
+        signatures = {}
+        new_blocks = [
+            signatures.setdefault(
+                (blocks[s], tuple(blocks[t] for t in transitions[s])),
+                len(signatures),
+            )
+            for s in range(len(transitions))
+        ]
+        if len(signatures) == count:
+            break
+        blocks = new_blocks
+        count = len(signatures)
+    # renumber so that the dead state is 0 and the start state is 1
+    order = {blocks[0]: 0}
+    for s in range(len(transitions)):
+        order.setdefault(blocks[s], len(order))
+    new_transitions = [None] * count
+    new_accepts = [None] * count
+    for s in range(len(transitions)):
+        b = order[blocks[s]]
+        if new_transitions[b] is None:
+            new_transitions[b] = [order[blocks[t]] for t in transitions[s]]
+            new_accepts[b] = accepts[s]
+    return new_transitions, new_accepts, order[blocks[1]]
+
+def compress(
+    transitions: list[list[int]],
+    accepts: list[tuple[int, ...]],
+    start: int,
+    boundaries: list[int],
+) -> DFA:
+    columns = {}
+    interval_classes = [
+        columns.setdefault(
+            tuple(row[k] for row in transitions),
+            len(columns),
+        )
+        for k in range(len(boundaries) - 1)
+    ]
+    class_count = len(columns)
+    table = []
+    flat_accepts = []
+    class_columns = list(columns)
+    for s in range(len(transitions)):
+        table.extend(
+            class_columns[cls][s] * class_count
+            for cls in range(class_count)
+        )
+        flat_accepts.append(accepts[s])
+        flat_accepts.extend([None] * (class_count - 1))
+    return DFA(
+        table,
+        flat_accepts,
+        start * class_count,
+        class_count,
+        boundaries[:-1],
+        interval_classes,
+    )
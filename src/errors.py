@@ -6,8 +6,9 @@ class GrammarError(Exception):
         self.tokens = tokens
 
 class TokenError(Exception):
-    def __init__(self, msg: str):
+    def __init__(self, msg: str, pos: int | None=None):
         self.msg = msg
+        self.pos = pos
 
 class ParseError(Exception):
     def __init__(self, msg: str, tokens: tuple[Token]=()):
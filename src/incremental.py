@@ -0,0 +1,228 @@
+from __future__ import annotations
+
+import array
+import typing
+
+from zparse.errors import TokenError
+from zparse.lines import LineIndex
+from zparse.tokenizers import Token
+from zparse.parsers import BaseParser, FarthestKinds, MISS
+
+# An incremental parser keeps its tokens and its memo between parses. An edit
+# re-lexes the text around it until the new tokens line up with the old ones
+# again, and the tokens in between are spliced out of the token list, the
+# kinds and every memo row. With the incremental memo layout, entries store
+# their length and lookahead relative to their position, so the entries
+# after the edit move with the splice and stay valid. Entries before the edit
+# are dropped if their lookahead reaches the replaced tokens.
+#
+# Token offsets after the last edit are stored relative to the end of the
+# code, so an edit does not have to update the offsets of every token after
+# it. Only the tokens between the previous edit and the new one are
+# converted.
+
+# entries that look further ahead than this are kept in a set, and the rest
+# are found by scanning back this many positions from an edit
+short_lookahead = 256
+
+class EditToken(Token):
+    __slots__ = ()
+    # offsets below zero are relative to one past the end of the code
+    @property
+    def start(self) -> int:
+        offset = self.offset
+        if offset < 0:
+            return offset + len(self.source.code) + 1
+        return offset
+
+class IncrementalParser(BaseParser):
+    def __init__(self, code: str=''):
+        if self.memo != 'incremental':
+            raise ValueError(
+                "incremental parsers need a parser made with memo='incremental'"
+            )
+        super().__init__(code)
+        self._tokens = None
+    def parse(self) -> typing.Any:
+        if self._tokens is None:
+            self.lex()
+        return self.run(
+            FarthestKinds(self._token_kinds),
+            self._tokens.__getitem__,
+            self._rows,
+            None,
+        )
+    def lex(self) -> None:
+        source = LineIndex(self.code)
+        tokens = [
+            EditToken(token.text, token.kind, token.start, source)
+            for token in self.Tokenizer(self.code).tokens()
+        ]
+        # the extra 0 after EOF lets the generated code look one token past
+        # the end without a bounds check
+        kinds = array.array('i', [token.kind.value for token in tokens])
+        kinds.append(0)
+        self._source = source
+        self._tokens = tokens
+        self._token_kinds = kinds
+        self._rows = self.make_memo(len(kinds))
+        self._spans = array.array('i', [0]) * len(kinds)
+        self._long = set()
+        self._gap = len(tokens)
+    def edit(self, start: int, end: int, text: str) -> None:
+        if not 0 <= start <= end <= len(self.code):
+            raise ValueError('edit is out of range')
+        code = self.code[:start] + text + self.code[end:]
+        if self._tokens is None:
+            self.code = code
+            return
+        try:
+            first, last, new = self.relex(code, start, end, len(text))
+        except TokenError:
+            # the next parse lexes everything and reports the error
+            self.code = code
+            self._tokens = None
+            return
+        self.move_gap(last)
+        self.code = code
+        self._source.code = code
+        self._source.newlines = None
+        self._tokens[first:last] = new
+        self._gap = first + len(new)
+        self.splice(first, last, new)
+    def relex(
+        self,
+        code: str,
+        start: int,
+        end: int,
+        size: int,
+    ) -> tuple[int, int, list[EditToken]]:
+        # returns the old tokens [first, last) that change and the tokens
+        # that replace them. Lexing starts at the token before the first
+        # token that touches the edit (or at the start of the code), since
+        # the edit can extend that token, and stops at the first new token
+        # past the edit that starts where an old token started. The text
+        # after that is unchanged, so the rest of the tokens are too.
+        tokens = self._tokens
+        delta = size - (end - start)
+        first = self.find(lambda token: token.end >= start) - 1
+        if first < 0:
+            first, pos = 0, 0
+        else:
+            pos = tokens[first].start
+        last = self.find(lambda token: token.start >= end)
+        new = []
+        for token in self.Tokenizer(code).tokens(pos):
+            if token.start >= start + size:
+                old = token.start - delta
+                while last < len(tokens) and tokens[last].start < old:
+                    last += 1
+                if last < len(tokens) and tokens[last].start == old:
+                    break
+            new.append(EditToken(token.text, token.kind, token.start, None))
+        else:
+            last = len(tokens)
+        # tokens at either end that did not change are kept, so that fewer
+        # memo entries are dropped
+        lo = 0
+        while (
+            lo < len(new) and first < last
+            and same_token(tokens[first], new[lo], 0)
+        ):
+            first += 1
+            lo += 1
+        hi = len(new)
+        while (
+            hi > lo and first < last
+            and same_token(tokens[last - 1], new[hi - 1], delta)
+        ):
+            last -= 1
+            hi -= 1
+        new = new[lo:hi]
+        for token in new:
+            token.source = self._source
+        return first, last, new
+    def find(self, test: typing.Callable[[EditToken], bool]) -> int:
+        # the index of the first token that passes test, for a test that
+        # only passes on a suffix of the tokens
+        lo, hi = 0, len(self._tokens)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if test(self._tokens[mid]):
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo
+    def move_gap(self, index: int) -> None:
+        # makes the offsets of the tokens before index absolute and the
+        # offsets of the rest relative to the end of the code
+        tokens = self._tokens
+        length = len(self.code) + 1
+        for token in tokens[self._gap:index]:
+            token.offset += length
+        for token in tokens[index:self._gap]:
+            token.offset -= length
+        self._gap = index
+    def splice(self, first: int, last: int, new: list[EditToken]) -> None:
+        count = len(new)
+        rows = self._rows
+        spans = self._spans
+        for row in rows:
+            if row is not None:
+                row[first:last] = [MISS] * count
+        self._token_kinds[first:last] = array.array(
+            'i',
+            [token.kind.value for token in new],
+        )
+        spans[first:last] = array.array('i', [0]) * count
+        # entries before the edit that read any of the replaced tokens
+        for pos in range(max(first - short_lookahead, 0), first):
+            if spans[pos] >= first - pos:
+                for row in rows:
+                    if (
+                        row is not None and row[pos] is not MISS
+                        and row[pos][0] >= first - pos
+                    ):
+                        row[pos] = MISS
+        shift = count - (last - first)
+        long = set()
+        for rule_id, pos in self._long:
+            if pos >= last:
+                long.add((rule_id, pos + shift))
+            elif pos < first:
+                entry = rows[rule_id][pos]
+                if entry is MISS or entry[0] <= short_lookahead:
+                    continue
+                if entry[0] >= first - pos:
+                    rows[rule_id][pos] = MISS
+                else:
+                    long.add((rule_id, pos))
+        self._long = long
+    def remember(
+        self,
+        rule_id: int,
+        pos: int,
+        result: tuple | None,
+        outer: int,
+    ) -> None:
+        lookahead = self._kinds.farthest - pos
+        super().remember(rule_id, pos, result, outer)
+        if lookahead > self._spans[pos]:
+            self._spans[pos] = lookahead
+        if lookahead > short_lookahead:
+            self._long.add((rule_id, pos))
+    def cut(self, pos: int) -> None:
+        # the tokens and memo entries before a cut are kept for the next
+        # parse
+        pass
+    def find_farthest(self) -> int:
+        return self._kinds.farthest
+    def last_position(self) -> int:
+        return len(self._tokens) - 1
+
+def same_token(old: EditToken, new: EditToken, delta: int) -> bool:
+    return (
+        old.start + delta == new.start
+        and old.kind == new.kind
+        and old.text == new.text
+    )
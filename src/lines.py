@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import bisect
+import re
+
+# Tokens only store offsets. Lines and columns are resolved on demand with a
+# binary search over the offsets of every newline in the code, which are
+# found with one bulk scan the first time a position is asked for.
+
+class LineIndex:
+    def __init__(self, code: str):
+        self.code = code
+        self.newlines = None
+    def __repr__(self):
+        return f'LineIndex({len(self.code)} chars)'
+    def build(self) -> list[int]:
+        if not isinstance(self.code, str):
+            # bytes, memoryview and mmap inputs
+            newlines = [m.start() for m in re.finditer(b'\n', self.code)]
+            self.newlines = newlines
+            return newlines
+        newlines = []
+        find = self.code.find
+        i = find('\n')
+        while i != -1:
+            newlines.append(i)
+            i = find('\n', i + 1)
+        self.newlines = newlines
+        return newlines
+    def line(self, offset: int) -> int:
+        newlines = self.newlines
+        if newlines is None:
+            newlines = self.build()
+        return bisect.bisect_left(newlines, offset) + 1
+    def column(self, offset: int) -> int:
+        newlines = self.newlines
+        if newlines is None:
+            newlines = self.build()
+        i = bisect.bisect_left(newlines, offset)
+        if i == 0:
+            return offset
+        return offset - newlines[i - 1] - 1
+    def position(self, offset: int) -> tuple[int, int]:
+        return self.line(offset), self.column(offset)
+
+class WindowLineIndex(LineIndex):
+    # positions for tokens read from a stream. Only the newline offsets of
+    # the current window are kept (as offsets into the whole stream), so the
+    # window's text can be freed while its tokens are still alive.
+    def __init__(
+        self,
+        text: str,
+        offset: int,
+        line: int,
+        line_start: int,
+    ):
+        super().__init__(text)
+        self.offset = offset
+        self.first_line = line
+        self.line_start = line_start
+        self.newlines = [offset + i for i in self.build()]
+        self.code = None
+    def __repr__(self):
+        return f'WindowLineIndex({self.offset})'
+    def line(self, offset: int) -> int:
+        return bisect.bisect_left(self.newlines, offset) + self.first_line
+    def column(self, offset: int) -> int:
+        i = bisect.bisect_left(self.newlines, offset)
+        if i == 0:
+            return offset - self.line_start
+        return offset - self.newlines[i - 1] - 1
+    def next_window(self, text: str, offset: int) -> WindowLineIndex:
+        i = bisect.bisect_left(self.newlines, offset)
+        line_start = self.line_start if i == 0 else self.newlines[i - 1] + 1
+        return WindowLineIndex(text, offset, self.line(offset), line_start)
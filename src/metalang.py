@@ -1,7 +1,9 @@
 import enum
+import re
 import typing
 
 from zparse.errors import GrammarError
+from zparse.lines import LineIndex
 
 class TokenKind(enum.Enum):
     EOF     = enum.auto()
@@ -21,200 +23,214 @@ class TokenKind(enum.Enum):
     BAM     = enum.auto()
     EQUALS  = enum.auto()
     DASH    = enum.auto()
+    TILDE   = enum.auto()
 
-# TODO: maybe keep track of last line and column
 class Token(typing.NamedTuple):
     kind: TokenKind
     text: str
-    line: int
-    column: int
-    code: str
+    start: int
+    source: LineIndex
     def __repr__(self):
         return f'Token({self.kind.name}, {self.text!r})'
+    @property
+    def line(self) -> int:
+        return self.source.line(self.start)
+    @property
+    def column(self) -> int:
+        return self.source.column(self.start)
+    @property
+    def code(self) -> str:
+        return self.source.code
+
+# The tokenizer scans the grammar with one master regex. Each alternative is
+# a named group, and the name of the group that matched (m.lastgroup) picks
+# the token kind. Whitespace only becomes a NEWRULE token when it ends a line
+# and the next line starts with an identifier.
+master_regex = re.compile(r"""
+    (?P<WS>\s+)
+  | (?P<ID>[^\W\d]\w*)
+  | (?P<CODE>\{)
+  | (?P<STRING>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+  | (?P<UNCLOSED>['"])
+  | (?P<COMMENT>\#[^\n]*)
+  | (?P<COLON>:)
+  | (?P<LPAREN>\()
+  | (?P<RPAREN>\))
+  | (?P<OR>\|)
+  | (?P<STAR>\*)
+  | (?P<PLUS>\+)
+  | (?P<QMARK>\?)
+  | (?P<DOT>\.)
+  | (?P<AT>@)
+  | (?P<BAM>!)
+  | (?P<EQUALS>=)
+  | (?P<DASH>-)
+  | (?P<TILDE>~)
+""", re.VERBOSE | re.DOTALL)
+
+# the pieces of a code snippet. Braces inside strings are not counted.
+code_regex = re.compile(r"""
+    [^{}'"]+
+  | '(?:[^'\\]|\\.)*'
+  | "(?:[^"\\]|\\.)*"
+  | [{}]
+""", re.VERBOSE | re.DOTALL)
 
 class Tokenizer:
     def __init__(self, code: str) -> None:
         self.code = code
+        self.source = LineIndex(code)
         self.slow = 0
-        self.fast = 0
-        self.line = 1
-        self.column = 0
-        self.line_slow = 1
-        self.column_slow = 0
         self.toks = []
-    def peek_char(self) -> str:
-        if self.fast == len(self.code):
-            return ''
-        return self.code[self.fast]
-    def next_char(self) -> str:
-        if self.fast == len(self.code):
-            return ''
-        c = self.code[self.fast]
-        if c == '\n':
-            self.line += 1
-            self.column = 0
-        else:
-            self.column += 1
-        self.fast += 1
-        return c
-    def chars_left(self) -> int:
-        return len(self.code) - self.fast
-    def make_token(self, kind: TokenKind) -> Token:
-        text = self.code[self.slow:self.fast]
-        token = Token(
-            kind,
-            text,
-            self.line_slow,
-            self.column_slow,
-            self.code
-        )
-        self.line_slow = self.line
-        self.column_slow = self.column
-        self.slow = self.fast
-        if token.kind != TokenKind.NEWRULE:
-            self.toks.append(token)
-        return token
-    def tokens(self) -> typing.Generator[Token, None, None]:
-        if self.peek_char().isalpha() or self.peek_char() == '_':
-            yield self.make_token(TokenKind.NEWRULE)
-        while True:
-            if self.peek_char() == '':
-                yield self.make_token(TokenKind.EOF)
-                return
-            elif self.peek_char().isspace():
-                yield from self.handle_whitespace()
-            elif self.peek_char().isalpha() or self.peek_char() == '_':
-                yield self.handle_identifier()
-            elif self.peek_char() == '{':
-                yield self.handle_code()
-            elif self.peek_char() == "'":
-                yield self.handle_sq_string()
-            elif self.peek_char() == '"':
-                yield self.handle_dq_string()
-            elif self.peek_char() == ':':
-                self.next_char()
-                yield self.make_token(TokenKind.COLON)
-            elif self.peek_char() == '(':
-                self.next_char()
-                yield self.make_token(TokenKind.LPAREN)
-            elif self.peek_char() == ')':
-                self.next_char()
-                yield self.make_token(TokenKind.RPAREN)
-            elif self.peek_char() == '|':
-                self.next_char()
-                yield self.make_token(TokenKind.OR)
-            elif self.peek_char() == '*':
-                self.next_char()
-                yield self.make_token(TokenKind.STAR)
-            elif self.peek_char() == '+':
-                self.next_char()
-                yield self.make_token(TokenKind.PLUS)
-            elif self.peek_char() == '?':
-                self.next_char()
-                yield self.make_token(TokenKind.QMARK)
-            elif self.peek_char() == '.':
-                self.next_char()
-                yield self.make_token(TokenKind.DOT)
-            elif self.peek_char() == '@':
-                self.next_char()
-                yield self.make_token(TokenKind.AT)
-            elif self.peek_char() == '!':
-                self.next_char()
-                yield self.make_token(TokenKind.BAM)
-            elif self.peek_char() == '=':
-                self.next_char()
-                yield self.make_token(TokenKind.EQUALS)
-            elif self.peek_char() == '-':
-                self.next_char()
-                yield self.make_token(TokenKind.DASH)
-            elif self.peek_char() == '#':
-                self.consume_comment()
+    def tokens(self) -> list[Token]:
+        code = self.code
+        source = self.source
+        toks = self.toks
+        kinds = TokenKind.__members__
+        match = master_regex.match
+        length = len(code)
+        if code[:1].isalpha() or code[:1] == '_':
+            toks.append(Token(TokenKind.NEWRULE, '', 0, source))
+        pos = 0
+        while pos < length:
+            # a comment is not a token, so its text is included in the
+            # text of the next token
+            if (m := match(code, pos)) is None:
+                self.unknown_char(code[pos])
+            end = m.end()
+            start = self.slow
+            group = m.lastgroup
+            if group == 'WS':
+                nxt = code[end:end + 1]
+                if code[end - 1] == '\n' and (nxt.isalnum() or nxt == '_'):
+                    toks.append(Token(
+                        TokenKind.NEWRULE,
+                        code[start:end],
+                        start,
+                        source,
+                    ))
+            elif group == 'COMMENT':
+                pos = end
+                continue
+            elif group == 'ID':
+                if not (code[pos].isalpha() or code[pos] == '_'):
+                    self.unknown_char(code[pos])
+                toks.append(Token(TokenKind.ID, code[start:end], start, source))
+            elif group == 'CODE':
+                end = self.code_end(end)
+                toks.append(Token(TokenKind.CODE, code[start:end], start, source))
+            elif group == 'UNCLOSED':
+                self.unclosed_string()
             else:
-                self.unknown_char()
-    def handle_whitespace(self) -> typing.Generator[Token, None, None]:
-        self.next_char()
-        while self.peek_char().isspace():
-            self.next_char()
-        token = self.make_token(TokenKind.NEWRULE)
-        if (
-            token.text.endswith('\n')
-            and (self.peek_char().isalnum() or self.peek_char() == '_')
-        ):
-            self.toks.append(token)
-            yield token
-    def handle_identifier(self) -> Token:
-        self.next_char()
-        while self.peek_char().isalnum() or self.peek_char() == '_':
-            self.next_char()
-        return self.make_token(TokenKind.ID)
-    def handle_code(self) -> Token:
-        self.next_char()
+                toks.append(Token(kinds[group], code[start:end], start, source))
+            pos = self.slow = end
+        start = self.slow
+        toks.append(Token(TokenKind.EOF, code[start:], start, source))
+        return toks
+    def code_end(self, pos: int) -> int:
+        code = self.code
+        match = code_regex.match
         depth = 1
-        while self.peek_char() != '}' or depth > 1:
-            if self.peek_char() == "'":
-                self.next_char()
-                while self.peek_char() != "'":
-                    if self.next_char() == '\\':
-                        self.next_char()
-                self.next_char()
-            elif self.peek_char() == '"':
-                self.next_char()
-                while self.peek_char() != '"':
-                    if self.next_char() == '\\':
-                        self.next_char()
-                self.next_char()
-            elif self.peek_char() == '{':
-                self.next_char()
+        while depth:
+            m = match(code, pos)
+            if m is None:
+                self.unclosed_code()
+            text = m.group()
+            if text == '{':
                 depth += 1
-            elif self.peek_char() == '}':
-                self.next_char()
+            elif text == '}':
                 depth -= 1
-            else:
-                if self.next_char() == '':
-                    self.unclosed_code()
-        self.next_char()
-        return self.make_token(TokenKind.CODE)
-    def handle_sq_string(self) -> Token:
-        self.next_char()
-        while self.peek_char() != "'" and self.peek_char() != '':
-            if self.next_char() == '\\':
-                self.next_char()
-        if self.next_char() == '':
-            self.unclosed_string()
-        return self.make_token(TokenKind.STRING)
-    def handle_dq_string(self) -> Token:
-        self.next_char()
-        while self.peek_char() != '"' and self.peek_char() != '':
-            if self.next_char() == '\\':
-                self.next_char()
-        if self.next_char() == '':
-            self.unclosed_string()
-        return self.make_token(TokenKind.STRING)
-    def consume_comment(self):
-        while self.peek_char() != '\n':
-            self.next_char()
-    def unknown_char(self):
+            pos = m.end()
+        return pos
+    def unknown_char(self, char: str):
         raise GrammarError(
-            f'unknown char {self.peek_char()!r} on line '
-            f'{self.line_slow} and column {self.column_slow}'
+            f'unknown char {char!r} on line '
+            f'{self.source.line(self.slow)} and column '
+            f'{self.source.column(self.slow)}'
         )
     def unclosed_string(self):
         raise GrammarError(
             f'unclosed string literal starting on line '
-            f'{self.line_slow} and column {self.column_slow}',
+            f'{self.source.line(self.slow)} and column '
+            f'{self.source.column(self.slow)}',
         )
     def unclosed_code(self):
         raise GrammarError(
             f'unclosed code snippet starting on line'
-            f'{self.line_slow} and column {self.column_slow}',
+            f'{self.source.line(self.slow)} and column '
+            f'{self.source.column(self.slow)}',
         )
 
 
+max_char = 0x10FFFF
+regex_escape = {
+    '.', '^', '$', '*', '+', '?', '{', '}', '(', ')', '\\', '[', ']', '|',
+}
+
+def literal_regex(value: str, binary: bool=False) -> str:
+    out = []
+    for c in value:
+        if binary and ord(c) > 0x7F:
+            out.extend(f'\\x{b:02x}' for b in c.encode('utf-8'))
+        elif c in regex_escape:
+            out.append('\\' + c)
+        else:
+            out.append(c)
+    return ''.join(out)
+
+def utf8_sequences(low: int, high: int) -> list[list[tuple[int, int]]]:
+    # splits a range of code points into sequences of byte ranges that
+    # match exactly the UTF-8 encodings of the code points in the range
+    if low <= 0xDFFF and high >= 0xD800:
+        out = []
+        if low < 0xD800:
+            out.extend(utf8_sequences(low, 0xD7FF))
+        if high > 0xDFFF:
+            out.extend(utf8_sequences(0xE000, high))
+        return out
+    for limit in (0x7F, 0x7FF, 0xFFFF):
+        if low <= limit < high:
+            return utf8_sequences(low, limit) + utf8_sequences(limit + 1, high)
+    if high <= 0x7F:
+        return [[(low, high)]]
+    for i in (1, 2, 3):
+        mask = (1 << (6 * i)) - 1
+        if low & ~mask != high & ~mask:
+            if low & mask != 0:
+                return (
+                    utf8_sequences(low, low | mask)
+                    + utf8_sequences((low | mask) + 1, high)
+                )
+            if high & mask != mask:
+                return (
+                    utf8_sequences(low, (high & ~mask) - 1)
+                    + utf8_sequences(high & ~mask, high)
+                )
+    return [list(zip(
+        chr(low).encode('utf-8'),
+        chr(high).encode('utf-8'),
+    ))]
+
+def utf8_regex(low: int, high: int) -> str:
+    sequences = []
+    for sequence in utf8_sequences(low, high):
+        sequences.append(''.join(
+            f'\\x{lo:02x}' if lo == hi else f'[\\x{lo:02x}-\\x{hi:02x}]'
+            for lo, hi in sequence
+        ))
+    return '(' + '|'.join(sequences) + ')'
+
 # TODO: come up with superclass for Tag, Directive, InlineCode, Predicate
 #       so that type hints are list[Token | GrammarExpr | SOME_OTHER_TYPE]
 
+plain_string = re.compile(r"'[^'\\\n\r\0]*'|\"[^\"\\\n\r\0]*\"")
+
 class GrammarExpr:
-    def to_regex(self, fragments: dict[str, str]) -> str:
+    def to_regex(
+        self,
+        fragments: dict[str, str],
+        binary: bool=False,
+    ) -> str:
         assert False, 'not implemented'
     def identifiers(self) -> set[str]:
         assert False, 'not implemented'
@@ -234,7 +250,11 @@ class Identifier(GrammarExpr):
         return self.name.isupper() and not self.name.startswith('_')
     def is_fragment(self) -> bool:
         return self.name.isupper() and self.name.startswith('_')
-    def to_regex(self, fragments: dict[str, str]) -> str:
+    def to_regex(
+        self,
+        fragments: dict[str, str],
+        binary: bool=False,
+    ) -> str:
         if self.name not in fragments:
             raise GrammarError(
                 f'fragment {self.name!r} is not defined',
@@ -248,15 +268,21 @@ class Identifier(GrammarExpr):
 
 class StringLiteral(GrammarExpr):
     def __init__(self, token: Token):
-        self.value = eval(token.text)
+        text = token.text
+        if plain_string.fullmatch(text):
+            # no escapes, so the value is what is between the quotes
+            self.value = text[1:-1]
+        else:
+            self.value = eval(text)
         self.token = token
     def __repr__(self):
         return f'Str({self.token.text})'
-    def to_regex(self, fragments: dict[str, str]) -> str:
-        escape = {'.', '^', '$', '*', '+', '?', '{', '}', '\\', '[', ']', '|'}
-        return ''.join(
-            '\\' + c if c in escape else c for c in self.value
-        )
+    def to_regex(
+        self,
+        fragments: dict[str, str],
+        binary: bool=False,
+    ) -> str:
+        return literal_regex(self.value, binary)
     def identifiers(self) -> set[str]:
         return set()
     def literals(self) -> set[str]:
@@ -276,6 +302,16 @@ class Predicate:
     def __repr__(self):
         return 'Predicate()'
 
+class Cut:
+    def __init__(self, tilde: Token):
+        self.tilde = tilde
+    def __repr__(self):
+        return 'Cut()'
+    def identifiers(self) -> set[str]:
+        return set()
+    def literals(self) -> set[str]:
+        return set()
+
 class Range(GrammarExpr):
     def __init__(
         self,
@@ -288,10 +324,16 @@ class Range(GrammarExpr):
         self.dash = dash
     def __repr__(self):
         return f'Range({self.low.value!r}, {self.high.value!r})'
-    def to_regex(self, fragments: dict[str, str]) -> str:
+    def to_regex(
+        self,
+        fragments: dict[str, str],
+        binary: bool=False,
+    ) -> str:
         low, high = self.low.value, self.high.value
         if ord(high) < ord(low):
             low, high = high, low
+        if binary:
+            return utf8_regex(ord(low), ord(high))
         if low == ']': low = '\\]'
         if high == ']': high = '\\]'
         if low == '^': low = '\\^'
@@ -318,7 +360,13 @@ class Any(GrammarExpr):
         self.token = token
     def __repr__(self):
         return 'Any()'
-    def to_regex(self, fragments: dict[str, str]) -> str:
+    def to_regex(
+        self,
+        fragments: dict[str, str],
+        binary: bool=False,
+    ) -> str:
+        if binary:
+            return f'({utf8_regex(0, 9)}|{utf8_regex(11, max_char)})'
         return '.'
     def identifiers(self) -> set[str]:
         return set()
@@ -365,9 +413,13 @@ class Union(GrammarExpr):
         self.ors = ors
     def __repr__(self):
         return f'Union({self.values})'
-    def to_regex(self, fragments: dict[str, str]) -> str:
+    def to_regex(
+        self,
+        fragments: dict[str, str],
+        binary: bool=False,
+    ) -> str:
         mid = '|'.join(
-            f'({value.to_regex(fragments)})' for value in self.values
+            f'({value.to_regex(fragments, binary)})' for value in self.values
         )
         return f'({mid})'
     def identifiers(self) -> set[str]:
@@ -386,9 +438,13 @@ class Concatenation(GrammarExpr):
         self.values = values
     def __repr__(self):
         return f'Concat({self.values})'
-    def to_regex(self, fragments: dict[str, str]) -> str:
+    def to_regex(
+        self,
+        fragments: dict[str, str],
+        binary: bool=False,
+    ) -> str:
         mid = ''.join(
-            value.to_regex(fragments) for value in self.values
+            value.to_regex(fragments, binary) for value in self.values
         )
         return f'({mid})'
     def identifiers(self) -> set[str]:
@@ -408,8 +464,12 @@ class Optional(GrammarExpr):
         self.qmark = qmark
     def __repr__(self):
         return f'Optional({self.value})'
-    def to_regex(self, fragments: dict[str, str]) -> str:
-        return f'({self.value.to_regex(fragments)})?'
+    def to_regex(
+        self,
+        fragments: dict[str, str],
+        binary: bool=False,
+    ) -> str:
+        return f'({self.value.to_regex(fragments, binary)})?'
     def identifiers(self) -> set[str]:
         return self.value.identifiers()
     def literals(self) -> set[str]:
@@ -422,8 +482,12 @@ class NongreedyOptional(GrammarExpr):
         self.qmark2 = qmark2
     def __repr__(self):
         return f'NgOptional({self.value})'
-    def to_regex(self, fragments: dict[str, str]) -> str:
-        return f'({self.value.to_regex(fragments)})??'
+    def to_regex(
+        self,
+        fragments: dict[str, str],
+        binary: bool=False,
+    ) -> str:
+        return f'({self.value.to_regex(fragments, binary)})??'
     def identifiers(self) -> set[str]:
         return self.value.identifiers()
     def literals(self) -> set[str]:
@@ -435,8 +499,12 @@ class Plus(GrammarExpr):
         self.plus = plus
     def __repr__(self):
         return f'Plus({self.value})'
-    def to_regex(self, fragments: dict[str, str]) -> str:
-        return f'({self.value.to_regex(fragments)})+'
+    def to_regex(
+        self,
+        fragments: dict[str, str],
+        binary: bool=False,
+    ) -> str:
+        return f'({self.value.to_regex(fragments, binary)})+'
     def identifiers(self) -> set[str]:
         return self.value.identifiers()
     def literals(self) -> set[str]:
@@ -449,8 +517,12 @@ class NongreedyPlus(GrammarExpr):
         self.qmark = qmark
     def __repr__(self):
         return f'NgPlus({self.value})'
-    def to_regex(self, fragments: dict[str, str]) -> str:
-        return f'({self.value.to_regex(fragments)})+?'
+    def to_regex(
+        self,
+        fragments: dict[str, str],
+        binary: bool=False,
+    ) -> str:
+        return f'({self.value.to_regex(fragments, binary)})+?'
     def identifiers(self) -> set[str]:
         return self.value.identifiers()
     def literals(self) -> set[str]:
@@ -462,8 +534,12 @@ class Star(GrammarExpr):
         self.star = star
     def __repr__(self):
         return f'Star({self.value})'
-    def to_regex(self, fragments: dict[str, str]) -> str:
-        return f'({self.value.to_regex(fragments)})*'
+    def to_regex(
+        self,
+        fragments: dict[str, str],
+        binary: bool=False,
+    ) -> str:
+        return f'({self.value.to_regex(fragments, binary)})*'
     def identifiers(self) -> set[str]:
         return self.value.identifiers()
     def literals(self) -> set[str]:
@@ -476,8 +552,12 @@ class NongreedyStar(GrammarExpr):
         self.qmark = qmark
     def __repr__(self):
         return f'NgStar({self.value})'
-    def to_regex(self, fragments: dict[str, str]) -> str:
-        return f'({self.value.to_regex(fragments)})*?'
+    def to_regex(
+        self,
+        fragments: dict[str, str],
+        binary: bool=False,
+    ) -> str:
+        return f'({self.value.to_regex(fragments, binary)})*?'
     def identifiers(self) -> set[str]:
         return self.value.identifiers()
     def literals(self) -> set[str]:
@@ -547,22 +627,499 @@ class Grammar:
         )
 
 
+operators = {TokenKind.STAR, TokenKind.PLUS, TokenKind.QMARK}
+markers = {TokenKind.AT, TokenKind.BAM}
+# the parts of an alternative that are not part of its expression
+alternative_parts = (Tag, Directive, InlineCode, Predicate)
+
+class ExprReader:
+    # reads the tokens of one definition in a single pass, with one method
+    # per precedence level. When a definition has several problems, the one
+    # reported does not depend on where the reader finds them first: the
+    # checks of single tokens come first (they only run once something is
+    # wrong), then the problems in each group of parentheses as it closes,
+    # then those of the level around it. Each level keeps the first misused
+    # operator and the first empty alternative it finds, in that order, and
+    # reports them once it has been read.
+    def __init__(self, tokens: list[Token], definition: str):
+        self.tokens = tokens
+        self.definition = definition
+        self.rule = definition == 'rule'
+        self.pos = 0
+        # parts that are only allowed at the top level of an alternative,
+        # but were found in parentheses (or wildcards in fragments). They
+        # are reported after everything else.
+        self.misplaced = None
+    def peek(self, offset: int=0) -> typing.Optional[TokenKind]:
+        if self.pos + offset < len(self.tokens):
+            return self.tokens[self.pos + offset].kind
+        return None
+    def take(self) -> Token:
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+    def finish(self) -> None:
+        if self.pos != len(self.tokens):
+            token = self.tokens[self.pos]
+            if token.kind == TokenKind.RPAREN:
+                self.error('unmatched right parentheses', token)
+            self.error('unexpected token', token)
+    def alternatives(self) -> list[Alternative]:
+        errors = [None, None]
+        groups = [self.sequence(errors)]
+        ors = []
+        while self.peek() == TokenKind.OR:
+            ors.append(self.take())
+            groups.append(self.sequence(errors))
+        self.finish()
+        self.empty_alternatives(groups, ors, errors)
+        self.raise_first(errors)
+        alternatives = [self.alternative(group) for group in groups]
+        if alternatives[0].tag is None:
+            for alt in alternatives[1:]:
+                if alt.tag is not None:
+                    self.error(
+                        'all or none of the alternatives should have tags',
+                        alt.tag.at,
+                    )
+        else:
+            for alt in alternatives[1:]:
+                if alt.tag is None:
+                    self.error(
+                        'all or none of the alternatives should have tags',
+                        alternatives[0].tag.at,
+                    )
+        self.raise_first([self.misplaced])
+        return alternatives
+    def alternative(self, group: list) -> Alternative:
+        # tags, directives and code come last, and a predicate first
+        tag = None
+        directives = []
+        code = None
+        end = len(group)
+        while end:
+            part = group[end - 1]
+            if isinstance(part, Tag):
+                if tag is not None:
+                    self.error(
+                        'alternatives cannot have multiple tags',
+                        tag.at,
+                    )
+                tag = part
+            elif isinstance(part, Directive):
+                # directives are listed from last to first
+                directives.append(part)
+            elif isinstance(part, InlineCode):
+                if code is not None:
+                    self.error(
+                        'alternatives can only have one code snippet',
+                        code.token,
+                    )
+                code = part
+            else:
+                break
+            end -= 1
+        start = 0
+        predicate = None
+        if end and isinstance(group[0], Predicate):
+            predicate = group[0]
+            start = 1
+        if start == end:
+            if tag is not None:
+                self.error('alternatives cannot be empty', tag.at)
+            elif code is not None:
+                self.error('alternatives cannot be empty', code.token)
+            elif predicate is not None:
+                self.error(
+                    'alternatives cannot be empty',
+                    predicate.code.token,
+                )
+            self.error('alternatives cannot be empty', directives[0].bam)
+        values = group[start:end]
+        for part in values:
+            if isinstance(part, alternative_parts):
+                self.error(*self.part_error(part))
+        value = values[0] if len(values) == 1 else Concatenation(values)
+        return Alternative(value, tag, directives, code, predicate)
+    def part_error(self, part: typing.Any) -> tuple[str, Token]:
+        if isinstance(part, Tag):
+            return 'tags must be at the end of an alternative', part.at
+        elif isinstance(part, Directive):
+            return 'directives must be at the end of an alternative', part.bam
+        elif isinstance(part, InlineCode):
+            return (
+                'code snippets must be at the end of an alternative',
+                part.token,
+            )
+        return (
+            'predicates must be at the start of an alternative',
+            part.code.token,
+        )
+    def token_parts(
+        self,
+    ) -> tuple[GrammarExpr, typing.Optional[Tag], typing.Optional[Predicate]]:
+        predicate = None
+        if self.peek() == TokenKind.CODE and self.peek(1) == TokenKind.QMARK:
+            predicate = Predicate(InlineCode(self.take()), self.take())
+        errors = [None, None]
+        value = self.union(errors)
+        tag = None
+        if self.peek() == TokenKind.AT:
+            tag = self.marker()
+        self.finish()
+        self.raise_first(errors)
+        if value is None:
+            self.error('unexpected token', self.tokens[-1])
+        return value, tag, predicate
+    def fragment_value(self) -> GrammarExpr:
+        errors = [None, None]
+        value = self.union(errors)
+        self.finish()
+        self.raise_first(errors)
+        if value is None:
+            self.error('unexpected token', self.tokens[-1])
+        self.raise_first([self.misplaced])
+        return value
+    def union(self, errors: list) -> typing.Optional[GrammarExpr]:
+        groups = [self.sequence(errors)]
+        ors = []
+        while self.peek() == TokenKind.OR:
+            ors.append(self.take())
+            groups.append(self.sequence(errors))
+        if not ors and not groups[0]:
+            # only a misused operator or something the token checks reject,
+            # which the caller reports
+            return None
+        self.empty_alternatives(groups, ors, errors)
+        values = []
+        for group in groups:
+            if self.rule and self.misplaced is None:
+                for part in group:
+                    if isinstance(part, alternative_parts):
+                        self.misplaced = self.part_error(part)
+                        break
+            if len(group) == 1:
+                values.append(group[0])
+            else:
+                values.append(Concatenation(group))
+        return values[0] if len(values) == 1 else Union(values, ors)
+    def empty_alternatives(
+        self,
+        groups: list[list],
+        ors: list[Token],
+        errors: list,
+    ) -> None:
+        if errors[1] is not None:
+            return
+        for group, bar in zip(groups, ors):
+            if not group:
+                errors[1] = ('alternatives cannot be empty', bar)
+                return
+        if not groups[-1] and ors:
+            errors[1] = ('alternatives cannot be empty', ors[-1])
+    def sequence(self, errors: list) -> list:
+        values = []
+        while True:
+            kind = self.peek()
+            if kind == TokenKind.ID:
+                value = self.identifier()
+            elif kind == TokenKind.STRING:
+                value = self.string()
+            elif kind == TokenKind.LPAREN:
+                value = self.group()
+            elif kind in operators:
+                value = None
+            elif not self.rule:
+                if kind != TokenKind.DOT or self.definition != 'fragment':
+                    return values
+                value = self.take()
+                if self.misplaced is None:
+                    self.misplaced = (
+                        'fragment definitions cannot contain wildcards',
+                        value,
+                    )
+            elif kind == TokenKind.TILDE:
+                value = Cut(self.take())
+            elif kind == TokenKind.CODE:
+                value = InlineCode(self.take())
+                if self.peek() == TokenKind.QMARK:
+                    value = Predicate(value, self.take())
+            elif kind in markers:
+                value = self.marker()
+            else:
+                return values
+            value = self.operators(value, errors)
+            if value is not None:
+                values.append(value)
+    def group(self) -> GrammarExpr:
+        lparen = self.take()
+        if self.peek() == TokenKind.RPAREN:
+            self.error('parentheses must contain an expression', self.take())
+        errors = [None, None]
+        value = self.union(errors)
+        kind = self.peek()
+        if kind is None:
+            self.error('unclosed parentheses', lparen)
+        elif kind != TokenKind.RPAREN:
+            self.error('unexpected token', self.take())
+        rparen = self.take()
+        self.raise_first(errors)
+        if value is None:
+            self.error('unexpected token', rparen)
+        return value
+    def marker(self) -> typing.Union[Tag, Directive]:
+        marker = self.take()
+        if self.peek() != TokenKind.ID:
+            self.error(
+                f'{marker.text} must be followed by an identifier',
+                marker,
+            )
+        if marker.kind == TokenKind.AT:
+            return Tag(Identifier(self.take()), marker)
+        return Directive(Identifier(self.take()), marker)
+    def identifier(self) -> GrammarExpr:
+        name = Identifier(self.take())
+        if self.rule == name.is_fragment():
+            self.error(self.reference_error(name), name.token)
+        if not self.rule or self.peek() != TokenKind.EQUALS:
+            return name
+        equals = self.take()
+        if self.peek() != TokenKind.ID:
+            self.error('= must have an identifier on each side', equals)
+        alias = Alias(name, Identifier(self.take()), equals)
+        if alias.name.is_fragment():
+            self.error(self.reference_error(alias.name), alias.name.token)
+        return alias
+    def reference_error(self, name: Identifier) -> str:
+        if name.is_rule():
+            kind = 'rule'
+        elif name.is_token():
+            kind = 'token'
+        else:
+            kind = 'fragment'
+        return (
+            f'{self.definition} definitions cannot contain {kind} references'
+        )
+    def string(self) -> GrammarExpr:
+        low = StringLiteral(self.take())
+        if self.rule or self.peek() != TokenKind.DASH:
+            return low
+        dash = self.take()
+        if self.peek() != TokenKind.STRING:
+            self.error('- must have an string on each side', dash)
+        high = StringLiteral(self.take())
+        for bound in low, high:
+            if len(bound.value) != 1:
+                self.error(
+                    'range bounds must be a single character',
+                    bound.token,
+                )
+        return Range(low, high, dash)
+    def operators(
+        self,
+        value: typing.Any,
+        errors: list,
+    ) -> typing.Any:
+        while True:
+            kind = self.peek()
+            if kind not in operators:
+                return value
+            op = self.take()
+            if not isinstance(value, GrammarExpr):
+                # nothing before it, or a cut, a tag or code
+                if errors[0] is None:
+                    errors[0] = (f'{op.text} must follow an expression', op)
+                continue
+            if self.peek() == TokenKind.QMARK:
+                if kind == TokenKind.STAR:
+                    value = NongreedyStar(value, op, self.take())
+                elif kind == TokenKind.PLUS:
+                    value = NongreedyPlus(value, op, self.take())
+                else:
+                    value = NongreedyOptional(value, op, self.take())
+            elif kind == TokenKind.STAR:
+                value = Star(value, op)
+            elif kind == TokenKind.PLUS:
+                value = Plus(value, op)
+            else:
+                value = Optional(value, op)
+    def raise_first(self, errors: list) -> None:
+        for error in errors:
+            if error is not None:
+                self.error(*error)
+    def error(self, msg: str, token: Token) -> typing.NoReturn:
+        if self.rule:
+            self.check_rule_tokens()
+        elif self.definition == 'token':
+            self.check_token_tokens()
+        else:
+            self.check_fragment_tokens()
+        # nothing after an unclosed parenthesis is checked
+        unclosed = self.unclosed()
+        if unclosed is not None and self.pos > unclosed:
+            msg, token = 'unclosed parentheses', self.tokens[unclosed]
+        raise GrammarError(msg, (token,))
+    def unclosed(self) -> typing.Optional[int]:
+        depth = 0
+        unclosed = None
+        for i, token in enumerate(self.tokens):
+            if token.kind == TokenKind.LPAREN:
+                if depth == 0:
+                    unclosed = i
+                depth += 1
+            elif token.kind == TokenKind.RPAREN and depth > 0:
+                depth -= 1
+        return unclosed if depth > 0 else None
+    def check_rule_tokens(self) -> None:
+        for token in self.tokens:
+            if token.kind == TokenKind.DASH:
+                fail('rule definitions cannot contain ranges', token)
+            elif token.kind == TokenKind.DOT:
+                fail('rule definitions cannot contain wildcards', token)
+        parts = self.marked_parts(markers)
+        for kind, token in parts:
+            if kind == TokenKind.ID and Identifier(token).is_fragment():
+                fail(
+                    'rule definitions cannot contain fragment references',
+                    token,
+                )
+        previous = None
+        i = 0
+        while i < len(parts):
+            kind, token = parts[i]
+            if kind == TokenKind.EQUALS:
+                if (
+                    previous != TokenKind.ID
+                    or i + 1 == len(parts)
+                    or parts[i + 1][0] != TokenKind.ID
+                ):
+                    fail('= must have an identifier on each side', token)
+                i += 1
+            previous = kind
+            i += 1
+    def check_token_tokens(self) -> None:
+        for token in self.tokens:
+            if token.kind == TokenKind.BAM:
+                fail('token definitions cannot contain directives', token)
+            elif token.kind == TokenKind.EQUALS:
+                fail('token definitions cannot contain aliases', token)
+            elif token.kind == TokenKind.DOT:
+                fail('token definitions cannot contain wildcards', token)
+            elif token.kind == TokenKind.TILDE:
+                fail('token definitions cannot contain cuts', token)
+        parts = self.marked_parts({TokenKind.AT})
+        predicate = None
+        if (
+            len(parts) > 1
+            and parts[0][0] == TokenKind.CODE
+            and parts[1][0] == TokenKind.QMARK
+        ):
+            predicate = parts[0][1]
+            del parts[:2]
+        tag = None
+        while parts:
+            kind, token = parts[-1]
+            if kind == TokenKind.AT:
+                if tag is not None:
+                    fail('token definitions cannot have multiple tags', tag)
+                tag = parts.pop()[1]
+            elif kind == TokenKind.CODE:
+                fail('token definitions cannot contain code snippets', token)
+            else:
+                break
+        if not parts:
+            fail(
+                'token definitions cannot be empty',
+                tag if tag is not None else predicate,
+            )
+        for kind, token in parts:
+            if kind == TokenKind.AT:
+                fail('tags must be at the end of token definitions', token)
+            elif kind == TokenKind.CODE:
+                fail('token definitions cannot contain code snippets', token)
+        for kind, token in parts:
+            if kind == TokenKind.ID and not Identifier(token).is_fragment():
+                fail(self.reference_error(Identifier(token)), token)
+        self.check_ranges(parts)
+    def check_fragment_tokens(self) -> None:
+        for token in self.tokens:
+            if token.kind == TokenKind.CODE:
+                fail(
+                    'fragment definitions cannot contain code snippets',
+                    token,
+                )
+            elif token.kind == TokenKind.BAM:
+                fail('fragment definitions cannot contain directives', token)
+            elif token.kind == TokenKind.AT:
+                fail('fragment definitions cannot contain tags', token)
+            elif token.kind == TokenKind.EQUALS:
+                fail('fragment definitions cannot contain aliases', token)
+            elif token.kind == TokenKind.TILDE:
+                fail('fragment definitions cannot contain cuts', token)
+            elif (
+                token.kind == TokenKind.ID
+                and not Identifier(token).is_fragment()
+            ):
+                fail(self.reference_error(Identifier(token)), token)
+        self.check_ranges([(token.kind, token) for token in self.tokens])
+    def marked_parts(
+        self,
+        kinds: set[TokenKind],
+    ) -> list[tuple[TokenKind, Token]]:
+        # the kinds and tokens of the parts of a definition, where a tag or
+        # a directive takes the identifier after it
+        parts = []
+        tokens = self.tokens
+        i = 0
+        while i < len(tokens):
+            token = tokens[i]
+            if token.kind in kinds:
+                if i + 1 == len(tokens) or tokens[i + 1].kind != TokenKind.ID:
+                    fail(
+                        f'{token.text} must be followed by an identifier',
+                        token,
+                    )
+                i += 1
+            parts.append((token.kind, token))
+            i += 1
+        return parts
+    def check_ranges(self, parts: list[tuple[TokenKind, Token]]) -> None:
+        previous = None
+        i = 0
+        while i < len(parts):
+            kind, token = parts[i]
+            if kind == TokenKind.DASH:
+                if (
+                    previous != TokenKind.STRING
+                    or i + 1 == len(parts)
+                    or parts[i + 1][0] != TokenKind.STRING
+                ):
+                    fail('- must have an string on each side', token)
+                for _, bound in parts[i - 1], parts[i + 1]:
+                    if len(StringLiteral(bound).value) != 1:
+                        fail('range bounds must be a single character', bound)
+                i += 1
+            previous = kind
+            i += 1
+
+def fail(msg: str, token: Token) -> typing.NoReturn:
+    raise GrammarError(msg, (token,))
+
 class Parser:
     def __init__(self, code: str):
         self.code = code
         self.tokenizer = Tokenizer(code)
         self.tokens = self.tokenizer.tokens()
-        self.buffer = next(self.tokens)
+        self.index = 0
         self.grammar = Grammar([], [], [], [], code)
     def next_token(self) -> typing.Optional[Token]:
-        token = self.buffer
-        try:
-            self.buffer = next(self.tokens)
-        except StopIteration:
-            self.buffer = None
+        token = self.peek_token()
+        self.index += 1
         return token
     def peek_token(self) -> typing.Optional[Token]:
-        return self.buffer
+        if self.index < len(self.tokens):
+            return self.tokens[self.index]
+        return None
     def parse(self) -> Grammar:
         while True:
             if self.peek_token().kind == TokenKind.NEWRULE:
@@ -594,14 +1151,7 @@ class Parser:
         tokens = self.collect_expr_tokens()
         if len(tokens) == 0:
             self.parse_error('rule definitions cannot be empty', colon)
-        self.check_for_illegal_rule_tokens(tokens)
-        tokens = self.handle_single_tokens(tokens)
-        tokens = self.handle_ats_bams_and_predicates(tokens)
-        self.check_for_illegal_rule_refs(tokens)
-        tokens = self.handle_aliases(tokens)
-        tokens = self.handle_parentheses(tokens)
-        tokens = self.handle_ops(tokens)
-        alternatives = self.make_alternatives(tokens)
+        alternatives = ExprReader(tokens, 'rule').alternatives()
         rule_def = RuleDefinition(
             name,
             alternatives,
@@ -613,12 +1163,9 @@ class Parser:
         if colon.kind != TokenKind.COLON:
             self.parse_error('unexpected token', colon)
         tokens = self.collect_expr_tokens()
-        self.check_for_illegal_token_tokens(tokens)
-        tokens = self.handle_single_tokens(tokens)
-        tokens, tag, predicate = self.extract_things(tokens)
-        self.check_for_illegal_token_refs(tokens)
-        tokens = self.handle_ranges(tokens)
-        value = self.recursively_parse(tokens)
+        if len(tokens) == 0:
+            self.parse_error('token definitions cannot be empty', colon)
+        value, tag, predicate = ExprReader(tokens, 'token').token_parts()
         token_def = TokenDefinition(
             name,
             value,
@@ -632,10 +1179,9 @@ class Parser:
         if colon.kind != TokenKind.COLON:
             self.parse_error('unexpected token', colon)
         tokens = self.collect_expr_tokens()
-        self.check_for_illegal_fragment_tokens(tokens)
-        tokens = self.handle_single_tokens(tokens)
-        tokens = self.handle_ranges(tokens)
-        value = self.recursively_parse(tokens)
+        if len(tokens) == 0:
+            self.parse_error('fragment definitions cannot be empty', colon)
+        value = ExprReader(tokens, 'fragment').fragment_value()
         frag_def = FragmentDefinition(
             name,
             value,
@@ -645,578 +1191,18 @@ class Parser:
     def add_token_declaration(self, name: Identifier) -> None:
         self.grammar.token_declarations.append(name)
     def collect_expr_tokens(self) -> list[Token]:
-        stop_tokens = [TokenKind.NEWRULE, TokenKind.EOF]
-        toks = []
-        while self.peek_token().kind not in stop_tokens:
-            if self.peek_token().kind == TokenKind.COLON:
-                self.parse_error(
-                    'unexpected colon',
-                    self.peek_token(),
-                )
-            toks.append(self.next_token())
-        return toks
-    def check_for_illegal_rule_tokens(
-        self,
-        tokens: list[Token]
-    ) -> None:
-        for token in tokens:
-            if token.kind == TokenKind.DASH:
-                self.parse_error(
-                    'rule definitions cannot contain ranges',
-                    token,
-                )
-            elif token.kind == TokenKind.DOT:
-                self.parse_error(
-                    'rule definitions cannot contain wildcards',
-                    token,
-                )
-    def handle_single_tokens(
-        self,
-        tokens: list[Token],
-    ) -> list[Token | GrammarExpr]:
-        out = []
-        for token in tokens:
-            if token.kind == TokenKind.ID:
-                out.append(Identifier(token))
-            elif token.kind == TokenKind.STRING:
-                out.append(StringLiteral(token))
-            elif token.kind == TokenKind.CODE:
-                out.append(InlineCode(token))
-            else:
-                out.append(token)
-        return out
-    def handle_ats_bams_and_predicates(
-        self,
-        tokens: list[Token | GrammarExpr],
-    ) -> list[Token | GrammarExpr]:
-        out = []
-        i = 0
-        while i < len(tokens):
-            token = tokens[i]
-            if isinstance(token, Token):
-                if token.kind == TokenKind.AT:
-                    if (i + 1 == len(tokens)
-                        or not isinstance(tokens[i + 1], Identifier)):
-                        self.parse_error(
-                            '@ must be followed by an identifier',
-                            token,
-                        )
-                    out.append(Tag(tokens[i + 1], token))
-                    i += 1
-                elif token.kind == TokenKind.BAM:
-                    if (
-                        i + 1 == len(tokens)
-                        or not isinstance(tokens[i + 1], Identifier)
-                    ):
-                        self.parse_error(
-                            '! must be followed by an identifier',
-                            token,
-                        )
-                    out.append(Directive(tokens[i + 1], token))
-                    i += 1
-                elif token.kind == TokenKind.QMARK:
-                    if (
-                        i > 0
-                        and isinstance(tokens[i - 1], InlineCode)
-                    ):
-                        out.append(Predicate(out.pop(), token))
-                    else:
-                        out.append(token)
-                else:
-                    out.append(token)
-            else:
-                out.append(token)
-            i += 1
-        return out
-    def handle_aliases(
-        self,
-        tokens: list[Token | GrammarExpr],
-    ) -> list[Token | GrammarExpr]:
-        is_kind = lambda t, k: isinstance(t, Token) and t.kind == k
-        out = []
-        i = 0
-        while i < len(tokens):
-            token = tokens[i]
-            if is_kind(token, TokenKind.EQUALS):
-                if (
-                    len(out) == 0
-                    or not isinstance(out[-1], Identifier)
-                    or i + 1 == len(tokens)
-                    or not isinstance(tokens[i + 1], Identifier)
-                ):
-                    self.parse_error(
-                        '= must have an identifier on each side',
-                        token,
-                    )
-                alias = Alias(out.pop(), tokens[i + 1], token)
-                out.append(alias)
-                i += 1
-            else:
-                out.append(token)
-            i += 1
-        return out
-    def handle_parentheses(
-        self,
-        tokens: list[Token | GrammarExpr],
-    ) -> list[Token | GrammarExpr]:
-        is_kind = lambda t, k: isinstance(t, Token) and t.kind == k
-        out = []
-        depth = 0
-        in_parens = left_paren = None
-        for token in tokens:
-            if is_kind(token, TokenKind.LPAREN):
-                if depth > 0:
-                    in_parens.append(token)
-                    depth += 1
-                else:
-                    in_parens = []
-                    left_paren = token
-                    depth += 1
-            elif is_kind(token, TokenKind.RPAREN):
-                if depth == 0:
-                    self.parse_error(
-                        'unmatched right parentheses',
-                        token,
-                    )
-                elif depth == 1:
-                    depth = 0
-                    if len(in_parens) == 0:
-                        self.parse_error(
-                            'parentheses must contain an expression',
-                            token,
-                        )
-                    out.append(self.recursively_parse(in_parens))
-                else:
-                    depth -= 1
-                    in_parens.append(token)
-            elif depth > 0:
-                in_parens.append(token)
-            else:
-                out.append(token)
-        if depth > 0:
-            self.parse_error(
-                'unclosed parentheses',
-                left_paren,
-            )
-        return out
-    def handle_ops(
-        self,
-        tokens: list[Token | GrammarExpr],
-    ) -> list[Token | GrammarExpr]:
-        is_kind = lambda t, k: isinstance(t, Token) and t.kind == k
-        out = []
-        i = 0
-        while i < len(tokens):
-            token = tokens[i]
-            if is_kind(token, TokenKind.STAR):
-                if (
-                    len(out) == 0
-                    or not isinstance(out[-1], GrammarExpr)
-                ):
-                    self.parse_error(
-                        '* must follow an expression',
-                        token,
-                    )
-                if (
-                    i + 1 < len(tokens)
-                    and is_kind(tokens[i + 1], TokenKind.QMARK)
-                ):
-                    star = NongreedyStar(out.pop(), token, tokens[i + 1])
-                    out.append(star)
-                    i += 1
-                else:
-                    star = Star(out.pop(), token)
-                    out.append(star)
-            elif is_kind(token, TokenKind.PLUS):
-                if (
-                    len(out) == 0
-                    or not isinstance(out[-1], GrammarExpr)
-                ):
-                    self.parse_error(
-                        '+ must follow an expression',
-                        token,
-                    )
-                if (
-                    i + 1 < len(tokens)
-                    and is_kind(tokens[i + 1], TokenKind.QMARK)
-                ):
-                    plus = NongreedyPlus(out.pop(), token, tokens[i + 1])
-                    out.append(plus)
-                    i += 1
-                else:
-                    plus = Plus(out.pop(), token)
-                    out.append(plus)
-            elif is_kind(token, TokenKind.QMARK):
-                if (
-                    len(out) == 0
-                    or not isinstance(out[-1], GrammarExpr)
-                ):
-                    self.parse_error(
-                        '? must follow an expression',
-                        token,
-                    )
-                if (
-                    i + 1 < len(tokens)
-                    and is_kind(tokens[i + 1], TokenKind.QMARK)
-                ):
-                    opt = NongreedyOptional(out.pop(), token, tokens[i + 1])
-                    out.append(opt)
-                    i += 1
-                else:
-                    opt = Optional(out.pop(), token)
-                    out.append(opt)
-            else:
-                out.append(token)
-            i += 1
-        return out
-    def make_alternatives(
-        self,
-        tokens: list[Token | GrammarExpr],
-    ) -> list[Alternative]:
-        is_kind = lambda t, k: isinstance(t, Token) and t.kind == k
-        groups = [[]]
-        ors = []
-        for token in tokens:
-            if is_kind(token, TokenKind.OR):
-                if len(groups[-1]) == 0:
-                    self.parse_error('alternatives cannot be empty', token)
-                groups.append([])
-                ors.append(token)
-            else:
-                groups[-1].append(token)
-        if len(groups[-1]) == 0:
-            self.parse_error('alternatives cannot be empty', ors[-1])
-        alternatives = []
-        for group in groups:
-            value, tag, directives, code, predicate = self.split_group(group)
-            alt = Alternative(value, tag, directives, code, predicate)
-            alternatives.append(alt)
-        if alternatives[0].tag is None:
-            for alt in alternatives[1:]:
-                if alt.tag is not None:
-                    self.parse_error(
-                        'all or none of the alternatives should have tags',
-                        alt.tag.at,
-                    )
-        else:
-            for alt in alternatives[1:]:
-                if alt.tag is None:
-                    self.parse_error(
-                        'all or none of the alternatives should have tags',
-                        alternatives[0].tag.at,
-                    )
-        return alternatives
-    def split_group(
-        self,
-        group: list[GrammarExpr],
-    ) -> tuple[
-        GrammarExpr,
-        typing.Optional[Tag],
-        list[Directive],
-        typing.Optional[InlineCode],
-        typing.Optional[Predicate],
-    ]:
-        is_kind = lambda t, k: isinstance(t, Token) and t.kind == k
-        tag = None
-        directives = []
-        code = None
-        predicate = None
-        while group:
-            if isinstance(group[-1], Tag):
-                if tag is None:
-                    tag = group.pop()
-                else:
-                    self.parse_error(
-                        'alternatives cannot have multiple tags',
-                        tag.at,
-                    )
-            elif isinstance(group[-1], Directive):
-                directives.append(group.pop())
-            elif isinstance(group[-1], InlineCode):
-                if code is None:
-                    code = group.pop()
-                else:
-                    self.parse_error(
-                        'alternatives can only have one code snippet',
-                        code.token,
-                    )
-            else:
-                break
-        if (
-            len(group) > 0
-            and isinstance(group[0], Predicate)
-        ):
-            predicate = group.pop(0)
-        if len(group) == 0:
-            if tag is not None:
-                self.parse_error(
-                    'alternatives cannot be empty',
-                    tag.at,
-                )
-            elif code is not None:
-                self.parse_error(
-                    'alternatives cannot be empty',
-                    code.token,
-                )
-            elif predicate is not None:
-                self.parse_error(
-                    'alternatives cannot be empty',
-                    predicate.code.token,
-                )
-            else:
-                self.parse_error(
-                    'alternatives cannot be empty',
-                    directives[0].bam,
-                )
-        for elem in group:
-            if isinstance(elem, Tag):
-                self.parse_error(
-                    'tags must be at the end of an alternative',
-                    elem.at,
-                )
-            elif isinstance(elem, Directive):
-                self.parse_error(
-                    'directives must be at the end of an alternative',
-                    elem.bam,
-                )
-            elif isinstance(elem, InlineCode):
-                self.parse_error(
-                    'code snippets must be at the end of an alternative',
-                    elem.token,
-                )
-            elif isinstance(elem, Predicate):
-                self.parse_error(
-                    'predicates must be at the start of an alternative',
-                    elem.code.token,
-                )
-        value = group[0] if len(group) == 1 else Concatenation(group)
-        return value, tag, directives, code, predicate
-    def recursively_parse(
-        self,
-        tokens: list[Token | GrammarExpr]
-    ) -> GrammarExpr:
-        is_kind = lambda t, k: isinstance(t, Token) and t.kind == k
-        tokens = self.handle_parentheses(tokens)
-        tokens = self.handle_ops(tokens)
-        groups = [[]]
-        ors = []
-        for token in tokens:
-            if is_kind(token, TokenKind.OR):
-                if len(groups[-1]) == 0:
-                    self.parse_error('alternatives cannot be empty', token)
-                groups.append([])
-                ors.append(token)
-            else:
-                groups[-1].append(token)
-        if len(groups[-1]) == 0:
-            self.parse_error('alternatives cannot be empty', ors[-1])
-        if len(groups) == 1:
-            if len(groups[0]) == 1:
-                return groups[0][0]
-            return Concatenation(groups[0])
-        values = []
-        for group in groups:
-            if len(group) == 1:
-                values.append(group[0])
-            else:
-                values.append(Concatenation(group))
-        return Union(values, ors)
-    def check_for_illegal_token_tokens(
-        self,
-        tokens: list[Token]
-    ) -> None:
-        for token in tokens:
-            if token.kind == TokenKind.BAM:
-                self.parse_error(
-                    'token definitions cannot contain directives',
-                    token,
-                )
-            elif token.kind == TokenKind.EQUALS:
-                self.parse_error(
-                    'token definitions cannot contain aliases',
-                    token,
-                )
-            elif token.kind == TokenKind.DOT:
-                self.parse_error(
-                    'token definitions cannot contain wildcards',
-                    token,
-                )
-    def extract_things(
-        self,
-        tokens: list[Token | GrammarExpr],
-    ) -> tuple[
-        list[Token | GrammarExpr],
-        Tag,
-        typing.Optional[Predicate],
-    ]:
-        is_kind = lambda t, k: isinstance(t, Token) and t.kind == k
-        out = []
-        i = 0
-        while i < len(tokens):
-            token = tokens[i]
-            if is_kind(token, TokenKind.AT):
-                if (
-                    i + 1 < len(tokens)
-                    and isinstance(tokens[i + 1], Identifier)
-                ):
-                    out.append(Tag(tokens[i + 1], token))
-                    i += 1
-                else:
-                    self.parse_error(
-                        '@ must be followed by an identifier',
-                        token,
-                    )
-            else:
-                out.append(token)
-            i += 1
-        tag = None
-        predicate = None
-        if (
-            len(out) > 1
-            and isinstance(out[0], InlineCode)
-            and is_kind(out[1], TokenKind.QMARK)
-        ):
-            predicate = Predicate(out.pop(0), out.pop(0))
-        i = len(out) - 1
-        while i >= 0:
-            if isinstance(out[i], Tag):
-                if tag is not None:
-                    self.parse_error(
-                        'token definitions cannot have multiple tags',
-                        tag.at,
-                    )
-                tag = out.pop(i)
-            elif isinstance(out[i], InlineCode):
-                self.parse_error(
-                    'token definitions cannot contain code snippets',
-                    out[i].token,
-                )
-            else:
+        tokens = self.tokens
+        start = i = self.index
+        while True:
+            kind = tokens[i].kind
+            if kind == TokenKind.NEWRULE or kind == TokenKind.EOF:
                 break
-            i -= 1
-        if len(out) == 0:
-            if tag is not None:
-                self.parse_error(
-                    'token definitions cannot be empty',
-                    tag.at,
-                )
-            else:
-                self.parse_error(
-                    'token definitions cannot be empty',
-                    predicate.code.token,
-                )
-        for token in out:
-            if isinstance(token, Tag):
-                self.parse_error(
-                    'tags must be at the end of token definitions',
-                    token.at,
-                )
-            elif isinstance(token, InlineCode):
-                self.parse_error(
-                    'token definitions cannot contain code snippets',
-                    token.token,
-                )
-        return out, tag, predicate
-    def check_for_illegal_fragment_tokens(
-        self,
-        tokens: list[Token],
-    ) -> None:
-        for token in tokens:
-            if token.kind == TokenKind.CODE:
-                self.parse_error(
-                    'fragment definitions cannot contain code snippets',
-                    token,
-                )
-            elif token.kind == TokenKind.BAM:
-                self.parse_error(
-                    'fragment definitions cannot contain directives',
-                    token,
-                )
-            elif token.kind == TokenKind.AT:
-                self.parse_error(
-                    'fragment definitions cannot contain tags',
-                    token,
-                )
-            elif token.kind == TokenKind.EQUALS:
-                self.parse_error(
-                    'fragment definitions cannot contain aliases',
-                    token,
-                )
-            elif token.kind == TokenKind.ID:
-                if Identifier(token).is_rule():
-                    self.parse_error(
-                        'fragment definitions cannot contain rule references',
-                        token,
-                    )
-                elif Identifier(token).is_token():
-                    self.parse_error(
-                        'fragment definitions cannot contain token references',
-                        token,
-                    )
-    def check_for_illegal_rule_refs(
-        self,
-        tokens: list[Token | GrammarExpr],
-    ) -> None:
-        for token in tokens:
-            if isinstance(token, Identifier):
-                if token.is_fragment():
-                    self.parse_error(
-                        'rule definitions cannot contain fragment references',
-                        token.token,
-                    )
-    def check_for_illegal_token_refs(
-        self,
-        tokens: list[Token | GrammarExpr],
-    ) -> None:
-        for token in tokens:
-            if isinstance(token, Identifier):
-                if token.is_rule():
-                    self.parse_error(
-                        'token definitions cannot contain rule references',
-                        token.token,
-                    )
-                elif token.is_token():
-                    self.parse_error(
-                        'token definitions cannot contain token references',
-                        token.token,
-                    )
-    def handle_ranges(
-        self,
-        tokens: list[Token | GrammarExpr],
-    ) -> list[Token | GrammarExpr]:
-        is_kind = lambda t, k: isinstance(t, Token) and t.kind == k
-        out = []
-        i = 0
-        while i < len(tokens):
-            token = tokens[i]
-            if is_kind(token, TokenKind.DASH):
-                if (
-                    len(out) == 0
-                    or not isinstance(out[-1], StringLiteral)
-                    or i + 1 == len(tokens)
-                    or not isinstance(tokens[i + 1], StringLiteral)
-                ):
-                    self.parse_error(
-                        '- must have an string on each side',
-                        token,
-                    )
-                rng = Range(out.pop(), tokens[i + 1], token)
-                if len(rng.low.value) != 1:
-                    self.parse_error(
-                        'range bounds must be a single character',
-                        rng.low.token,
-                    )
-                if len(rng.high.value) != 1:
-                    self.parse_error(
-                        'range bounds must be a single character',
-                        rng.high.token,
-                    )
-                out.append(rng)
-                i += 1
-            else:
-                out.append(token)
+            if kind == TokenKind.COLON:
+                self.index = i
+                self.parse_error('unexpected colon', tokens[i])
             i += 1
-        return out
+        self.index = i
+        return tokens[start:i]
     def parse_error(self, msg: str, token: Token):
         raise GrammarError(
             msg,
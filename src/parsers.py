@@ -1,73 +1,703 @@
-from zparse.tokenizers import BaseTokenizer
+from __future__ import annotations
 
-from zparse.tokenizers import Token # TODO: remove
+import functools
+import typing
+import array
+import enum
+import operator
+
+from zparse.errors import GrammarError, ParseError
+from zparse.metalang import Parser, Grammar
+from zparse.codegen import ParserGenerator
+from zparse.tokenizers import (
+    BaseTokenizer,
+    Token,
+    TokenBuffer,
+    BufferToken,
+    make_class as make_tokenizer_class,
+    check_for_illegal_token_names,
+    check_for_illegal_tag_names,
+    engines,
+    cache_size,
+)
+
+reserved_tag_names = [
+    '__init__',
+    'Tokenizer',
+    'parse',
+    'parse_tokens',
+    'parse_token_stream',
+    'parse_stream',
+    'parse_async',
+    'parse_events',
+    'run',
+    'cut',
+    'fail_after_cut',
+    'make_memo',
+    'find_farthest',
+    'rule_tags',
+    'last_position',
+    'syntax_error',
+    'start_rule',
+    'source',
+    'info',
+    'memo',
+    'memoized',
+    'first',
+    'alternative_first',
+    'follow',
+    'nullable',
+    'remember',
+    'edit',
+    'rule_names',
+    'events',
+    'has_actions',
+    'profile',
+    'profiled',
+    'make_profile',
+    'new_profile',
+]
+
+memos = ['dense', 'dict', 'incremental']
+trees = ['nodes', 'arena']
+
+# the number of threads parse_async parses in by default. Parsing holds the
+# GIL, so more threads would not parse faster, and with a dedicated pool
+# parses do not take up the event loop's default executor.
+async_workers = 4
+
+@functools.lru_cache(maxsize=None)
+def async_executor() -> typing.Any:
+    # imported here to keep it off the import path of zparse
+    import concurrent.futures
+    return concurrent.futures.ThreadPoolExecutor(
+        async_workers,
+        thread_name_prefix='zparse',
+    )
+
+class Node:
+    __slots__ = ('kind', 'children')
+    def __init__(self, kind: str, children: list):
+        self.kind = kind
+        self.children = children
+    def __repr__(self):
+        return f'{self.kind}({", ".join(map(repr, self.children))})'
+
+# sentinel for positions a rule has not been tried at yet
+MISS = object()
+
+class MemoRow(dict):
+    # a sparse memo row for parsing token streams of unknown length
+    def __missing__(self, pos: int) -> object:
+        return MISS
+
+class TokenWindow:
+    # the tokens from the last cut to the farthest token the parser has
+    # looked at. Tokens are pulled from the iterator as they are needed, and
+    # positions before the last cut read as -1, which matches no token.
+    def __init__(self, tokens: typing.Iterable[Token], EOF: enum.Enum):
+        self.tokens = iter(tokens)
+        self.EOF = EOF
+        self.kinds = []
+        self.window = []
+        self.base = 0
+        self.done = False
+        self.farthest = 0
+    def __repr__(self):
+        return f'TokenWindow({self.base}, {len(self.window)} tokens)'
+    def __getitem__(self, pos: int) -> int:
+        if pos > self.farthest:
+            self.farthest = pos
+        i = pos - self.base
+        if i < 0:
+            return -1
+        kinds = self.kinds
+        while i >= len(kinds):
+            if self.done:
+                return 0
+            self.pull()
+        return kinds[i]
+    def pull(self) -> None:
+        token = next(self.tokens, None)
+        if token is None:
+            self.done = True
+            return
+        self.kinds.append(token.kind.value)
+        self.window.append(token)
+        if token.kind == self.EOF:
+            self.done = True
+    def token(self, pos: int) -> Token:
+        return self.window[pos - self.base]
+    def last_position(self) -> int:
+        return self.base + len(self.window) - 1
+    def drop(self, pos: int) -> None:
+        i = pos - self.base
+        del self.kinds[:i]
+        del self.window[:i]
+        self.base = pos
+
+class FarthestKinds:
+    # token kinds that remember the farthest position the parser looked at
+    def __init__(self, kinds: array.array):
+        self.kinds = kinds
+        self.farthest = 0
+    def __repr__(self):
+        return f'FarthestKinds({self.farthest})'
+    def __getitem__(self, pos: int) -> int:
+        if pos > self.farthest:
+            self.farthest = pos
+        return self.kinds[pos]
+    def __setitem__(self, index: int | slice, value: typing.Any) -> None:
+        self.kinds[index] = value
+
+class Rescanned(Exception):
+    pass
+
+class Stopped(Exception):
+    pass
+
+# the node of a committed rule, whose events were emitted already
+EMITTED = object()
+
+class Frame(list):
+    # the children a generated function has matched so far. A frame is
+    # entered once a cut commits its rule and its enter event is emitted.
+    __slots__ = ('name', 'entered')
+    def __init__(self, name: str | None):
+        self.name = name
+        self.entered = False
+
+class EventSink:
+    # the events of the committed part of the tree. They are handed to the
+    # reading thread batch_size at a time, and the parser waits while the
+    # reader is two batches behind.
+    def __init__(self, batches: typing.Any, batch_size: int):
+        self.batches = batches
+        self.batch_size = batch_size
+        self.events = []
+        self.stopped = False
+    def __repr__(self):
+        return f'EventSink({len(self.events)} events)'
+    def commit(self, frames: list[Frame]) -> None:
+        events = self.events
+        for frame in frames:
+            if not frame.entered:
+                frame.entered = True
+                if frame.name is not None:
+                    events.append(('enter', frame.name))
+            for child in frame:
+                self.emit(child)
+            frame.clear()
+        self.flush(self.batch_size)
+    def close(self, kind: str, frame: Frame) -> Node | object:
+        # builds the node of a rule that matched, unless the rule was
+        # committed, in which case the rest of its events are emitted
+        if not frame.entered:
+            return Node(kind, frame)
+        for child in frame:
+            self.emit(child)
+        self.events.append(('exit', kind))
+        self.flush(self.batch_size)
+        return EMITTED
+    def emit(self, child: typing.Any) -> None:
+        if child is EMITTED:
+            return
+        if isinstance(child, Node):
+            self.events.append(('enter', child.kind))
+            for grandchild in child.children:
+                self.emit(grandchild)
+            self.events.append(('exit', child.kind))
+        else:
+            self.events.append(('token', child))
+    def flush(self, size: int) -> None:
+        if len(self.events) >= size:
+            if self.stopped:
+                raise Stopped()
+            self.batches.put(self.events)
+            self.events = []
+
+def keep_node(node: Node) -> Node:
+    return node
 
-# FIXME
 class BaseParser:
-    def __init__(self, code: str):
+    def __init__(self, code: str=''):
         self.code = code
+        self.profile = None
+    def parse(self, tree: str='nodes') -> typing.Any:
+        return self.parse_tokens(
+            self.Tokenizer(self.code).token_buffer(),
+            tree,
+        )
+    def parse_tokens(
+        self,
+        buffer: TokenBuffer,
+        tree: str='nodes',
+    ) -> typing.Any:
+        if tree not in trees:
+            raise ValueError(f'tree must be one of {", ".join(trees)}')
+        if tree == 'arena' and (self.rule_tags or self.has_actions):
+            raise ValueError(
+                'parsers with rule tags or actions cannot build arena trees'
+            )
+        # the extra 0 after EOF lets the generated code look one token past
+        # the end without a bounds check
+        kinds = buffer.kinds + array.array('i', [0])
+        tok = functools.partial(BufferToken, buffer)
+        self._buffer = buffer
+        memo = self.make_memo(len(kinds))
+        if self.memo == 'incremental':
+            # the incremental layout records how far each rule looks ahead
+            kinds = FarthestKinds(kinds)
+        if tree == 'nodes':
+            return self.run(kinds, tok, memo, None)
+        # imported here because arena views subclass Node
+        from zparse.arena import Arena
+        arena = Arena(buffer, self.rule_names)
+        # the arena only stores token positions, as negative ints
+        return arena.node(
+            self.run(kinds, operator.invert, memo, None, arena.add, tok)
+        )
+    def parse_token_stream(
+        self,
+        tokens: typing.Iterable[Token],
+    ) -> typing.Any:
+        window = TokenWindow(tokens, self.Tokenizer.TokenKind.EOF)
+        return self.run(window, window.token, self.make_memo(None), window)
+    def parse_stream(
+        self,
+        fp: typing.TextIO,
+        chunk_size: int=65536,
+    ) -> typing.Any:
+        tokenizer = self.Tokenizer()
+        return self.parse_token_stream(
+            tokenizer.tokens_from_stream(fp, chunk_size)
+        )
+    async def parse_async(
+        self,
+        reader: typing.Any,
+        chunk_size: int=65536,
+        batch_size: int=1024,
+        executor: typing.Any=None,
+    ) -> typing.Any:
+        # the generated rules cannot suspend, so the parse runs in a thread
+        # of executor (async_executor() by default) and pulls its tokens
+        # from atokens on the event loop, batch_size at a time. The loop
+        # runs other tasks while the thread waits for a batch, and the GIL
+        # switches between them while the parser works.
+        import asyncio
+        loop = asyncio.get_running_loop()
+        tokens = self.Tokenizer().atokens(reader, chunk_size)
+        stopped = False
+        async def next_batch():
+            batch = []
+            async for token in tokens:
+                batch.append(token)
+                if len(batch) == batch_size:
+                    break
+            return batch
+        def pull():
+            # stops early if the task is cancelled, so the thread ends
+            while not stopped:
+                batch = asyncio.run_coroutine_threadsafe(
+                    next_batch(),
+                    loop,
+                ).result()
+                if not batch:
+                    return
+                yield from batch
+        try:
+            return await loop.run_in_executor(
+                async_executor() if executor is None else executor,
+                self.parse_token_stream,
+                pull(),
+            )
+        finally:
+            stopped = True
+    def parse_events(
+        self,
+        batch_size: int=4096,
+    ) -> typing.Iterator[tuple[str, typing.Any]]:
+        if not self.events:
+            raise ValueError(
+                'parse_events needs a parser made with events=True'
+            )
+        # imported here to keep them off the import path of zparse
+        import queue
+        import threading
+        sink = EventSink(queue.Queue(2), batch_size)
+        thread = threading.Thread(
+            target=produce_events,
+            args=(self, sink),
+            daemon=True,
+        )
+        return read_events(thread, sink)
+    def make_memo(self, size: int | None) -> dict | list:
+        if self.memo == 'dict':
+            return {}
+        elif size is None:
+            # streams have an unknown length, so their rows are sparse
+            return [
+                MemoRow() if memoized else None
+                for memoized in self.memoized
+            ]
+        # one slot per token position (and one for the sentinel)
+        return [
+            [MISS] * size if memoized else None
+            for memoized in self.memoized
+        ]
+    def run(
+        self,
+        kinds: array.array | TokenWindow,
+        tok: typing.Callable,
+        memo: dict | list,
+        window: TokenWindow | None,
+        node: typing.Callable=Node,
+        token: typing.Callable | None=None,
+        events: EventSink | None=None,
+    ) -> typing.Any:
+        # tok and node are what the generated code fetches tokens and builds
+        # nodes with, and token makes the tokens in syntax errors (tok by
+        # default)
+        self._kinds = kinds
+        self._tok = tok
+        self._node = node
+        self._token = tok if token is None else token
+        self._events = events
+        self._frames = []
+        self._memo = memo
+        self._window = window
+        self._cut_pos = 0
+        self._growing = 0
+        # the leaders of left recursive components with several leaders
+        # that are growing, as (rule number, position)
+        self._heads = set()
+        self._rescanning = False
+        if self.profiled:
+            self._profiler = self.make_profile()
+        EOF = self.Tokenizer.TokenKind.EOF.value
+        try:
+            result = self.start_rule(0)
+            if result is not None and kinds[result[0]] == EOF:
+                return result[1]
+            self.syntax_error(0 if result is None else result[0])
+        finally:
+            self._memo = self._kinds = self._tok = self._token = None
+            self._node = self._events = self._frames = None
+            self._window = self._buffer = None
+    def make_profile(self) -> typing.Any:
+        # one profile adds up every parse of the parser object
+        if self.profile is None:
+            self.profile = self.new_profile()
+        return self.profile
+    def new_profile(self) -> typing.Any:
+        # imported here to keep it off the import path of zparse
+        from zparse.profiling import Profile
+        alternatives = self.alternative_first
+        return Profile(
+            self.rule_names,
+            [len(alternatives[name]) for name in self.rule_names],
+            self.memoized,
+        )
+    def remember(
+        self,
+        rule_id: int,
+        pos: int,
+        result: tuple | None,
+        outer: int,
+    ) -> None:
+        # stores a result in the incremental memo layout, relative to pos
+        kinds = self._kinds
+        lookahead = kinds.farthest - pos
+        if result is None:
+            self._memo[rule_id][pos] = (lookahead, None, None)
+        else:
+            self._memo[rule_id][pos] = (lookahead, result[0] - pos, result[1])
+        if outer > kinds.farthest:
+            kinds.farthest = outer
+    def cut(self, pos: int) -> None:
+        # the parser will not backtrack before pos, so the tokens and memo
+        # entries before it can be dropped, and the rules that are running
+        # are committed
+        if self._growing or self._rescanning:
+            return
+        if self._events is not None:
+            self._events.commit(self._frames)
+        if pos <= self._cut_pos:
+            return
+        start, self._cut_pos = self._cut_pos, pos
+        memo = self._memo
+        if self._window is not None:
+            self._window.drop(pos)
+        else:
+            self._kinds[start:pos] = array.array('i', [-1]) * (pos - start)
+        if self.memo == 'dict':
+            self._memo = {
+                key: result for key, result in memo.items()
+                if key[1] >= pos
+            }
+        elif self._window is not None:
+            self._memo = [
+                None if row is None else MemoRow(
+                    (p, result) for p, result in row.items() if p >= pos
+                )
+                for row in memo
+            ]
+        else:
+            for row in memo:
+                if row is not None:
+                    row[start:pos] = [MISS] * (pos - start)
+    def fail_after_cut(self, pos: int) -> None:
+        if self._rescanning:
+            raise Rescanned()
+        self.syntax_error(pos)
+    def find_farthest(self) -> int:
+        # parses the input again and records every token the parser looks
+        # at. The farthest one is where the input went wrong. Tags are
+        # swapped for keep_node so they do not run twice.
+        kinds = FarthestKinds(self._buffer.kinds + array.array('i', [0]))
+        self._kinds = kinds
+        self._memo = self.make_memo(len(kinds.kinds))
+        self._rescanning = True
+        for tag in self.rule_tags:
+            setattr(self, tag, keep_node)
+        if self.profiled:
+            # the rescan is not part of the parse, so it is recorded in a
+            # profile that is thrown away
+            self._profiler = self.new_profile()
+        try:
+            self.start_rule(0)
+        except Rescanned:
+            pass
+        finally:
+            for tag in self.rule_tags:
+                delattr(self, tag)
+            self._rescanning = False
+            if self.profiled:
+                self._profiler = self.profile
+        return kinds.farthest
+    def last_position(self) -> int:
+        if self._window is not None:
+            return self._window.last_position()
+        return len(self._buffer) - 1
+    def syntax_error(self, end: int) -> None:
+        if self._window is not None:
+            farthest = self._window.farthest
+        else:
+            farthest = self.find_farthest()
+        pos = max(end, farthest, self._cut_pos)
+        pos = min(pos, self.last_position())
+        token = self._token(pos)
+        raise ParseError(
+            f'unexpected token {token.text!r} on line {token.line} '
+            f'and column {token.column}',
+            (token,),
+        )
+
+def produce_events(parser: BaseParser, sink: EventSink) -> None:
+    # parses in the producer thread. Tokens are pulled as they are needed
+    # and dropped at cuts, like in parse_token_stream.
+    Tokenizer = parser.Tokenizer
+    window = TokenWindow(
+        Tokenizer(parser.code).tokens(),
+        Tokenizer.TokenKind.EOF,
+    )
+    try:
+        root = parser.run(
+            window,
+            window.token,
+            parser.make_memo(None),
+            window,
+            sink.close,
+            None,
+            sink,
+        )
+        sink.emit(root)
+        sink.flush(1)
+        sink.batches.put(None)
+    except Stopped:
+        pass
+    except Exception as e:
+        sink.batches.put(e)
 
+def read_events(
+    thread: typing.Any,
+    sink: EventSink,
+) -> typing.Iterator[tuple[str, typing.Any]]:
+    import queue
+    thread.start()
+    try:
+        while True:
+            batch = sink.batches.get()
+            if batch is None:
+                return
+            if isinstance(batch, Exception):
+                raise batch
+            yield from batch
+    finally:
+        # a reader that stops early unblocks the producer, which stops at
+        # its next batch
+        sink.stopped = True
+        while thread.is_alive():
+            try:
+                sink.batches.get(timeout=0.01)
+            except queue.Empty:
+                pass
 
-# FIXME
 def make_parser(
     code: str,
     base: type=BaseParser,
     name: str='AnonymousParser',
     tok_base: type=BaseTokenizer,
     tok_name: str='AnonymousTokenizer',
+    allow_big_implicits: bool=False,
+    engine: str='regex',
+    memo: str='dense',
+    cache_dir: str | None=None,
+    events: bool=False,
+    profile: bool=False,
+    instrument: bool=False,
 ) -> type:
-    class AnonymousParser(BaseParser):
-        def parse(self):
-            return start([
-                stmt(assign_stmt(
-                    Token('a', x, 0, 0, 0),
-                    expr(None, None, [
-                        expr(Token('1', y, 0, 0, 0), None, [], None),
-                        expr(None, None, [
-                            expr(Token('3', y, 0, 0, 0), None, [], None),
-                            expr(Token('5', y, 0, 0, 0), None, [], None),
-                        ], None),
-                    ], None)
-                ), v()),
-                stmt(None, print_stmt(
-                    Token('print', z, 0, 0, 0),
-                    expr(None, None, [
-                        expr(None, Token('a', x, 0, 0, 0), [], None),
-                        expr(Token('2', y, 0, 0, 0), None, [], None)
-                    ], Token('**', w, 0, 0, 0)),
-                )),
-            ])
-    return AnonymousParser
-
-class x: name = 'NAME'
-class y: name = 'INT'
-class z: name = 'PRINT'
-class w: name = 'POW'
-class v: __repr__ = lambda s: 'None'
-
-class start:
-    def __init__(self, stmt): self.stmt = stmt
-    def __repr__(self): return 'start()'
-
-class stmt:
-    def __init__(self, assign_stmt, print_stmt):
-        self.assign_stmt, self.print_stmt = assign_stmt, print_stmt
-    def __repr__(self): return 'stmt()'
-
-class print_stmt:
-    def __init__(self, PRINT, expr):
-        self.PRINT, self.expr = PRINT, expr
-    def __repr__(self):
-        return 'print_stmt()'
+    # instrumented tokenizer classes keep their stats on the class, so every
+    # call makes new classes instead of sharing the stats with the other
+    # callers. Profiles are kept on the parser objects.
+    build = build_parser if instrument else cached_parser
+    return build(
+        code,
+        base,
+        name,
+        tok_base,
+        tok_name,
+        allow_big_implicits,
+        engine,
+        memo,
+        cache_dir,
+        events,
+        profile,
+        instrument,
+    )
 
-class assign_stmt:
-    def __init__(self, NAME, expr):
-        self.NAME, self.expr = NAME, expr
-    def __repr__(self):
-        return 'assign_stmt()'
+def build_parser(
+    code: str,
+    base: type,
+    name: str,
+    tok_base: type,
+    tok_name: str,
+    allow_big_implicits: bool,
+    engine: str,
+    memo: str,
+    cache_dir: str | None,
+    events: bool,
+    profile: bool,
+    instrument: bool,
+) -> type:
+    if not issubclass(base, BaseParser):
+        raise ValueError('base must subclass parsers.BaseParser')
+    if not issubclass(tok_base, BaseTokenizer):
+        raise ValueError('tok_base must subclass tokenizers.BaseTokenizer')
+    if engine not in engines:
+        raise ValueError(f'engine must be one of {", ".join(engines)}')
+    if memo not in memos:
+        raise ValueError(f'memo must be one of {", ".join(memos)}')
+    if events and memo == 'incremental':
+        raise ValueError('events cannot be used with the incremental memo')
+    if instrument and engine != 'regex':
+        raise ValueError('instrument can only be used with the regex engine')
+    if cache_dir is not None:
+        # imported here because the cache is built on the compiler, which
+        # imports this module
+        from zparse.cache import load_classes
+        return load_classes(
+            cache_dir,
+            code,
+            base=base,
+            name=name,
+            tok_base=tok_base,
+            tok_name=tok_name,
+            allow_big_implicits=allow_big_implicits,
+            engine=engine,
+            mode='text',
+            memo=memo,
+            events=events,
+            profile=profile,
+            instrument=instrument,
+            with_parser=True,
+        )[name]
+    grammar = Parser(code).parse()
+    check_for_illegal_token_names(grammar)
+    check_for_illegal_tag_names(grammar, tok_base)
+    check_for_illegal_rule_tags(grammar)
+    Tokenizer = make_tokenizer_class(
+        tok_name,
+        tok_base,
+        grammar,
+        allow_big_implicits,
+        engine,
+        'text',
+        instrument,
+    )
+    return make_class(name, base, grammar, Tokenizer, memo, events, profile)
 
-class expr:
-    def __init__(self, INT, NAME, expr, POW):
-        self.INT, self.NAME, self.expr, self.POW = INT, NAME, expr, POW
-    def __repr__(self):
-        return 'expr()'
\ No newline at end of file
+cached_parser = functools.lru_cache(maxsize=cache_size)(build_parser)
+make_parser.cache_info = cached_parser.cache_info
+make_parser.cache_clear = cached_parser.cache_clear
+
+def make_class(
+    name: str,
+    base: type,
+    grammar: Grammar,
+    Tokenizer: type,
+    memo: str='dense',
+    events: bool=False,
+    profile: bool=False,
+) -> type:
+    if not grammar.rule_definitions:
+        raise GrammarError('grammar does not define any rules')
+    generator = ParserGenerator(
+        grammar,
+        Tokenizer.TokenKind,
+        memo,
+        events,
+        profile,
+    )
+    source = generator.generate()
+    namespace = {'Node': Node, 'MISS': MISS, 'Frame': Frame}
+    exec(compile(source, f'<{name}>', 'exec'), namespace)
+    start = grammar.rule_definitions[0].name.name
+    return type(name, (base,), {
+        'Tokenizer': Tokenizer,
+        'start_rule': namespace[f'rule_{start}'],
+        'source': source,
+        'info': generator.info,
+        **parser_tables(generator, Tokenizer.TokenKind),
+    })
+
+def parser_tables(generator: ParserGenerator, TokenKind: type) -> dict:
+    # the class attributes that only depend on the grammar
+    info = generator.info
+    members = TokenKind.__members__
+    kinds = lambda names: frozenset(members[name] for name in names)
+    return {
+        'first': {rule: kinds(names) for rule, names in info.first.items()},
+        'alternative_first': {
+            rule: [kinds(names) for names in alternatives]
+            for rule, alternatives in info.alternative_first.items()
+        },
+        'follow': {rule: kinds(names) for rule, names in info.follow.items()},
+        'nullable': dict(info.nullable),
+        'memo': generator.memo,
+        'events': generator.events,
+        'profiled': generator.profile,
+        'memoized': generator.memoized,
+        'rule_tags': info.tags,
+        'has_actions': info.has_actions,
+        'rule_names': list(info.rules),
+    }
+
+def check_for_illegal_rule_tags(grammar: Grammar) -> None:
+    for rule_def in grammar.rule_definitions:
+        for alt in rule_def.alternatives:
+            if alt.tag is not None and alt.tag.name.name in reserved_tag_names:
+                raise GrammarError(
+                    f'{alt.tag.name.name!r} is an illegal tag name',
+                    (alt.tag.name,),
+                )
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import time
+
+# A Profile collects the counters and timings of a parser made with
+# profile=True. The generated rule functions increment the counters
+# directly, and every evaluation of a rule's body is timed between enter and
+# exit, which keep a stack of the bodies that are running. A body's self time
+# is its time minus the time of the bodies it called, and self time is also
+# added up for every stack of rules, for flame graphs. Memo hits are counted
+# but not timed, and the time of helper functions goes to their rule.
+
+class Profile:
+    def __init__(
+        self,
+        rule_names: list[str],
+        alternatives: list[int],
+        memoized: list[bool],
+    ):
+        count = len(rule_names)
+        self.rule_names = rule_names
+        self.memoized = memoized
+        self.calls = [0] * count
+        self.hits = [0] * count
+        self.evaluations = [0] * count
+        self.grows = [0] * count
+        self.failed = [[0] * alts for alts in alternatives]
+        self.cumulative = [0.0] * count
+        self.own = [0.0] * count
+        self.active = [0] * count
+        # [rule id, start time, time of the bodies it called, stack of rules]
+        self.stack = []
+        self.stacks = {}
+    def __repr__(self):
+        return f'Profile({sum(self.calls)} calls)'
+    def enter(self, rule_id: int) -> None:
+        stack = self.stack
+        path = stack[-1][3] + (rule_id,) if stack else (rule_id,)
+        self.evaluations[rule_id] += 1
+        self.active[rule_id] += 1
+        stack.append([rule_id, time.perf_counter(), 0.0, path])
+    def exit(self, rule_id: int) -> None:
+        now = time.perf_counter()
+        stack = self.stack
+        _, start, called, path = stack.pop()
+        elapsed = now - start
+        own = elapsed - called
+        self.own[rule_id] += own
+        self.stacks[path] = self.stacks.get(path, 0.0) + own
+        self.active[rule_id] -= 1
+        # the time of a recursive evaluation is part of the outermost one
+        if not self.active[rule_id]:
+            self.cumulative[rule_id] += elapsed
+        if stack:
+            stack[-1][2] += elapsed
+    def to_dict(self) -> dict[str, dict]:
+        return {
+            name: {
+                'calls': self.calls[i],
+                'memo_hits': self.hits[i],
+                'memo_misses': (
+                    self.calls[i] - self.hits[i] if self.memoized[i] else 0
+                ),
+                'evaluations': self.evaluations[i],
+                'grow_iterations': self.grows[i],
+                'failed_alternatives': list(self.failed[i]),
+                'cumulative_time': self.cumulative[i],
+                'self_time': self.own[i],
+            }
+            for i, name in enumerate(self.rule_names)
+        }
+    def to_json(self, **options: object) -> str:
+        # imported here to keep it off the import path of zparse
+        import json
+        return json.dumps(self.to_dict(), **options)
+    def collapsed(self) -> str:
+        # one line per stack of rules with its self time in microseconds,
+        # which is the format flamegraph.pl and speedscope read
+        names = self.rule_names
+        lines = sorted(
+            f'{";".join(names[i] for i in path)} {round(seconds * 1e6)}'
+            for path, seconds in self.stacks.items()
+        )
+        return ''.join(line + '\n' for line in lines)
+
+# TokenStats collects the numbers of a tokenizer made with instrument=True,
+# for every token definition in the order they are tried. The instrumented
+# scanner times every regex match, and tag functions are timed both when
+# they are called and while handle_tag_function runs the generators they
+# return.
+
+class TokenStats:
+    def __init__(self, names: list[str]):
+        self.names = names
+        self.reset()
+    def __repr__(self):
+        return f'TokenStats({sum(self.won)} tokens)'
+    def reset(self) -> None:
+        count = len(self.names)
+        self.tried = [0] * count
+        self.matched = [0] * count
+        self.won = [0] * count
+        self.regex_time = [0.0] * count
+        self.predicates = [0] * count
+        self.tag_time = [0.0] * count
+    def to_dict(self) -> dict[str, dict]:
+        return {
+            name: {
+                'tried': self.tried[i],
+                'matched': self.matched[i],
+                'won': self.won[i],
+                'regex_time': self.regex_time[i],
+                'predicate_evaluations': self.predicates[i],
+                'tag_time': self.tag_time[i],
+            }
+            for i, name in enumerate(self.names)
+        }
+    def to_json(self, **options: object) -> str:
+        # imported here to keep it off the import path of zparse
+        import json
+        return json.dumps(self.to_dict(), **options)
@@ -1,11 +1,19 @@
-import networkx as nx
+from __future__ import annotations
+
+import functools
 import typing
+import codecs
+import copy
+import array
 import enum
 import types
 import re
+import warnings
 
 from zparse.errors import GrammarError, TokenError
-from zparse.metalang import Parser, Grammar
+from zparse.metalang import Parser, Grammar, GrammarExpr, literal_regex
+from zparse.dfa import DFA, make_dfa
+from zparse.lines import LineIndex, WindowLineIndex
 
 # TODO: check of tokens match the empty string,
 #       check if patterns get matched by earlier tokens (eg '>' then '>>')
@@ -15,138 +23,916 @@ from zparse.metalang import Parser, Grammar
 #       limit implicit tokens to single characters...
 
 reserved_token_names = ['EOF']
-reserved_tag_names = ['__init__', 'handle_tag_function', 'TokenKind', 'tokens']
+reserved_tag_names = [
+    '__init__',
+    'handle_tag_function',
+    'TokenKind',
+    'tokens',
+    'token_buffer',
+    'tokens_from_stream',
+    'atokens',
+    'text',
+    'checkpoint',
+    'restore',
+    'checkpoints',
+    'checkpoint_interval',
+    'checkpoint_attrs',
+    'stats',
+]
+
+class Token:
+    # the position is stored as offset and read through start, which
+    # subclasses can override to store positions in another form.
+    # Tokens used to be named tuples of (text, kind, line, column, code), and
+    # that constructor, iteration, indexing and _replace still work with a
+    # DeprecationWarning.
+    __slots__ = ('text', 'kind', 'offset', 'source')
+    _fields = ('text', 'kind', 'line', 'column', 'code')
+    def __init__(
+        self,
+        text: str,
+        kind: enum.Enum,
+        start: int,
+        source: LineIndex,
+        code: str | None=None,
+    ):
+        self.text = text
+        self.kind = kind
+        if code is None:
+            self.offset = start
+            self.source = source
+        else:
+            deprecated(
+                'Token(text, kind, line, column, code) is deprecated, use '
+                'Token(text, kind, start, source) or Token.from_position'
+            )
+            self.source = LineIndex(code)
+            self.offset = offset_of(self.source, start, source)
+    @classmethod
+    def from_position(
+        cls,
+        text: str,
+        kind: enum.Enum,
+        line: int,
+        column: int,
+        code: str,
+    ) -> Token:
+        # a token at a line (from 1) and column (from 0) of code, like the
+        # old constructor
+        source = LineIndex(code)
+        return cls(text, kind, offset_of(source, line, column), source)
+    def __iter__(self):
+        deprecated('tokens are no longer tuples, use their attributes')
+        return iter((
+            self.text, self.kind, self.line, self.column, self.source.code,
+        ))
+    def __getitem__(self, index: int | slice) -> typing.Any:
+        deprecated('tokens are no longer tuples, use their attributes')
+        return (
+            self.text, self.kind, self.line, self.column, self.source.code,
+        )[index]
+    def _replace(self, **changes) -> Token:
+        # accepts the old fields, and start and source
+        deprecated('Token._replace is deprecated, make a new Token')
+        unknown = set(changes) - {*self._fields, 'start', 'source'}
+        if unknown:
+            raise ValueError(f'unknown token fields {sorted(unknown)}')
+        text = changes.get('text', self.text)
+        kind = changes.get('kind', self.kind)
+        if {'line', 'column', 'code'} & set(changes):
+            source = LineIndex(changes.get('code', self.source.code))
+            start = offset_of(
+                source,
+                changes.get('line', self.line),
+                changes.get('column', self.column),
+            )
+        else:
+            source = changes.get('source', self.source)
+            start = changes.get('start', self.start)
+        return type(self)(text, kind, start, source)
+    def _asdict(self) -> dict:
+        deprecated('Token._asdict is deprecated, use the attributes')
+        return dict(zip(self._fields, (
+            self.text, self.kind, self.line, self.column, self.source.code,
+        )))
+    def __repr__(self):
+        if self.kind.name.startswith('_'):
+            return f'Token({self.text!r})'
+        return f'Token({self.text!r}, {self.kind.name})'
+    def __eq__(self, other):
+        if not isinstance(other, (Token, BufferToken)):
+            return NotImplemented
+        return (
+            self.text == other.text
+            and self.kind == other.kind
+            and self.start == other.start
+        )
+    def __hash__(self):
+        return hash((self.text, self.kind, self.start))
+    @property
+    def start(self) -> int:
+        return self.offset
+    @property
+    def end(self) -> int:
+        return self.start + len(self.text)
+    @property
+    def line(self) -> int:
+        return self.source.line(self.start)
+    @property
+    def column(self) -> int:
+        return self.source.column(self.start)
+    @property
+    def code(self) -> str:
+        code = self.source.code
+        if code is None:
+            raise ValueError('tokens read from a stream do not keep the code')
+        return code
+
+def deprecated(msg: str) -> None:
+    warnings.warn(msg, DeprecationWarning, stacklevel=3)
 
-class Token(typing.NamedTuple):
-    text: str
+def offset_of(source: LineIndex, line: int, column: int) -> int:
+    if line == 1:
+        return column
+    newlines = source.newlines
+    if newlines is None:
+        newlines = source.build()
+    return newlines[line - 2] + 1 + column
+
+class Span(typing.NamedTuple):
     kind: enum.Enum
+    start: int
+    end: int
+    def __repr__(self):
+        return f'Span({self.kind.name}, {self.start}, {self.end})'
+
+class Checkpoint(typing.NamedTuple):
+    offset: int
     line: int
     column: int
-    code: str
+    state: dict
+    def __repr__(self):
+        return f'Checkpoint({self.offset}, {self.line}, {self.column})'
+
+class TokenBuffer:
+    def __init__(self, source: LineIndex, TokenKind: type):
+        self.source = source
+        self.code = source.code
+        self.TokenKind = TokenKind
+        self.kind_list = [None, *TokenKind]
+        self.kinds = array.array('i')
+        self.starts = array.array('q')
+        self.ends = array.array('q')
+        self.texts = {}
+    def __repr__(self):
+        return f'TokenBuffer({len(self.kinds)} tokens)'
+    def __len__(self) -> int:
+        return len(self.kinds)
+    def __getitem__(self, index: int) -> BufferToken:
+        if index < 0:
+            index += len(self.kinds)
+        if not 0 <= index < len(self.kinds):
+            raise IndexError('token buffer index out of range')
+        return BufferToken(self, index)
+    def __iter__(self) -> typing.Iterator[BufferToken]:
+        for index in range(len(self.kinds)):
+            yield BufferToken(self, index)
+    def append(self, kind_id: int, start: int, end: int) -> None:
+        self.kinds.append(kind_id)
+        self.starts.append(start)
+        self.ends.append(end)
+    def append_token(self, token: Token | Span, start: int, end: int) -> None:
+        if isinstance(token, Span):
+            self.append(token.kind._value_, token.start, token.end)
+            return
+        # tokens emitted by tag functions can carry text that is not in the
+        # code, so that text is stored on the side
+        if self.code[start:end] != token.text:
+            self.texts[len(self.kinds)] = token.text
+            end = start
+        self.append(token.kind.value, start, end)
+    def text(self, index: int) -> str:
+        if index in self.texts:
+            return self.texts[index]
+        return self.code[self.starts[index]:self.ends[index]]
+    def kind(self, index: int) -> enum.Enum:
+        return self.kind_list[self.kinds[index]]
+
+class BufferToken:
+    __slots__ = ('buffer', 'index')
+    def __init__(self, buffer: TokenBuffer, index: int):
+        self.buffer = buffer
+        self.index = index
     def __repr__(self):
         if self.kind.name.startswith('_'):
             return f'Token({self.text!r})'
         return f'Token({self.text!r}, {self.kind.name})'
+    # equal to the Token of the same text, kind and start
+    def __eq__(self, other):
+        if not isinstance(other, (Token, BufferToken)):
+            return NotImplemented
+        return (
+            self.text == other.text
+            and self.kind == other.kind
+            and self.start == other.start
+        )
+    def __hash__(self):
+        return hash((self.text, self.kind, self.start))
+    @property
+    def text(self) -> str:
+        return self.buffer.text(self.index)
+    @property
+    def kind(self) -> enum.Enum:
+        return self.buffer.kind_list[self.buffer.kinds[self.index]]
+    @property
+    def line(self) -> int:
+        return self.buffer.source.line(self.buffer.starts[self.index])
+    @property
+    def column(self) -> int:
+        return self.buffer.source.column(self.buffer.starts[self.index])
+    @property
+    def code(self) -> str:
+        return self.buffer.code
+    @property
+    def start(self) -> int:
+        return self.buffer.starts[self.index]
+    @property
+    def end(self) -> int:
+        return self.buffer.ends[self.index]
 
 class BaseTokenizer:
-    def __init__(self, code: str):
+    # tokens() records a checkpoint every checkpoint_interval characters
+    # (if it is set), with copies of the attributes named in
+    # checkpoint_attrs
+    checkpoint_interval = None
+    checkpoint_attrs = ()
+    def __init__(self, code: str=''):
         self.code = code
+        self.checkpoints = []
     def ignore(self, token: Token):
         pass
+    def checkpoint(self, source: LineIndex, pos: int) -> Checkpoint:
+        line, column = source.position(pos)
+        state = {
+            attr: copy.deepcopy(getattr(self, attr))
+            for attr in self.checkpoint_attrs
+        }
+        return Checkpoint(pos, line, column, state)
+    def restore(self, checkpoint: Checkpoint) -> int:
+        # the state is copied again so the checkpoint can be reused
+        for attr, value in checkpoint.state.items():
+            setattr(self, attr, copy.deepcopy(value))
+        return checkpoint.offset
     @staticmethod
     def handle_tag_function(ret_val):
         if ret_val is None:
             pass
         elif isinstance(ret_val, types.GeneratorType):
             for token in ret_val:
-                if not isinstance(token, Token):
+                if not isinstance(token, (Token, Span)):
                     raise TypeError(
                         f'tag function emitted value of type {type(token)}'
                     )
                 yield token
         else:
-            if not isinstance(ret_val, Token):
+            if not isinstance(ret_val, (Token, Span)):
                 raise TypeError(
                     f'tag function emitted value of type {type(ret_val)}'
                 )
             yield ret_val
 
+# the number of tokenizer and parser classes kept in memory
+cache_size = 64
+
 def make_tokenizer(
     code: str,
     base: type=BaseTokenizer,
     name: str='AnonymousTokenizer',
     allow_big_implicits: bool=False,
+    engine: str='regex',
+    mode: str='text',
+    cache_dir: str | None=None,
+    instrument: bool=False,
+) -> type:
+    # instrumented classes keep their stats on the class, so every call makes
+    # a new one instead of sharing the stats with the other callers
+    build = build_tokenizer if instrument else cached_tokenizer
+    return build(
+        code,
+        base,
+        name,
+        allow_big_implicits,
+        engine,
+        mode,
+        cache_dir,
+        instrument,
+    )
+
+def build_tokenizer(
+    code: str,
+    base: type,
+    name: str,
+    allow_big_implicits: bool,
+    engine: str,
+    mode: str,
+    cache_dir: str | None,
+    instrument: bool,
 ) -> type:
     if not issubclass(base, BaseTokenizer):
         raise ValueError('base must subclass tokenizers.BaseTokenizer')
+    if engine not in engines:
+        raise ValueError(f'engine must be one of {", ".join(engines)}')
+    if mode not in modes:
+        raise ValueError(f'mode must be one of {", ".join(modes)}')
+    if instrument and engine != 'regex':
+        raise ValueError('instrument can only be used with the regex engine')
+    if cache_dir is not None:
+        # imported here because the cache is built on the compiler, which
+        # imports this module
+        from zparse.cache import load_classes
+        return load_classes(
+            cache_dir,
+            code,
+            base=None,
+            name='Parser',
+            tok_base=base,
+            tok_name=name,
+            allow_big_implicits=allow_big_implicits,
+            engine=engine,
+            mode=mode,
+            memo='dense',
+            events=False,
+            profile=False,
+            instrument=instrument,
+            with_parser=False,
+        )[name]
     grammar = Parser(code).parse()
     check_for_illegal_token_names(grammar)
     check_for_illegal_tag_names(grammar, base)
-    return make_class(name, base, grammar, allow_big_implicits)
+    return make_class(
+        name,
+        base,
+        grammar,
+        allow_big_implicits,
+        engine,
+        mode,
+        instrument,
+    )
+
+cached_tokenizer = functools.lru_cache(maxsize=cache_size)(build_tokenizer)
+make_tokenizer.cache_info = cached_tokenizer.cache_info
+make_tokenizer.cache_clear = cached_tokenizer.cache_clear
+
+modes = ['text', 'bytes']
 
 def make_class(
     name: str,
     base: type,
     grammar: Grammar,
     allow_big_implicits: bool,
+    engine: str='regex',
+    mode: str='text',
+    instrument: bool=False,
 ) -> type:
-    tokens_func = make_tokens_func(grammar, allow_big_implicits)
+    binary = mode == 'bytes'
     TokenKind = make_TokenKind(grammar, allow_big_implicits)
-    return type(
-        name,
-        (base,),
-        {
-            'TokenKind': TokenKind,
-            'tokens': tokens_func,
-        },
+    if instrument:
+        token_table = make_token_table(
+            make_regex(grammar, allow_big_implicits, binary),
+            TokenKind,
+        )
+        scanner, stats = instrumented_scanner(token_table)
+        return build_class(name, base, TokenKind, scanner, binary, stats)
+    scanner = engines[engine](grammar, TokenKind, allow_big_implicits, binary)
+    return build_class(name, base, TokenKind, scanner, binary)
+
+def build_class(
+    name: str,
+    base: type,
+    TokenKind: type,
+    scanner: scanner_type,
+    binary: bool=False,
+    stats: typing.Any=None,
+) -> type:
+    namespace = {
+        'TokenKind': TokenKind,
+        'tokens': make_tokens_func(scanner, TokenKind),
+        'token_buffer': make_token_buffer_func(scanner, TokenKind, binary),
+        'tokens_from_stream': make_tokens_from_stream_func(
+            scanner,
+            TokenKind,
+        ),
+        'atokens': make_atokens_func(scanner, TokenKind, binary),
+    }
+    if binary:
+        namespace['tokens'] = make_spans_func(scanner, TokenKind)
+        namespace['text'] = span_text
+    if stats is not None:
+        namespace['stats'] = stats
+    return type(name, (base,), namespace)
+
+func_type = typing.Callable[..., typing.Generator[Token, None, None]]
+predicate_type = typing.Callable[[BaseTokenizer], typing.Any]
+
+scan_type = typing.Callable[
+    [str, int],
+    tuple[int, enum.Enum, typing.Callable],
+]
+partial_scan_type = typing.Callable[
+    [str, int],
+    tuple[int, enum.Enum, typing.Callable, bool],
+]
+scanner_type = typing.Callable[[BaseTokenizer], scan_type]
+
+def make_tokens_func(scanner: scanner_type, TokenKind: type) -> func_type:
+    EOF = TokenKind.EOF
+    def tokens(self, start=0, start_checkpoint=None):
+        if start_checkpoint is not None:
+            start = self.restore(start_checkpoint)
+        scan = scanner(self)
+        code = self.code
+        source = LineIndex(code)
+        length = len(code)
+        pos = start
+        mark, interval = checkpoint_marks(self, start, length)
+        while pos < length:
+            if pos >= mark:
+                self.checkpoints.append(self.checkpoint(source, pos))
+                mark = pos + interval
+            end, kind, tag = scan(code, pos)
+            if end == pos:
+                unknown_char(source, pos, code[pos:pos + 1])
+            if tag is None:
+                yield Token(code[pos:end], kind, pos, source)
+            elif tag is not ignore_tag:
+                tok = Token(code[pos:end], kind, pos, source)
+                yield from self.handle_tag_function(tag(tok))
+            pos = end
+        yield Token('', EOF, pos, source)
+    return tokens
+
+def make_spans_func(
+    scanner: scanner_type,
+    TokenKind: type,
+) -> typing.Callable[..., typing.Generator[Span, None, None]]:
+    EOF = TokenKind.EOF
+    def tokens(self, start=0, start_checkpoint=None):
+        if start_checkpoint is not None:
+            start = self.restore(start_checkpoint)
+        scan = scanner(self)
+        code = self.code
+        source = LineIndex(code)
+        length = len(code)
+        pos = start
+        mark, interval = checkpoint_marks(self, start, length)
+        while pos < length:
+            if pos >= mark:
+                self.checkpoints.append(self.checkpoint(source, pos))
+                mark = pos + interval
+            end, kind, tag = scan(code, pos)
+            if end == pos:
+                unknown_char(source, pos, code[pos:pos + 1])
+            if tag is None:
+                yield Span(kind, pos, end)
+            elif tag is not ignore_tag:
+                yield from self.handle_tag_function(tag(Span(kind, pos, end)))
+            pos = end
+        yield Span(EOF, pos, pos)
+    return tokens
+
+def checkpoint_marks(
+    tokenizer: BaseTokenizer,
+    start: int,
+    length: int,
+) -> tuple[int, int]:
+    # the offset of the next checkpoint and the distance between them. The
+    # first checkpoint is at start, and checkpoints after start are
+    # recorded again.
+    interval = tokenizer.checkpoint_interval
+    if not interval:
+        return length, 0
+    tokenizer.checkpoints = [
+        checkpoint for checkpoint in tokenizer.checkpoints
+        if checkpoint.offset < start
+    ]
+    return start, interval
+
+def span_text(self, span: Span) -> bytes:
+    return self.code[span.start:span.end]
+
+def make_token_buffer_func(
+    scanner: scanner_type,
+    TokenKind: type,
+    binary: bool=False,
+) -> typing.Callable[[], TokenBuffer]:
+    EOF = TokenKind.EOF
+    def token_buffer(self, start=0, stop=None):
+        scan = scanner(self)
+        code = self.code
+        source = LineIndex(code)
+        buffer = TokenBuffer(source, TokenKind)
+        append_kind = buffer.kinds.append
+        append_start = buffer.starts.append
+        append_end = buffer.ends.append
+        length = len(code)
+        if stop is None or stop > length:
+            stop = length
+        pos = start
+        while pos < stop:
+            end, kind, tag = scan(code, pos)
+            if end == pos:
+                unknown_char(source, pos, code[pos:pos + 1])
+            if tag is None:
+                append_kind(kind._value_)
+                append_start(pos)
+                append_end(end)
+            elif tag is not ignore_tag:
+                if binary:
+                    tok = Span(kind, pos, end)
+                else:
+                    tok = Token(code[pos:end], kind, pos, source)
+                for emitted in self.handle_tag_function(tag(tok)):
+                    buffer.append_token(emitted, pos, end)
+            pos = end
+        if pos == length:
+            buffer.append(EOF._value_, pos, pos)
+        return buffer
+    return token_buffer
+
+def make_tokens_from_stream_func(
+    scanner: scanner_type,
+    TokenKind: type,
+) -> typing.Callable[[typing.TextIO, int], typing.Generator[Token, None, None]]:
+    EOF = TokenKind.EOF
+    def tokens_from_stream(self, fp, chunk_size=65536):
+        # only a window of the stream is kept in memory. It is refilled
+        # whenever fewer than chunk_size characters are left, and extended
+        # whenever the scanner says a match could run past its end. Each
+        # extension at least doubles what is left of the window, so long
+        # tokens are read in a linear number of steps.
+        scan = scanner(self, partial=True)
+        window = fp.read(0)
+        source = WindowLineIndex(window, 0, 1, 0)
+        base = 0
+        pos = 0
+        eof = False
+        while True:
+            if not eof and len(window) - pos < chunk_size:
+                need_more = True
+            elif pos == len(window):
+                break
+            else:
+                end, kind, tag, need_more = scan(window, pos)
+                need_more = need_more and not eof
+            if need_more:
+                chunk = fp.read(max(chunk_size, len(window) - pos))
+                if chunk:
+                    window = window[pos:] + chunk
+                    base += pos
+                    pos = 0
+                    source = source.next_window(window, base)
+                else:
+                    eof = True
+                continue
+            if end == pos:
+                unknown_char(source, base + pos, window[pos:pos + 1])
+            tok = Token(window[pos:end], kind, base + pos, source)
+            if tag is None:
+                yield tok
+            elif tag is not ignore_tag:
+                yield from self.handle_tag_function(tag(tok))
+            pos = end
+        yield Token(window[:0], EOF, base + pos, source)
+    return tokens_from_stream
+
+def make_atokens_func(
+    scanner: scanner_type,
+    TokenKind: type,
+    binary: bool=False,
+) -> typing.Callable[..., typing.AsyncGenerator[Token, None]]:
+    EOF = TokenKind.EOF
+    async def atokens(self, reader, chunk_size=65536, encoding='utf-8'):
+        # the same window as tokens_from_stream, filled from an
+        # asyncio.StreamReader. Text tokenizers decode the bytes as they
+        # arrive. Reads only wait when the reader's buffer is empty, so the
+        # loop also gets control back after every chunk.
+        import asyncio
+        scan = scanner(self, partial=True)
+        decode = None
+        if not binary:
+            decode = codecs.getincrementaldecoder(encoding)().decode
+        window = b'' if binary else ''
+        source = WindowLineIndex(window, 0, 1, 0)
+        base = 0
+        pos = 0
+        eof = False
+        while True:
+            if not eof and len(window) - pos < chunk_size:
+                need_more = True
+            elif pos == len(window):
+                break
+            else:
+                end, kind, tag, need_more = scan(window, pos)
+                need_more = need_more and not eof
+            if need_more:
+                raw = await reader.read(max(chunk_size, len(window) - pos))
+                chunk = raw if decode is None else decode(raw, not raw)
+                window = window[pos:] + chunk
+                base += pos
+                pos = 0
+                source = source.next_window(window, base)
+                if raw:
+                    await asyncio.sleep(0)
+                else:
+                    eof = True
+                continue
+            if end == pos:
+                unknown_char(source, base + pos, window[pos:pos + 1])
+            tok = Token(window[pos:end], kind, base + pos, source)
+            if tag is None:
+                yield tok
+            elif tag is not ignore_tag:
+                for emitted in self.handle_tag_function(tag(tok)):
+                    yield emitted
+            pos = end
+        yield Token(window[:0], EOF, base + pos, source)
+    return atokens
+
+def unknown_char(
+    source: LineIndex,
+    pos: int,
+    char: str | bytes,
+) -> typing.NoReturn:
+    line, column = source.position(pos)
+    raise TokenError(
+        f'unknown char {char!r} on line {line} and column {column}',
+        pos,
     )
 
-func_type = typing.Callable[[], typing.Generator[Token, None, None]]
+def make_regex_scanner(
+    grammar: Grammar,
+    TokenKind: type,
+    allow_big_implicits: bool,
+    binary: bool=False,
+) -> scanner_type:
+    token_table = make_token_table(
+        make_regex(grammar, allow_big_implicits, binary),
+        TokenKind,
+    )
+    return regex_scanner(token_table)
 
-def make_tokens_func(grammar: Grammar, allow_big_implicits: bool) -> func_type:
-    token_info = make_regex(grammar, allow_big_implicits)
-    def tokens(self):
-        rest = self.code
-        line = 1
-        column = 0
-        while rest:
-            best_len = 0
+def regex_scanner(
+    token_table: list[tuple[enum.Enum, re.Pattern, str, predicate_type]],
+) -> scanner_type:
+    def scanner(tokenizer, partial=False):
+        table = bind_token_table(tokenizer, token_table)
+        def scan(code, pos):
+            best_end = pos
             best_kind = None
             best_tag = None
-            for name, regex, tag, predicate in token_info:
-                if predicate is not None and not eval(predicate):
+            for kind, match, tag, predicate in table:
+                if predicate is not None and not predicate(tokenizer):
                     continue
-                m = regex.search(rest)
-                if m is not None and m.span()[0] == 0:
-                    cur_len = m.span()[1]
-                    if cur_len > best_len:
-                        best_len = cur_len
-                        best_kind = eval(f'self.TokenKind.{name}')
+                m = match(code, pos)
+                if m is not None:
+                    end = m.end()
+                    if end > best_end:
+                        best_end = end
+                        best_kind = kind
                         best_tag = tag
-            if best_len == 0:
-                raise TokenError(
-                    f'unknown char {rest[0]!r} on line'
-                    f'{line} and column {column}'
-                )
-            text = rest[:best_len]
-            tok = Token(text, best_kind, line, column, self.code)
-            rest = rest[best_len:]
-            line += text.count('\n')
-            if '\n' in text:
-                column = len(text) - text.rfind('\n')
-            else:
-                column += len(text)
-            if best_tag is None:
-                yield tok
-            else:
-                yield from self.handle_tag_function(
-                    eval(f'self.{best_tag}(tok)')
-                )
-        yield Token('', eval('self.TokenKind.EOF'), line, column, self.code)
-    return tokens
+            return best_end, best_kind, best_tag
+        if not partial:
+            return scan
+        return partial_regex_scan(scan)
+    return scanner
+
+# a regex cannot say whether more input would extend its match, so in a
+# stream a match is only taken once this many characters follow it in the
+# window, and a failed match is retried with more input until the window
+# holds regex_token_limit characters, past which no token is expected to go
+regex_lookahead = 1024
+regex_token_limit = 1 << 20
+
+def partial_regex_scan(scan: scan_type) -> partial_scan_type:
+    def partial_scan(code, pos):
+        end, kind, tag = scan(code, pos)
+        if end == pos:
+            return end, kind, tag, len(code) - pos < regex_token_limit
+        return end, kind, tag, len(code) - end < regex_lookahead
+    return partial_scan
+
+def instrumented_scanner(
+    token_table: list[tuple[enum.Enum, re.Pattern, str, predicate_type]],
+) -> tuple[scanner_type, typing.Any]:
+    # the regex scanner, counting and timing every definition it tries in
+    # the stats of the tokenizer class
+    import time
+    from zparse.profiling import TokenStats
+    stats = TokenStats([kind.name for kind, _, _, _ in token_table])
+    clock = time.perf_counter
+    def scanner(tokenizer, partial=False):
+        table = [
+            (kind, match, timed_tag(tag, i), predicate)
+            for i, (kind, match, tag, predicate) in enumerate(
+                bind_token_table(tokenizer, token_table)
+            )
+        ]
+        tried = stats.tried
+        matched = stats.matched
+        won = stats.won
+        regex_time = stats.regex_time
+        predicates = stats.predicates
+        def scan(code, pos):
+            best_end = pos
+            best = None
+            for i, (kind, match, tag, predicate) in enumerate(table):
+                if predicate is not None:
+                    predicates[i] += 1
+                    if not predicate(tokenizer):
+                        continue
+                tried[i] += 1
+                start = clock()
+                m = match(code, pos)
+                regex_time[i] += clock() - start
+                if m is not None:
+                    matched[i] += 1
+                    end = m.end()
+                    if end > best_end:
+                        best_end = end
+                        best = i
+            if best is None:
+                return pos, None, None
+            won[best] += 1
+            kind, _, tag, _ = table[best]
+            return best_end, kind, tag
+        if not partial:
+            return scan
+        return partial_regex_scan(scan)
+    def timed_tag(tag, i):
+        if tag is None or tag is ignore_tag:
+            return tag
+        tag_time = stats.tag_time
+        def call(token):
+            start = clock()
+            try:
+                value = tag(token)
+            finally:
+                tag_time[i] += clock() - start
+            if isinstance(value, types.GeneratorType):
+                return timed_generator(value, i)
+            return value
+        return call
+    def timed_generator(values, i):
+        # handle_tag_function runs generator tags as it reads their tokens
+        tag_time = stats.tag_time
+        while True:
+            start = clock()
+            try:
+                value = next(values)
+            except StopIteration:
+                return
+            finally:
+                tag_time[i] += clock() - start
+            yield value
+    return scanner, stats
+
+def make_dfa_scanner(
+    grammar: Grammar,
+    TokenKind: type,
+    allow_big_implicits: bool,
+    binary: bool=False,
+) -> scanner_type:
+    token_info = make_regex(grammar, allow_big_implicits, binary)
+    token_table = make_token_table(token_info, TokenKind)
+    dfa = make_dfa(
+        make_token_exprs(grammar, token_info, allow_big_implicits),
+        {frag.name.name: frag.value for frag in grammar.fragment_definitions},
+        binary,
+    )
+    return dfa_scanner(token_table, dfa)
+
+def dfa_scanner(
+    token_table: list[tuple[enum.Enum, re.Pattern, str, predicate_type]],
+    dfa: DFA,
+) -> scanner_type:
+    has_predicates = any(
+        predicate is not None for _, _, _, predicate in token_table
+    )
+    def scanner(tokenizer, partial=False):
+        table = bind_token_table(tokenizer, token_table)
+        longest_match = dfa.longest_match
+        matches = dfa.matches
+        def pick(found):
+            for end, accept in reversed(found):
+                for i in accept:
+                    kind, _, tag, predicate = table[i]
+                    if predicate is None or predicate(tokenizer):
+                        return end, kind, tag
+            return None, None, None
+        if not has_predicates and not partial:
+            def scan(code, pos):
+                end, accept, _ = longest_match(code, pos, len(code))
+                if accept is None:
+                    return pos, None, None
+                kind, _, tag, _ = table[accept[0]]
+                return end, kind, tag
+        elif not has_predicates:
+            def scan(code, pos):
+                end, accept, state = longest_match(code, pos, len(code))
+                if accept is None:
+                    return pos, None, None, state != 0
+                kind, _, tag, _ = table[accept[0]]
+                return end, kind, tag, state != 0
+        elif not partial:
+            def scan(code, pos):
+                end, kind, tag = pick(matches(code, pos, len(code))[0])
+                return pos if end is None else end, kind, tag
+        else:
+            def scan(code, pos):
+                found, state = matches(code, pos, len(code))
+                end, kind, tag = pick(found)
+                return pos if end is None else end, kind, tag, state != 0
+        return scan
+    return scanner
+
+engines = {
+    'regex': make_regex_scanner,
+    'dfa': make_dfa_scanner,
+}
+
+def make_token_table(
+    token_info: list[tuple[str, re.Pattern, str, str]],
+    TokenKind: type,
+) -> list[tuple[enum.Enum, re.Pattern, str, predicate_type]]:
+    return [
+        (
+            TokenKind[name],
+            regex,
+            tag,
+            None if predicate is None else compile_predicate(predicate),
+        )
+        for name, regex, tag, predicate in token_info
+    ]
+
+def bind_token_table(
+    tokenizer: BaseTokenizer,
+    token_table: list[tuple[enum.Enum, re.Pattern, str, predicate_type]],
+) -> list[tuple[enum.Enum, typing.Callable, typing.Callable, predicate_type]]:
+    return [
+        (
+            kind,
+            regex.match,
+            None if tag is None else bind_tag(tokenizer, tag),
+            predicate,
+        )
+        for kind, regex, tag, predicate in token_table
+    ]
+
+def ignore_tag(token: Token) -> None:
+    pass
+
+def bind_tag(tokenizer: BaseTokenizer, tag: str) -> typing.Callable:
+    # the default @ignore tag is swapped for a sentinel so the token loops
+    # can drop ignored tokens without building them
+    if getattr(type(tokenizer), tag, None) is BaseTokenizer.ignore:
+        return ignore_tag
+    return getattr(tokenizer, tag)
+
+def compile_predicate(source: str) -> predicate_type:
+    try:
+        code = compile(f'lambda self: ({source})', '<predicate>', 'eval')
+    except SyntaxError:
+        raise GrammarError(f'invalid predicate {source!r}')
+    return eval(code, {})
 
 def make_regex(
     grammar: Grammar,
     allow_big_implicits: bool,
+    binary: bool=False,
 ) -> list[tuple[str, re.Pattern, str, str]]:
+    # binary regexes only contain ASCII (everything else is written as
+    # escaped UTF-8 bytes), so they can be encoded into bytes patterns
+    compile_regex = (
+        (lambda regex: re.compile(regex.encode('ascii')))
+        if binary else re.compile
+    )
     frag_order = get_frag_order(grammar)
     frag_defs = {frag.name.name: frag.value for frag in grammar.fragment_definitions}
     fragments = {}
     for frag_name in frag_order:
-        fragments[frag_name] = frag_defs[frag_name].to_regex(fragments)
+        fragments[frag_name] = frag_defs[frag_name].to_regex(fragments, binary)
     tokens = []
-    escape = {'.', '^', '$', '*', '+', '?', '{', '}', '(', ')', '\\', '[', ']', '|'}
     for name, value in get_implicit_tokens(grammar, allow_big_implicits).items():
         tokens.append((
             name,
-            re.compile(''.join('\\' + c if c in escape else c for c in value)),
+            compile_regex(literal_regex(value, binary)),
             None,
             None,
         ))
     for tok_def in grammar.token_definitions:
         tokens.append((
             tok_def.name.name,
-            re.compile(tok_def.value.to_regex(fragments)),
+            compile_regex(tok_def.value.to_regex(fragments, binary)),
             (
                 None if tok_def.tag is None
                 else tok_def.tag.name.name
@@ -158,28 +944,72 @@ def make_regex(
         ))
     return tokens
 
+def make_token_exprs(
+    grammar: Grammar,
+    token_info: list[tuple[str, re.Pattern, str, str]],
+    allow_big_implicits: bool,
+) -> list[GrammarExpr | str]:
+    implicits = get_implicit_tokens(grammar, allow_big_implicits)
+    tok_defs = {tok_def.name.name: tok_def for tok_def in grammar.token_definitions}
+    return [
+        implicits[name] if name in implicits else tok_defs[name].value
+        for name, _, _, _ in token_info
+    ]
+
 def get_frag_order(grammar: Grammar) -> list[str]:
-    frag_graph = nx.DiGraph()
+    # each fragment points to the fragments that reference it. Fragments
+    # that are referenced but not defined are part of the order too.
+    users = {}
     for frag_def in grammar.fragment_definitions:
         name = frag_def.name.name
-        frag_graph.add_node(name)
-        refs = frag_def.value.identifiers()
-        for ref in refs:
-            frag_graph.add_edge(ref, name)
-    try:
-        return list(nx.algorithms.topological_sort(frag_graph))
-    except nx.NetworkXUnfeasible:
-        cycle = nx.algorithms.find_cycle(frag_graph)
-        frags = [edge[0] for edge in cycle]
-        msg = ''
-        if len(frags) == 1:
-            msg = f'{frags[0]!r} cannot be defined recursively'
-        elif len(frags) == 2:
-            msg = f'{frags[0]!r} and {frags[1]!r} cannot be defined recursively'
-        else:
-            before = ', '.join(repr(frag) for frag in frags[:-1])
-            msg = before + f', and {frags[-1]!r} cannot be defined recursively'
-        raise GrammarError(msg)
+        users.setdefault(name, [])
+        for ref in frag_def.value.identifiers():
+            users.setdefault(ref, []).append(name)
+    order, cycle = topological_sort(users)
+    if cycle is None:
+        return order
+    frags = cycle
+    msg = ''
+    if len(frags) == 1:
+        msg = f'{frags[0]!r} cannot be defined recursively'
+    elif len(frags) == 2:
+        msg = f'{frags[0]!r} and {frags[1]!r} cannot be defined recursively'
+    else:
+        before = ', '.join(repr(frag) for frag in frags[:-1])
+        msg = before + f', and {frags[-1]!r} cannot be defined recursively'
+    raise GrammarError(msg)
+
+def topological_sort(
+    graph: dict[str, list[str]],
+) -> tuple[list[str], list[str] | None]:
+    # a depth first search that returns the nodes in topological order, or
+    # the first cycle it finds listed along its edges. Nodes and edges are
+    # visited in insertion order, so the same grammar always reports the
+    # same cycle.
+    done = set()
+    postorder = []
+    for root in graph:
+        if root in done:
+            continue
+        path = [root]
+        on_path = {root: 0}
+        work = [iter(graph[root])]
+        while work:
+            for succ in work[-1]:
+                if succ in on_path:
+                    return [], path[on_path[succ]:]
+                if succ not in done:
+                    on_path[succ] = len(path)
+                    path.append(succ)
+                    work.append(iter(graph[succ]))
+                    break
+            else:
+                work.pop()
+                node = path.pop()
+                del on_path[node]
+                done.add(node)
+                postorder.append(node)
+    return postorder[::-1], None
 
 def check_for_illegal_token_names(grammar: Grammar) -> None:
     for tok_dec in grammar.token_declarations:
@@ -228,7 +1058,7 @@ def get_implicit_tokens(
                         rule_def.name.token,
                     )
                 values.add(lit)
-    return {get_name(v): v for v in values}
+    return {get_name(v): v for v in sorted(values)}
 
 def get_name(v: str) -> str:
     return '_' + '_'.join(hex(ord(c))[2:] for c in v)